@@ -0,0 +1,77 @@
+"""
+Compares single-frame and batched vision-model requests against the local
+fake Ollama server: frames/sec, model requests, and agreement with the
+ground truth encoded in each frame's brightness.
+
+Usage (from panoptes/):
+    python bench/bench_batching.py [--frames 64] [--concurrency 4] [--batch-sizes 1 2 4 8]
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from fake_ollama import FakeOllama
+from frame_batcher import FrameBatcher
+from frame_pipeline import FramePipeline
+from ollama_base import OllamaBase
+
+
+def make_frames(count, seed=0):
+    """Returns [(jpeg_bytes, is_bright)] with random brightness per frame."""
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        level = int(rng.integers(0, 256))
+        image = np.full((360, 640, 3), level, np.uint8)
+        image += rng.integers(0, 8, image.shape, dtype=np.uint8)
+        frames.append((cv2.imencode(".jpg", image)[1].tobytes(), float(image.mean()) > 127))
+    return frames
+
+
+async def run(base, frames, concurrency, batch_size):
+    if batch_size > 1:
+        batcher = FrameBatcher(lambda images: base.analyze_images_batch(images, "light"), batch_size)
+        analyze = lambda seq, image: batcher.submit(image)
+    else:
+        analyze = lambda seq, image: base.analyze_image(image, "light")
+
+    pipeline = FramePipeline(
+        ((i, image) for i, (image, _) in enumerate(frames)),
+        analyze,
+        concurrency=concurrency * batch_size
+    )
+    return [result async for result in pipeline.run()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent model requests")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake per-request latency (s)")
+    parser.add_argument("--per-image-latency", type=float, default=0.02, help="Fake per-image latency (s)")
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames)
+    print(f"{'batch size':>10} {'requests':>9} {'seconds':>8} {'frames/s':>9} {'accuracy':>9}")
+    for batch_size in args.batch_sizes:
+        with FakeOllama(args.latency, args.per_image_latency) as server:
+            base = OllamaBase(server.url, "BENCH_API_KEY")
+            start = time.perf_counter()
+            results = asyncio.run(run(base, frames, args.concurrency, batch_size))
+            elapsed = time.perf_counter() - start
+
+        correct = sum(is_match == bright for (is_match, _, _), (_, bright) in zip(results, frames))
+        print(f"{batch_size:>10} {server.requests:>9} {elapsed:>8.2f} "
+              f"{len(frames) / elapsed:>9.1f} {correct / len(frames):>9.1%}")
+
+
+if __name__ == "__main__":
+    main()
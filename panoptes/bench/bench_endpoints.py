@@ -0,0 +1,307 @@
+"""
+End-to-end load test of the HTTP API against the local fake Ollama server.
+Runs the fake server and the app (uvicorn, in a temporary working directory)
+as separate processes, drives /api/v1/upload, /api/v1/image-analysis and
+/api/v1/analyze with synthetic media at a fixed concurrency, and reports
+throughput, p50/p95/p99 latency, and the app server's CPU and peak memory.
+
+With --baseline, results are compared against a saved run and any scenario
+whose throughput drops, or whose p95 grows, by more than --tolerance is
+reported as a regression (exit status 1). --save-baseline writes the run.
+CPU and memory are read from /proc, so they are only reported on Linux.
+
+Usage (from panoptes/):
+    python bench/bench_endpoints.py [--requests 40] [--concurrency 8] [--scenarios upload analyze]
+        [--latency 0.2] [--jitter 0.05] [--error-rate 0.01]
+        [--baseline bench/baseline.json] [--save-baseline] [--tolerance 0.25]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import httpx
+
+from synthetic import make_image, make_video
+
+BENCH_DIR = Path(__file__).resolve().parent
+SRC_DIR = BENCH_DIR.parent / "src"
+SCENARIOS = ("upload", "image-analysis", "analyze")
+# Settings that must match for a baseline comparison to mean anything
+CONFIG_KEYS = ("requests", "concurrency", "latency", "jitter", "error_rate", "seed", "video_seconds")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class ProcessMonitor:
+    """
+    Samples a process's CPU time and resident memory from /proc in a
+    background thread; reset() starts a new measurement window.
+    """
+
+    def __init__(self, pid, interval=0.05):
+        self.pid = pid
+        self.interval = interval
+        self.available = Path(f"/proc/{pid}/stat").exists()
+        self._ticks = os.sysconf("SC_CLK_TCK") if self.available else 1
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self.peak_rss = 0
+        self._cpu_start = self._wall_start = 0.0
+
+    def cpu_seconds(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            # Fields after the command name, which may contain spaces
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self._ticks
+
+    def rss_bytes(self):
+        with open(f"/proc/{self.pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.peak_rss = max(self.peak_rss, self.rss_bytes())
+            except (OSError, ValueError):
+                return
+
+    def start(self):
+        if self.available:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def reset(self):
+        if not self.available:
+            return
+        self.peak_rss = self.rss_bytes()
+        self._cpu_start = self.cpu_seconds()
+        self._wall_start = time.perf_counter()
+
+    def window(self):
+        """Returns (CPU % of one core, peak RSS in MB) since reset(), or Nones."""
+        if not self.available:
+            return None, None
+        wall = time.perf_counter() - self._wall_start
+        cpu = (self.cpu_seconds() - self._cpu_start) / wall * 100 if wall else 0.0
+        return round(cpu, 1), round(self.peak_rss / 2 ** 20, 1)
+
+
+def start_fake_ollama(args, load_time=0.0):
+    command = [
+        sys.executable, str(BENCH_DIR / "fake_ollama.py"),
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate), "--seed", str(args.seed), "--load-time", str(load_time)
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    url = process.stdout.readline().strip()
+    if not url:
+        process.kill()
+        raise RuntimeError("Fake Ollama server did not start")
+    return process, url
+
+
+def start_app(ollama_url, workdir, port, **extra_env):
+    env = {**os.environ, "OLLAMA_HOST": ollama_url, "OLLAMA_API_KEY": "bench", **extra_env}
+    command = [
+        sys.executable, "-m", "uvicorn", "main:app", "--app-dir", str(SRC_DIR),
+        "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"
+    ]
+    # The app logs each request with print(); keep it out of the report
+    return subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+
+
+def wait_ready(base_url, process, timeout=30.0, path="/api/v1/health/ready", interval=0.1):
+    """Polls 'path' until it answers 200 and returns the seconds that took."""
+    start = time.monotonic()
+    # One client for every poll; building one per poll slows a starting server on a small machine
+    with httpx.Client(base_url=base_url, timeout=1.0) as client:
+        while time.monotonic() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"App server exited with status {process.returncode}")
+            try:
+                if client.get(path).status_code == 200:
+                    return time.monotonic() - start
+            except httpx.TransportError:
+                pass
+            time.sleep(interval)
+    raise RuntimeError(f"App server did not answer {path}")
+
+
+def build_request(scenario, i, video):
+    """Returns (path, form data, files) for request 'i'; every request is unique."""
+    if scenario == "upload":
+        return "/api/v1/upload", {}, {"file": (f"bench_{i}.jpg", make_image(seed=i), "image/jpeg")}
+    if scenario == "image-analysis":
+        return (
+            "/api/v1/image-analysis",
+            {"prompt": f"Describe this image ({i})."},
+            {"file": (f"bench_{i}.jpg", make_image(seed=10_000 + i), "image/jpeg")}
+        )
+    # Same video each time; a new object gives a new job and cache keys
+    return (
+        "/api/v1/analyze",
+        {"object_str": f"object {i}", "sample_interval": "1", "save_frames": "false"},
+        {"video": ("bench.avi", video, "video/x-msvideo")}
+    )
+
+
+async def send(client, scenario, i, video):
+    """Returns (seconds, ok) for one request, reading the whole response."""
+    path, data, files = build_request(scenario, i, video)
+    start = time.perf_counter()
+    try:
+        async with client.stream("POST", path, data=data, files=files) as response:
+            body = await response.aread()
+        ok = response.status_code == 200
+        if ok and scenario == "analyze":
+            # Frame failures are reported inside a 200 stream
+            ok = all(json.loads(line).get("status") == "success" for line in body.splitlines() if line.strip())
+    except httpx.HTTPError:
+        ok = False
+    return time.perf_counter() - start, ok
+
+
+async def run_scenario(base_url, scenario, requests, concurrency, video):
+    latencies, errors = [], 0
+    pending = iter(range(requests))
+
+    async def worker(client):
+        nonlocal errors
+        for i in pending:
+            seconds, ok = await send(client, scenario, i, video)
+            latencies.append(seconds)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300.0) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput": round(requests / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 1)
+    }
+
+
+def print_results(results):
+    print(f"{'scenario':>15} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'p99 ms':>8} {'cpu %':>6} {'rss MB':>7}")
+    for scenario, r in results.items():
+        cpu = "-" if r["cpu_percent"] is None else f"{r['cpu_percent']:.1f}"
+        rss = "-" if r["peak_rss_mb"] is None else f"{r['peak_rss_mb']:.1f}"
+        print(f"{scenario:>15} {r['requests']:>9} {r['errors']:>7} {r['throughput']:>8.2f} {r['p50_ms']:>8.1f} "
+              f"{r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {cpu:>6} {rss:>7}")
+
+
+def compare(results, config, baseline, tolerance):
+    """Prints a line per regression against 'baseline' and returns how many there were."""
+    if baseline.get("config") != config:
+        print(f"warning: baseline was recorded with {baseline.get('config')}, this run used {config}")
+    regressions = 0
+    for scenario, current in results.items():
+        previous = baseline.get("results", {}).get(scenario)
+        if previous is None:
+            continue
+        if current["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions += 1
+            print(f"REGRESSION {scenario}: throughput {current['throughput']:.2f} req/s "
+                  f"vs baseline {previous['throughput']:.2f}")
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions += 1
+            print(f"REGRESSION {scenario}: p95 {current['p95_ms']:.1f} ms vs baseline {previous['p95_ms']:.1f}")
+        if current["errors"] > previous["errors"]:
+            print(f"warning: {scenario} had {current['errors']} errors vs {previous['errors']} in the baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=40, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake model latency per request")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of model calls that fail")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--video-seconds", type=int, default=4, help="Length of the /analyze video")
+    parser.add_argument("--baseline", type=Path, help="Baseline JSON to compare against or save to")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in CONFIG_KEYS}
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    results = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        video = Path(make_video(Path(workdir) / "bench.avi", seconds=args.video_seconds, fps=10)).read_bytes()
+        fake, ollama_url = start_fake_ollama(args)
+        app = start_app(ollama_url, workdir, port)
+        try:
+            wait_ready(base_url, app)
+            monitor = ProcessMonitor(app.pid).start()
+            for scenario in args.scenarios:
+                monitor.reset()
+                result = asyncio.run(run_scenario(base_url, scenario, args.requests, args.concurrency, video))
+                result["cpu_percent"], result["peak_rss_mb"] = monitor.window()
+                results[scenario] = result
+            monitor.stop()
+        finally:
+            for process in (app, fake):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    print_results(results)
+
+    if args.baseline and args.save_baseline:
+        args.baseline.write_text(json.dumps({"config": config, "results": results}, indent=2) + "\n")
+        print(f"Saved baseline to {args.baseline}")
+    elif args.baseline:
+        regressions = compare(results, config, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
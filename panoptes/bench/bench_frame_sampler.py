@@ -0,0 +1,76 @@
+"""
+Compares decoding every frame (the original analyze_video loop) with
+FrameSampler's grab and seek modes on a synthetic video.
+
+Usage (from panoptes/):
+    python bench/bench_frame_sampler.py [--seconds 20] [--fps 30] [--interval 1.0]
+"""
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from frame_sampler import FrameSampler, correct_orientation
+from synthetic import make_video
+
+
+def legacy_sample(video_path):
+    """Reads and orients every frame, keeping one per second."""
+    cap = cv2.VideoCapture(str(video_path))
+    fps = max(1, int(cap.get(cv2.CAP_PROP_FPS)))
+    frame_count = 0
+    sampled = 0
+    try:
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            frame = correct_orientation(frame)
+            if frame_count % fps == 0:
+                sampled += 1
+            frame_count += 1
+    finally:
+        cap.release()
+    return sampled
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        video_path = make_video(
+            Path(workdir) / "synthetic.avi", args.seconds, args.fps, (args.width, args.height)
+        )
+
+        runs = [("decode every frame", lambda: legacy_sample(video_path))]
+        for mode in ("grab", "seek"):
+            sampler = FrameSampler(video_path, every_seconds=args.interval, mode=mode)
+            runs.append((f"sampler ({mode})", lambda sampler=sampler: sum(1 for _ in sampler)))
+
+        baseline = None
+        print(f"{'method':>20} {'frames':>7} {'seconds':>9} {'speedup':>8}")
+        for name, fn in runs:
+            sampled, elapsed = timed(fn)
+            baseline = baseline or elapsed
+            print(f"{name:>20} {sampled:>7} {elapsed:>9.3f} {baseline / elapsed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Per-frame cost of the original preprocessing (rotate, new CLAHE object and
+LAB split/merge at full size) against FramePreprocessor, single-threaded and
+over a thread pool.
+
+Usage (from panoptes/):
+    python bench/bench_preprocess.py [--frames 64] [--size 1920x1080] [--workers 4]
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from frame_preprocess import FramePreprocessor
+from frame_sampler import correct_orientation
+from constants import FRAME_JPEG_QUALITY
+
+
+def legacy_encode(frame):
+    """The analyze_video preprocessing before FramePreprocessor."""
+    frame = correct_orientation(frame)
+    lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    cl = clahe.apply(l)
+    limg = cv2.merge((cl, a, b))
+    enhanced = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+    return cv2.imencode(".jpg", enhanced, [cv2.IMWRITE_JPEG_QUALITY, FRAME_JPEG_QUALITY])[1].tobytes()
+
+
+def time_per_frame(encode, frames, executor=None):
+    encode(frames[0])  # Warm up buffers and CLAHE objects
+    start = time.perf_counter()
+    if executor is not None:
+        list(executor.map(encode, frames))
+    else:
+        for frame in frames:
+            encode(frame)
+    return (time.perf_counter() - start) / len(frames) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--size", default="1920x1080", help="WIDTHxHEIGHT")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.split("x"))
+    rng = np.random.default_rng(0)
+    base = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (0, 0), 3)
+    frames = [cv2.add(base, int(i)) for i in range(args.frames)]
+
+    variants = [
+        ("legacy (full size)", legacy_encode),
+        ("chain, full size", FramePreprocessor(max_side=None).encode),
+        ("chain, downscaled", FramePreprocessor().encode),
+        ("chain, downscaled + denoise", FramePreprocessor(denoise=True).encode),
+    ]
+    print(f"{args.frames} frames of {width}x{height}, ms per frame")
+    print(f"{'variant':<30} {'1 thread':>9} {f'{args.workers} threads':>11}")
+    with ThreadPoolExecutor(args.workers) as executor:
+        for name, encode in variants:
+            single = time_per_frame(encode, frames)
+            pooled = time_per_frame(encode, frames, executor)
+            print(f"{name:<30} {single:>9.2f} {pooled:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
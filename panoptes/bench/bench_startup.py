@@ -0,0 +1,110 @@
+"""
+Startup benchmark: how long the app takes to import and to come up, and
+what its first request costs, with and without the model warm-up.
+
+For each mode, a fresh fake Ollama server is started whose models take
+--load-time seconds to load on first use, as a cold Ollama does. The app
+is then started (uvicorn, in a temporary working directory) and the
+benchmark records:
+- import: seconds to import main in a separate interpreter,
+- live: seconds from launch until /api/v1/health/live answers,
+- ready: seconds from launch until /api/v1/health/ready answers 200,
+- first and second: latency of the first two /api/v1/image-analysis
+  requests once the server is ready.
+With warm-up off, the first request pays for the model load. With it on,
+'ready' does instead, before any traffic is sent.
+
+Usage (from panoptes/):
+    python bench/bench_startup.py [--load-time 2.0] [--latency 0.2] [--modes no-warmup warmup]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench_endpoints import SRC_DIR, free_port, start_app, start_fake_ollama, wait_ready
+from synthetic import make_image
+
+# Extra environment for the app in each mode
+MODES = {
+    "no-warmup": {"WARMUP_MODELS": ""},
+    "warmup": {},
+}
+
+
+def import_seconds(workdir, ollama_url):
+    """Seconds to import main in a fresh interpreter, and whether cv2 got loaded."""
+    code = (
+        f"import sys, time; sys.path.insert(0, {str(SRC_DIR)!r}); start = time.perf_counter(); import main; "
+        "print(time.perf_counter() - start, 'cv2' in sys.modules)"
+    )
+    env = {**os.environ, "OLLAMA_HOST": ollama_url, "OLLAMA_API_KEY": "bench"}
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=workdir, env=env, capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[-2]), output[-1] == "True"
+
+
+def timed_request(base_url, i):
+    files = {"file": (f"startup_{i}.jpg", make_image(seed=20_000 + i), "image/jpeg")}
+    start = time.perf_counter()
+    response = httpx.post(f"{base_url}/api/v1/image-analysis", data={"prompt": "Describe this image."},
+                          files=files, timeout=300.0)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def run_mode(args, extra_env):
+    with tempfile.TemporaryDirectory() as workdir:
+        fake, ollama_url = start_fake_ollama(args, load_time=args.load_time)
+        app = None
+        try:
+            imported, cv2_loaded = import_seconds(workdir, ollama_url)
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}"
+            app = start_app(ollama_url, workdir, port, **extra_env)
+            live = wait_ready(base_url, app, path="/api/v1/health/live", interval=0.02)
+            ready = live + wait_ready(base_url, app, timeout=args.load_time * 4 + 30, interval=0.02)
+            first = timed_request(base_url, 0)
+            second = timed_request(base_url, 1)
+        finally:
+            for process in (app, fake):
+                if process is None:
+                    continue
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+    return {
+        "import_s": round(imported, 3),
+        "cv2_at_import": cv2_loaded,
+        "live_s": round(live, 3),
+        "ready_s": round(ready, 3),
+        "first_ms": round(first * 1000, 1),
+        "second_ms": round(second * 1000, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--load-time", type=float, default=2.0, help="Seconds the fake Ollama takes to load a model")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake model latency per request")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    args = parser.parse_args()
+    # start_fake_ollama() reads these too
+    args.jitter, args.error_rate, args.seed = 0.0, 0.0, 0
+
+    print(f"{'mode':>10} {'import s':>9} {'cv2':>5} {'live s':>7} {'ready s':>8} {'first ms':>9} {'second ms':>10}")
+    for mode in args.modes:
+        r = run_mode(args, MODES[mode])
+        print(f"{mode:>10} {r['import_s']:>9.3f} {str(r['cv2_at_import']):>5} {r['live_s']:>7.3f} "
+              f"{r['ready_s']:>8.3f} {r['first_ms']:>9.1f} {r['second_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compares the per-upload index cost of the legacy upload_log.json scan with
+UploadStore as the number of logged uploads grows.
+
+Usage (from panoptes/):
+    python bench/bench_upload_store.py [--sizes 100 1000 10000 50000] [--uploads 50]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from upload_store import UploadStore
+
+
+def make_entry(i):
+    return {
+        "original_filename": f"file_{i}.jpg",
+        "file_type": "image/jpeg",
+        "hash": uuid.uuid4().hex,
+        "stored_filename": f"{uuid.uuid4().hex}.jpg",
+    }
+
+
+def legacy_upload(log_file, entry):
+    """The pre-index upload_endpoint path: load, scan, append, rewrite."""
+    with open(log_file, "r") as f:
+        log_data = json.load(f)
+    for existing in log_data:
+        if existing["hash"] == entry["hash"]:
+            return existing
+    log_data.append(entry)
+    with open(log_file, "w") as f:
+        json.dump(log_data, f, indent=4)
+    return entry
+
+
+def store_upload(store, entry):
+    existing = store.get(entry["hash"])
+    if existing is not None:
+        return existing
+    return store.add(entry)[0]
+
+
+def bench(size, uploads, workdir):
+    seed = [make_entry(i) for i in range(size)]
+
+    log_file = os.path.join(workdir, f"upload_log_{size}.json")
+    with open(log_file, "w") as f:
+        json.dump(seed, f, indent=4)
+
+    store = UploadStore(os.path.join(workdir, f"upload_index_{size}.db"))
+    for entry in seed:
+        store.add(entry)
+
+    start = time.perf_counter()
+    for i in range(uploads):
+        legacy_upload(log_file, make_entry(size + i))
+    legacy_ms = (time.perf_counter() - start) * 1000 / uploads
+
+    start = time.perf_counter()
+    for i in range(uploads):
+        store_upload(store, make_entry(size + i))
+    store_ms = (time.perf_counter() - start) * 1000 / uploads
+
+    store.close()
+    return legacy_ms, store_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 50000])
+    parser.add_argument("--uploads", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'log size':>10} {'json log ms/upload':>20} {'index ms/upload':>18}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            legacy_ms, store_ms = bench(size, args.uploads, workdir)
+            print(f"{size:>10} {legacy_ms:>20.3f} {store_ms:>18.3f}")
+
+
+if __name__ == "__main__":
+    main()
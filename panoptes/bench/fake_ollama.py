@@ -0,0 +1,316 @@
+"""
+Local stand-in for the Ollama HTTP API, for benchmarks and tests.
+
+It answers /api/chat like a vision model would. For each attached image it
+replies "YES" when the image's mean brightness is above 127, so callers know
+the ground truth. Replies for several images use "Image N:" blocks.
+Requests with "stream": true get the reply word by word as NDJSON chunks.
+With --load-time, the first request for each model waits for it to load,
+as a cold Ollama does; an empty /api/generate request only loads the model.
+
+Run it on its own for load tests against a real server process:
+    python bench/fake_ollama.py --port 11500 --latency 0.2 --jitter 0.05 --error-rate 0.01
+"""
+import argparse
+import base64
+import json
+import random
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+
+def image_is_bright(encoded: str) -> bool:
+    data = np.frombuffer(base64.b64decode(encoded), np.uint8)
+    image = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+    return image is not None and float(image.mean()) > 127
+
+
+def answer_fields(bright: bool) -> dict:
+    if bright:
+        return {"answer": "YES", "description": "A bright object fills the frame.", "confidence": 9}
+    return {"answer": "NO", "description": "A dark, empty frame.", "confidence": 9}
+
+
+def answer_block(bright: bool) -> str:
+    fields = answer_fields(bright)
+    return f"Answer: {fields['answer']}\nDescription: {fields['description']}\nConfidence: {fields['confidence']}"
+
+
+class FakeOllama:
+    """
+    Threaded HTTP server emulating Ollama.
+    - Each /api/chat request sleeps 'latency' seconds plus 'per_image_latency'
+      for every attached image, modelling fixed per-request overhead
+      (prompt prefill, scheduling) and per-image encoder cost, plus a
+      uniformly random 0..'jitter' seconds.
+    - A fraction 'error_rate' of /api/chat requests fails with 'error_status'
+      straight away. Jitter and errors come from a generator seeded with
+      'seed', so runs are reproducible.
+    - Streamed replies send one word every 'token_latency' seconds after
+      that; 'aborted' counts streams whose client hung up part-way.
+    - Requests with a "format" get JSON replies, as structured output does.
+    - The first request for each model also waits 'load_time' seconds for
+      the model to load, once, however many requests arrive meanwhile.
+      /api/generate without a prompt loads the model and returns; 'loads'
+      counts model loads and 'keep_alive' holds the last value sent.
+    - 'requests', 'errors' and 'peak_inflight' record the load it saw.
+    Use as a context manager; 'url' is the base URL to pass as ollama_host.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        per_image_latency: float = 0.02,
+        token_latency: float = 0.01,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        load_time: float = 0.0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.latency = latency
+        self.per_image_latency = per_image_latency
+        self.token_latency = token_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.load_time = load_time
+        self.loads = 0
+        self.keep_alive = None
+        self._loaded = set()
+        self._load_locks = {}
+        self._random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.aborted = 0
+        self.inflight = 0
+        self.peak_inflight = 0
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, as a pooled client expects
+
+            def log_message(self, *args):
+                pass
+
+            def setup(self):
+                super().setup()
+                with fake._lock:
+                    fake._connections.add(self.connection)
+
+            def finish(self):
+                with fake._lock:
+                    fake._connections.discard(self.connection)
+                super().finish()
+
+            def _send_json(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path == "/api/tags":
+                    self._send_json(200, {"models": [{"name": "llava:latest"}, {"name": "llama3.2"}]})
+                else:
+                    self._send_json(404, {"error": "not found"})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if self.path == "/api/generate" and not payload.get("prompt"):
+                    fake.load(payload)
+                    self._send_json(200, {"model": payload.get("model"), "response": "", "done": True,
+                                          "done_reason": "load"})
+                    return
+                if self.path != "/api/chat":
+                    self._send_json(404, {"error": "not found"})
+                    return
+                if fake.should_fail():
+                    self._send_json(fake.error_status, {"error": "simulated failure"})
+                    return
+                if payload.get("stream"):
+                    self._send_stream(fake.chat_stream(payload))
+                else:
+                    self._send_json(200, fake.chat(payload))
+
+            def _send_stream(self, chunks):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for chunk in chunks:
+                        data = json.dumps(chunk).encode("utf-8") + b"\n"
+                        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                        self.wfile.flush()
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    chunks.close()
+                    with fake._lock:
+                        fake.aborted += 1
+                    self.close_connection = True
+
+        return Handler
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+            return failed
+
+    def load(self, payload: dict):
+        """
+        Waits for the payload's model to be loaded, loading it if nobody has.
+        """
+        model = payload.get("model")
+        with self._lock:
+            if "keep_alive" in payload:
+                self.keep_alive = payload["keep_alive"]
+            if model in self._loaded:
+                return
+            lock = self._load_locks.setdefault(model, threading.Lock())
+        with lock:
+            if model in self._loaded:
+                return
+            time.sleep(self.load_time)
+            with self._lock:
+                self._loaded.add(model)
+                self.loads += 1
+
+    def _delay(self) -> float:
+        with self._lock:
+            return self._random.uniform(0, self.jitter) if self.jitter else 0.0
+
+    def _started(self):
+        with self._lock:
+            self.inflight += 1
+            self.peak_inflight = max(self.peak_inflight, self.inflight)
+
+    def _finished(self):
+        with self._lock:
+            self.inflight -= 1
+
+    def _reply(self, payload: dict) -> str:
+        self.load(payload)
+        message = payload.get("messages", [{}])[-1]
+        images = message.get("images", [])
+        time.sleep(self.latency + self.per_image_latency * len(images) + self._delay())
+
+        if not images:
+            return f"You said: {message.get('content', '')}"
+        if payload.get("format"):
+            # Structured output: one object, or {"images": [...]} for several
+            fields = [answer_fields(image_is_bright(image)) for image in images]
+            return json.dumps(fields[0] if len(images) == 1 else {"images": fields})
+        if len(images) == 1:
+            return answer_block(image_is_bright(images[0]))
+        return "\n\n".join(
+            f"Image {i}:\n{answer_block(image_is_bright(image))}"
+            for i, image in enumerate(images, start=1)
+        )
+
+    def chat(self, payload: dict) -> dict:
+        self._started()
+        try:
+            return {
+                "model": payload.get("model"),
+                "message": {"role": "assistant", "content": self._reply(payload)},
+                "done": True
+            }
+        finally:
+            self._finished()
+
+    def chat_stream(self, payload: dict):
+        self._started()
+        try:
+            words = self._reply(payload).split(" ")
+            for i, word in enumerate(words):
+                if i:
+                    time.sleep(self.token_latency)
+                content = word if i == 0 else " " + word
+                yield {"model": payload.get("model"), "message": {"role": "assistant", "content": content}, "done": False}
+            yield {"model": payload.get("model"), "message": {"role": "assistant", "content": ""}, "done": True}
+        finally:
+            self._finished()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops listening and drops open keep-alive connections, like a server going down.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs a fake Ollama server until interrupted.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--per-image-latency", type=float, default=0.02)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--load-time", type=float, default=0.0, help="Seconds to load each model on first use")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeOllama(
+        latency=args.latency, per_image_latency=args.per_image_latency, token_latency=args.token_latency,
+        jitter=args.jitter, error_rate=args.error_rate, load_time=args.load_time, seed=args.seed,
+        host=args.host, port=args.port
+    ).start()
+    # The URL is the first line of output, for scripts that start this process
+    print(server.url, flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
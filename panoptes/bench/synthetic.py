@@ -0,0 +1,38 @@
+"""Synthetic media generators shared by the benchmarks."""
+import cv2
+import numpy as np
+
+
+def make_video(path, seconds=20, fps=30, size=(640, 480), fourcc="MJPG"):
+    """
+    Writes a video of a moving square over a gradient and returns its path.
+    Every frame differs, so codecs cannot collapse frames into no-ops.
+    """
+    width, height = size
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    background = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    background = cv2.cvtColor(background, cv2.COLOR_GRAY2BGR)
+    try:
+        for i in range(int(seconds * fps)):
+            frame = background.copy()
+            x = (i * 7) % max(1, width - 80)
+            y = (i * 3) % max(1, height - 80)
+            cv2.rectangle(frame, (x, y), (x + 80, y + 80), (0, 0, 255), -1)
+            cv2.putText(frame, str(i), (10, height - 20), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+            writer.write(frame)
+    finally:
+        writer.release()
+    return path
+
+
+def make_image(width=1280, height=720, seed=0, quality=90):
+    """
+    Returns JPEG bytes of a noisy gradient stamped with 'seed'. Different
+    seeds give different bytes, so content-addressed caches never hit.
+    """
+    rng = np.random.default_rng(seed)
+    image = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+    image = cv2.add(image, rng.integers(0, 32, image.shape, dtype=np.uint8))
+    cv2.putText(image, str(seed), (20, height // 2), cv2.FONT_HERSHEY_SIMPLEX, 2, (0, 0, 255), 4)
+    return cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
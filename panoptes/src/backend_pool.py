@@ -0,0 +1,206 @@
+"""Pool of Ollama backends with model-aware, least-outstanding-requests routing."""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Set, Union
+
+import httpx
+
+from metrics import REGISTRY
+from constants import OLLAMA_HEALTH_INTERVAL, OLLAMA_MAX_FAILURES, OLLAMA_EJECT_SECONDS
+
+BACKEND_INFLIGHT = REGISTRY.gauge("panoptes_ollama_inflight", "Calls in flight per Ollama backend.", ["backend"])
+BACKEND_EJECTIONS = REGISTRY.counter("panoptes_ollama_ejections_total", "Times a backend was ejected.", ["backend"])
+
+
+def parse_hosts(hosts: Union[str, Iterable[str]]) -> List[str]:
+    """
+    Accepts one host, a comma-separated list (as in OLLAMA_HOST) or a list.
+    """
+    if isinstance(hosts, str):
+        hosts = hosts.split(",")
+    return [host.strip().rstrip("/") for host in hosts if host.strip()]
+
+
+def model_name(name: str) -> str:
+    """
+    Normalizes 'llama3.2' to 'llama3.2:latest', the form /api/tags lists.
+    """
+    return name if ":" in name else f"{name}:latest"
+
+
+class Backend:
+    """
+    One Ollama host and its routing state.
+    'models' is None until a health check has listed the host's models;
+    until then the host is assumed to serve any model.
+    """
+
+    def __init__(self, host: str, client_options: Dict[str, Any]):
+        self.host = host
+        self.models: Optional[Set[str]] = None
+        self.inflight = 0
+        self.requests = 0
+        self.failures = 0  # Consecutive
+        self.ejected_until = 0.0
+        self._client_options = client_options
+        self._http: Optional[httpx.AsyncClient] = None
+        self._http_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """
+        Connection-pooled client for this host, created for the running loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self._http is None or self._http.is_closed or self._http_loop is not loop:
+            self._http = httpx.AsyncClient(base_url=self.host, **self._client_options)
+            self._http_loop = loop
+        return self._http
+
+    def serves(self, model: Optional[str]) -> bool:
+        return self.models is None or model is None or model_name(model) in self.models
+
+    def available(self, now: float) -> bool:
+        return now >= self.ejected_until
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "available": self.available(time.monotonic()),
+            "models": sorted(self.models) if self.models is not None else None,
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+
+class BackendPool:
+    """
+    Routes model calls across one or more Ollama hosts.
+    - Only hosts whose /api/tags lists the requested model are used; if none
+      do, every host is a candidate.
+    - Among available candidates, the host with the fewest requests in flight
+      is picked, so frame fan-out spreads over the pool.
+    - 'max_failures' consecutive failures eject a host for 'eject_seconds'.
+      It then gets traffic again, and is ejected again on its next failure.
+    - start() runs a health check every 'health_interval' seconds. Hosts that
+      do not answer are ejected until a later check succeeds; hosts that do
+      answer are restored and have their model list refreshed.
+    If every candidate is ejected, the one due back soonest is still tried
+    rather than failing the call outright.
+    """
+
+    def __init__(
+        self,
+        hosts: Union[str, Iterable[str]],
+        max_failures: int = OLLAMA_MAX_FAILURES,
+        eject_seconds: float = OLLAMA_EJECT_SECONDS,
+        health_interval: float = OLLAMA_HEALTH_INTERVAL,
+        **client_options
+    ):
+        self.backends = [Backend(host, client_options) for host in parse_hosts(hosts)]
+        if not self.backends:
+            raise ValueError("At least one Ollama host is required")
+        self.max_failures = max_failures
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self._health_task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def pick(self, model: Optional[str], exclude: Iterable[Backend] = ()) -> Backend:
+        """
+        Chooses the backend for a call to 'model'. Hosts in 'exclude' (already
+        tried by this call) are only used when nothing else is available.
+        """
+        now = time.monotonic()
+        candidates = [b for b in self.backends if b.serves(model)] or self.backends
+        available = [b for b in candidates if b.available(now)]
+        if not available:
+            return min(candidates, key=lambda b: b.ejected_until)
+        untried = [b for b in available if b not in exclude] or available
+        # Ties go to the host with fewer requests so far, which round-robins idle hosts
+        return min(untried, key=lambda b: (b.inflight, b.requests))
+
+    @asynccontextmanager
+    async def acquire(self, model: Optional[str], exclude: Iterable[Backend] = ()) -> AsyncIterator[Backend]:
+        """
+        Picks a backend and counts the call against it until the block exits.
+        Connection errors and timeouts inside the block count as failures.
+        """
+        backend = self.pick(model, exclude)
+        backend.inflight += 1
+        backend.requests += 1
+        BACKEND_INFLIGHT.inc(backend=backend.host)
+        try:
+            yield backend
+        except httpx.TransportError:
+            self.record(backend, ok=False)
+            raise
+        finally:
+            backend.inflight -= 1
+            BACKEND_INFLIGHT.dec(backend=backend.host)
+
+    def record(self, backend: Backend, ok: bool):
+        if ok:
+            backend.failures = 0
+            return
+        backend.failures += 1
+        if backend.failures >= self.max_failures:
+            backend.ejected_until = time.monotonic() + self.eject_seconds
+            BACKEND_EJECTIONS.inc(backend=backend.host)
+            print(f"Ejecting Ollama backend {backend.host} for {self.eject_seconds}s "
+                  f"after {backend.failures} consecutive failures")
+
+    async def check(self, backend: Backend) -> bool:
+        """
+        Health-checks one backend via /api/tags and refreshes its model list.
+        """
+        try:
+            response = await backend.http.get("/api/tags")
+            response.raise_for_status()
+            models = {model_name(model["name"]) for model in response.json().get("models", [])}
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            if backend.available(time.monotonic()):
+                print(f"Ollama backend {backend.host} failed its health check: {e}")
+            backend.failures = max(backend.failures, self.max_failures)
+            backend.ejected_until = time.monotonic() + self.health_interval
+            return False
+
+        backend.models = models
+        backend.failures = 0
+        backend.ejected_until = 0.0
+        return True
+
+    async def check_all(self) -> List[bool]:
+        return await asyncio.gather(*(self.check(backend) for backend in self.backends))
+
+    async def _health_loop(self):
+        while True:
+            await self.check_all()
+            await asyncio.sleep(self.health_interval)
+
+    def start(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+
+    async def aclose(self):
+        await self.stop()
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [backend.to_dict() for backend in self.backends]
@@ -1,15 +1,25 @@
 import os
-import json
 from pathlib import Path
 
-from constants import STORAGE_DIR, LOG_FILE, UPLOAD_DIR, FRAMES_DIR
-
-UPLOAD_DIR.mkdir(exist_ok=True)
-FRAMES_DIR.mkdir(exist_ok=True)
+from constants import STORAGE_DIR, LOG_FILE, UPLOAD_INDEX_FILE, UPLOAD_DIR, FRAMES_DIR, JOBS_DIR, THUMBNAIL_DIR
+from storage import remove_temp_files
+from upload_store import UploadStore
 
 def prep():
-    os.makedirs(STORAGE_DIR, exist_ok=True)
+    # Run from the app's lifespan, so importing the app writes nothing
+    for directory in (STORAGE_DIR, UPLOAD_DIR, FRAMES_DIR, JOBS_DIR, THUMBNAIL_DIR):
+        os.makedirs(directory, exist_ok=True)
+
+    # Only old ones: with several workers, another one may be writing its temp files right now
+    removed = remove_temp_files([STORAGE_DIR, UPLOAD_DIR])
+    if removed:
+        print(f"Removed {removed} temp files left by interrupted uploads")
 
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, "w") as f:
-            json.dump([], f)
+    # Move any entries from the legacy JSON log into the upload index
+    store = UploadStore(UPLOAD_INDEX_FILE)
+    try:
+        imported = store.migrate_json_log(LOG_FILE)
+        if imported:
+            print(f"Migrated {imported} entries from {LOG_FILE} to {UPLOAD_INDEX_FILE}")
+    finally:
+        store.close()
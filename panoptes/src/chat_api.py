@@ -1,44 +1,178 @@
 import asyncio
-import base64
-import cv2
 import json
-import ollama
 import os
-import shutil
 import uuid
-from typing import List, Optional
+from concurrent.futures import Executor, ThreadPoolExecutor
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional, Sequence, Union
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Request, UploadFile, File, Form
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
 
-from ollama_base import OllamaBase
-from util import compute_file_hash
-from models import ChatRequest, UploadRequest, ImageAnalysisRequest
-from constants import STORAGE_DIR, LOG_FILE, SUPPORTED_FILE_TYPES, UPLOAD_DIR, FRAMES_DIR
+from frame_batcher import FrameBatcher
+from frame_filter import SceneChangeFilter
+from frame_pipeline import FramePipeline
+from frame_preprocess import FramePreprocessor
+from image_payload import PayloadOptimizer
+from frame_sampler import FrameSampler
+from job_queue import AnalysisJobQueue
+from job_store import JOB_ID, VideoJob, VideoJobStore
+from metrics import REGISTRY, observe_stage, recent_spans, span, timed_iter
+from ollama_base import OllamaBase, ANALYSIS_ERROR, keep_alive_value
+from result_cache import ResultCache
+from storage import StorageManager, move_into_place, shard_path
+from upload_store import UploadStore
+from util import HashingWriter
+from models import ChatRequest, VideoAnalysisOptions, UploadSessionRequest, ChatSessionRequest
+from chat_sessions import ChatSession, ChatSessionStore, estimate_tokens, summary_prompt
+from upload_sessions import GrowingFileSampler, UploadSession, UploadSessionStore
+from warmup import ModelWarmup
+from constants import (STORAGE_DIR, UPLOAD_INDEX_FILE, RESULT_CACHE_FILE, SUPPORTED_FILE_TYPES, UPLOAD_DIR,
+                       FRAMES_DIR, VISION_MODEL, ANALYSIS_CONCURRENCY, FRAME_SAMPLE_INTERVAL, SCENE_CHANGE_THRESHOLD,
+                       ANALYSIS_BATCH_SIZE, FRAME_MAX_SIDE, PAYLOAD_MAX_BYTES, PAYLOAD_FORMAT, PAYLOAD_FORMATS,
+                       THUMBNAIL_DEFAULT_WIDTH, ANALYSIS_STRUCTURED_OUTPUT, OLLAMA_KEEP_ALIVE, WARMUP_MODELS)
 
+UPLOADS = REGISTRY.counter("panoptes_uploads_total", "Uploaded files, new or duplicate.", ["result"])
+FRAMES = REGISTRY.counter(
+    "panoptes_frames_total", "Sampled video frames by outcome: analyzed, inferred (skipped), dropped or error.",
+    ["outcome"]
+)
+PAYLOAD_BYTES = REGISTRY.histogram(
+    "panoptes_payload_bytes", "Encoded frame size sent to the vision model.",
+    buckets=(16_384, 32_768, 65_536, 131_072, 262_144, 524_288, 1_048_576, 4_194_304)
+)
+
+CHAT_COMPACTIONS = REGISTRY.counter(
+    "panoptes_chat_compactions_total", "Chat histories cut down to their token budget, by mode: truncate or summarize.",
+    ["mode"]
+)
+
+# Options that change a video job's results, so they are part of its key.
+# concurrency and ordered only schedule the work, and batched results are
+# cached as interchangeable with single-frame ones, so batch_size is left out.
+JOB_KEY_OPTIONS = {"sample_mode", "skip_similar", "similarity_threshold", "max_side", "denoise", "max_payload_bytes",
+                   "payload_format", "structured_output", "save_frames"}
 
 router = APIRouter()
 
+def video_analysis_options(
+        object_str: str = Form(...),
+        concurrency: int = Form(ANALYSIS_CONCURRENCY),
+        ordered: bool = Form(True),
+        save_frames: bool = Form(True),
+        sample_interval: float = Form(FRAME_SAMPLE_INTERVAL),
+        sample_rate: Optional[float] = Form(None),
+        sample_mode: str = Form("grab"),
+        skip_similar: bool = Form(False),
+        similarity_threshold: float = Form(SCENE_CHANGE_THRESHOLD),
+        batch_size: int = Form(ANALYSIS_BATCH_SIZE),
+        max_side: int = Form(FRAME_MAX_SIDE),
+        denoise: bool = Form(False),
+        max_payload_bytes: int = Form(PAYLOAD_MAX_BYTES),
+        payload_format: str = Form(PAYLOAD_FORMAT),
+        structured_output: bool = Form(ANALYSIS_STRUCTURED_OUTPUT)
+) -> VideoAnalysisOptions:
+    """
+    Form fields shared by /analyze and /jobs. Values outside the bounds set
+    on VideoAnalysisOptions are rejected with a 400, like an unknown format.
+    """
+    if payload_format not in PAYLOAD_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown payload format '{payload_format}', expected one of {PAYLOAD_FORMATS}"
+        )
+    try:
+        return VideoAnalysisOptions(
+            object_str=object_str,
+            concurrency=concurrency,
+            ordered=ordered,
+            save_frames=save_frames,
+            sample_interval=sample_interval,
+            sample_rate=sample_rate,
+            sample_mode=sample_mode,
+            skip_similar=skip_similar,
+            similarity_threshold=similarity_threshold,
+            batch_size=batch_size,
+            max_side=max_side,
+            denoise=denoise,
+            max_payload_bytes=max_payload_bytes,
+            payload_format=payload_format,
+            structured_output=structured_output
+        )
+    except ValidationError as e:
+        errors = "; ".join(f"{error['loc'][0]}: {error['msg']}" for error in e.errors())
+        raise HTTPException(status_code=400, detail=f"Invalid analysis options: {errors}")
+
 class ChatAPI(OllamaBase):
     """
     A class to group Chat-related endpoints.
     We attach endpoints to a shared APIRouter instance.
     """
 
-    def __init__(self, ollama_host:str, api_key: str):
-        super().__init__(ollama_host, api_key)
+    def __init__(
+        self,
+        ollama_host: Union[str, List[str]],
+        api_key: str,
+        upload_store: Optional[UploadStore] = None,
+        result_cache: Optional[ResultCache] = None,
+        keep_alive: Optional[Union[str, float]] = OLLAMA_KEEP_ALIVE,
+        warmup_models: Sequence[str] = WARMUP_MODELS,
+        **ollama_options
+    ):
+        """
+        'warmup_models' are loaded into Ollama at startup and must be loaded
+        before /health/ready reports ready; see ModelWarmup.
+        'ollama_options' go to OllamaBase, e.g. retries or a transport.
+        """
+        super().__init__(
+            ollama_host, api_key, result_cache=result_cache or ResultCache(RESULT_CACHE_FILE), keep_alive=keep_alive,
+            **ollama_options
+        )
+        self.upload_store = upload_store or UploadStore(UPLOAD_INDEX_FILE)
+        self.storage = StorageManager(self.upload_store)
+        self.video_jobs = VideoJobStore()
+        self.upload_sessions = UploadSessionStore()
+        self.job_queue = AnalysisJobQueue(self._run_video_job)
+        self.warmup = ModelWarmup(self.backends, warmup_models, keep_alive)
+        self.chat_sessions = ChatSessionStore()
         api_version = 'v1'
         # Register endpoints with the router
         router.post(f"/api/{api_version}/chat")(self.chat_endpoint)
         router.post(f"/api/{api_version}/upload")(self.upload_endpoint)
         router.post(f"/api/{api_version}/image-analysis")(self.image_analysis_endpoint)
         router.post(f"/api/{api_version}/analyze")(self.analyze_video)
+        router.get(f"/api/{api_version}/cache/stats")(self.cache_stats_endpoint)
+        router.post(f"/api/{api_version}/jobs", status_code=202)(self.submit_job_endpoint)
+        router.get(f"/api/{api_version}/jobs/{{job_id}}")(self.job_status_endpoint)
+        router.get(f"/api/{api_version}/jobs/{{job_id}}/results")(self.job_results_endpoint)
+        router.post(f"/api/{api_version}/chat/stream")(self.chat_stream_endpoint)
+        router.post(f"/api/{api_version}/image-analysis/stream")(self.image_analysis_stream_endpoint)
+        router.get(f"/api/{api_version}/backends")(self.backends_endpoint)
+        router.get("/metrics")(self.metrics_endpoint)
+        router.get(f"/api/{api_version}/metrics/spans")(self.spans_endpoint)
+        router.get(f"/api/{api_version}/storage")(self.storage_endpoint)
+        router.post(f"/api/{api_version}/uploads", status_code=201)(self.create_upload_endpoint)
+        router.put(f"/api/{api_version}/uploads/{{upload_id}}")(self.upload_part_endpoint)
+        router.get(f"/api/{api_version}/uploads/{{upload_id}}")(self.upload_status_endpoint)
+        router.post(f"/api/{api_version}/uploads/{{upload_id}}/complete")(self.complete_upload_endpoint)
+        router.post(f"/api/{api_version}/uploads/{{upload_id}}/analyze")(self.analyze_upload_endpoint)
+        router.get(f"/api/{api_version}/health/live")(self.liveness_endpoint)
+        router.get(f"/api/{api_version}/health/ready")(self.readiness_endpoint)
+        router.post(f"/api/{api_version}/chat/sessions", status_code=201)(self.create_chat_session_endpoint)
+        router.get(f"/api/{api_version}/chat/sessions/{{session_id}}")(self.chat_session_endpoint)
+        router.delete(f"/api/{api_version}/chat/sessions/{{session_id}}")(self.delete_chat_session_endpoint)
+        router.post(f"/api/{api_version}/chat/sessions/{{session_id}}/messages")(self.chat_session_message_endpoint)
+        router.post(f"/api/{api_version}/chat/sessions/{{session_id}}/messages/stream")(
+            self.chat_session_stream_endpoint
+        )
 
     # Endpoint 1: /api/chat
-    def chat_endpoint(self, request_data: ChatRequest):
+    async def chat_endpoint(self, request_data: ChatRequest):
         # We won't necessarily need api_key again, because we stored a global above
         # but you could verify or override it if needed.
-        response = self._call_ollama_chat(prompt=request_data.prompt)
+        response = await self._call_ollama_chat(prompt=request_data.prompt)
         return {"success": True, "data": response}
 
 
@@ -58,56 +192,79 @@ class ChatAPI(OllamaBase):
                 detail="Uploaded file does not have a valid extension."
         )
 
-        # Load the current log
-        with open(LOG_FILE, "r") as log_file:
-            log_data = json.load(log_file)
-
         # Save the uploaded file to a temporary location
         temp_file_path = os.path.join(STORAGE_DIR, f"temp_{uuid.uuid4()}{file_extension}")
 
         try:
-            # Open the destination file in binary write mode
-            with open(temp_file_path, "wb") as f:
-                # Read and write the file in chunks
-                while chunk := await file.read(1024 * 1024):  # 1 MB chunks
-                    f.write(chunk)
+            writer = await self._write_upload(file, temp_file_path)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"An error occurred while saving the file: {str(e)}"
             )
 
-        # Compute the hash of the uploaded file
-        file_hash = compute_file_hash(temp_file_path)
-
-        # Check for duplicates in the log
-        for entry in log_data:
-            if entry["hash"] == file_hash:
-                # Delete the temporary file and return the existing file info
-                os.remove(temp_file_path)
-                return {
-                    "message": "Duplicate file detected. Pointing to existing file.",
-                    "filename": entry
-                }
+        observe_stage("upload_write", writer.write_seconds, bytes=writer.size)
+        observe_stage("upload_hash", writer.hash_seconds, bytes=writer.size)
+        file_hash = writer.hexdigest("md5")
+
+        # Check for duplicates in the upload index
+        with span("dedup_lookup"):
+            entry = await asyncio.to_thread(self.upload_store.get, file_hash)
+        if entry is not None:
+            UPLOADS.inc(result="duplicate")
+            await asyncio.to_thread(self.upload_store.touch, file_hash)
+            # Delete the temporary file and return the existing file info
+            os.remove(temp_file_path)
+            return {
+                "message": "Duplicate file detected. Pointing to existing file.",
+                "filename": entry
+            }
 
-        # Generate a UUID-based filename for storage
-        stored_filename = f"{uuid.uuid4().hex}{file_extension}"
+        # Generate a UUID-based filename for storage, in a sharded subdirectory
+        stored_filename = shard_path(f"{uuid.uuid4().hex}{file_extension}")
         stored_file_path = os.path.join(STORAGE_DIR, stored_filename)
-        os.rename(temp_file_path, stored_file_path)
+        await asyncio.to_thread(move_into_place, temp_file_path, stored_file_path)
 
         # Log the new file upload
         new_entry = {
             "original_filename": original_filename,
             "file_type": file.content_type,
             "hash": file_hash,
+            "blake2b": writer.hexdigest("blake2b"),
             "stored_filename": stored_filename
         }
 
-        log_data.append(new_entry)
-        with open(LOG_FILE, "w") as log_file:
-            json.dump(log_data, log_file, indent=4)
+        entry, created = await asyncio.to_thread(self.upload_store.add, new_entry)
+        if not created:
+            UPLOADS.inc(result="duplicate")
+            # A concurrent upload of the same content was indexed first
+            os.remove(stored_file_path)
+            return {
+                "message": "Duplicate file detected. Pointing to existing file.",
+                "filename": entry
+            }
 
-        return {"message": "File uploaded successfully", "filename": new_entry}
+        UPLOADS.inc(result="new")
+        return {"message": "File uploaded successfully", "filename": entry}
+
+    async def _write_upload(self, file: UploadFile, file_path) -> HashingWriter:
+        """
+        Streams 'file' to 'file_path', hashing it in the same pass so the file is
+        only touched once. Blocking file I/O and hashing run in a worker thread,
+        off the event loop. The partial file is removed if anything fails.
+        """
+        try:
+            writer = await asyncio.to_thread(HashingWriter, file_path)
+            try:
+                while chunk := await file.read(1024 * 1024):  # 1 MB chunks
+                    await asyncio.to_thread(writer.write, chunk)
+            finally:
+                await asyncio.to_thread(writer.close)
+        except Exception:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            raise
+        return writer
 
     # Endpoint 3: /api/image-analysis")
     async def image_analysis_endpoint(self,
@@ -123,15 +280,26 @@ class ChatAPI(OllamaBase):
         print(f'>> {upload_response}')
 
         # Retrieve the stored file path
-        stored_filename = upload_response.get("filename").get('stored_filename')
+        file_entry = upload_response.get("filename")
+        stored_filename = file_entry.get('stored_filename')
         stored_file_path = os.path.join(STORAGE_DIR, stored_filename)
 
+        # Duplicate uploads with the same prompt are answered from the cache
+        cached = await asyncio.to_thread(self.result_cache.get, file_entry["hash"], prompt, VISION_MODEL)
+        if cached is not None:
+            return {
+                "message": cached,
+                "analysis": 'Done',
+                "cached": True
+            }
+
         print(f'>> {prompt} - {stored_file_path}')
         # Call the Ollama image analysis service
         try:
-            analysis_response = self._call_image_analysis(
+            analysis_response = await self._call_image_analysis(
                 prompt=prompt,
-                image_path=stored_file_path
+                image_path=stored_file_path,
+                model=VISION_MODEL
             )
         except Exception as e:
             raise HTTPException(
@@ -139,11 +307,20 @@ class ChatAPI(OllamaBase):
                 detail=f"An error occurred while analyzing the image: {str(e)}"
             )
 
+        await asyncio.to_thread(self.result_cache.put, file_entry["hash"], prompt, VISION_MODEL, analysis_response)
         return {
             "message": analysis_response,
-            "analysis": 'Done'
+            "analysis": 'Done',
+            "cached": False
         }
 
+    # Endpoint 4: /api/cache/stats
+    def cache_stats_endpoint(self):
+        """
+        Reports result cache hit/miss counters and size, for sizing its limits.
+        """
+        return self.result_cache.stats()
+
     # async def analyze_image(self, image_path: str, object_str: str):
     #     prompt_str = f"""Please analyze the image and answer the following questions:
     #     1. Is there a {object_str} in the image?
@@ -195,94 +372,673 @@ class ChatAPI(OllamaBase):
     #         return False, "Error occurred", 0
 
 
-    def preprocess_image(self, image_path):
-        img = cv2.imread(image_path)
-        if img is None:
-            return False
-
-        lab = cv2.cvtColor(img, cv2.COLOR_BGR2LAB)
-        l, a, b = cv2.split(lab)
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
-        cl = clahe.apply(l)
-        limg = cv2.merge((cl, a, b))
-        final = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
-        cv2.imwrite(image_path, final, [cv2.IMWRITE_JPEG_QUALITY, 100])
-        return True
-
-
     # @app.get("/")
     # async def home(self, request: Request):
     #     return templates.TemplateResponse("index.html", {"request": request})
 
 
+    async def _save_video(self, video: UploadFile):
+        """
+        Stores an uploaded video under its content hash, so different videos
+        with the same filename never overwrite each other.
+        Returns (video_path, blake2b hex digest).
+        """
+        video_extension = os.path.splitext(video.filename)[1]
+        temp_video_path = UPLOAD_DIR / f"temp_{uuid.uuid4().hex}{video_extension}"
+        writer = await self._write_upload(video, temp_video_path)
+        video_hash = writer.hexdigest("blake2b")
+        video_path = UPLOAD_DIR / shard_path(f"{video_hash[:32]}{video_extension}")
+        await asyncio.to_thread(move_into_place, temp_video_path, video_path)
+        return video_path, video_hash
+
+    def _video_sampler(self, video, options: VideoAnalysisOptions) -> FrameSampler:
+        """
+        'video' is a path, or an UploadSession still being uploaded, which is
+        sampled as it grows.
+        """
+        sampler_class = GrowingFileSampler if isinstance(video, UploadSession) else FrameSampler
+        try:
+            return sampler_class(
+                video,
+                every_seconds=options.sample_interval,
+                per_second=options.sample_rate,
+                mode=options.sample_mode,
+                # Orientation is corrected by FramePreprocessor with the rest of the chain
+                orient=False
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    async def _video_job(self, content_key: str, options: VideoAnalysisOptions, sampler: FrameSampler) -> VideoJob:
+        settings = options.model_dump(include=JOB_KEY_OPTIONS)
+        key = VideoJobStore.job_key(content_key, options.object_str, sampler.interval, **settings)
+        # A new job creates its directory
+        return await asyncio.to_thread(self.video_jobs.get, key)
+
+    async def _run_video_job(
+        self,
+        job: VideoJob,
+        sampler: FrameSampler,
+        video_hash: str,
+        options: VideoAnalysisOptions,
+        executor: Optional[Executor] = None
+    ):
+        """
+        Yields the result of every sampled second of a video job.
+        Stored results come first. A finished job stops there, without decoding
+        or calling the model; otherwise the remaining seconds are analyzed and
+        persisted as each one finishes. The job is marked complete only once
+        every sampled second has a successful result; a video that gave no
+        results at all (unreadable, or removed before decoding) stays
+        resumable too. 'executor' runs decoding and preprocessing.
+        """
+        object_str = options.object_str
+        stored_results = await asyncio.to_thread(job.results)
+        for second in sorted(stored_results):
+            yield stored_results[second]
+        if await asyncio.to_thread(lambda: job.complete):
+            return
+
+        frames_subdir = shard_path(job.key)
+        task_frames_dir = FRAMES_DIR / frames_subdir
+        task_frames_dir.mkdir(parents=True, exist_ok=True)
+
+        # Resume after the last second that was already analyzed in order;
+        # later stragglers from an interrupted run are skipped below.
+        while sampler.second_at(sampler.start_index) in stored_results:
+            sampler.start_index += 1
+        sampled = 0
+
+        def pending_frames():
+            nonlocal sampled
+            for second, frame in timed_iter(sampler, "frame_decode"):
+                if second not in stored_results:
+                    sampled += 1
+                    yield second, frame
+
+        preprocessor = FramePreprocessor(max_side=options.max_side, denoise=options.denoise)
+        optimizer = PayloadOptimizer(
+            max_side=options.max_side, max_bytes=options.max_payload_bytes, image_format=options.payload_format
+        )
+
+        def prepare_frame(current_second, frame):
+            if frame is None:
+                FRAMES.inc(outcome="dropped")
+                return None
+            with span("preprocess", second=current_second):
+                image = preprocessor.apply(frame)
+            with span("encode", second=current_second):
+                payload = optimizer.encode(image, original_bytes=frame.nbytes)
+            PAYLOAD_BYTES.observe(len(payload.data))
+            return payload
+
+        batcher = None
+        if options.batch_size > 1:
+            batcher = FrameBatcher(
+                lambda images: self.analyze_images_batch(images, object_str, structured=options.structured_output),
+                options.batch_size
+            )
+
+        async def analyze_frame(current_second, payload):
+            # The ImagePayload itself is sent, so the model gets exactly these
+            # bytes and "payload" below reports what the request carried
+            if batcher is not None:
+                analysis = batcher.submit(payload)
+            else:
+                analysis = self.analyze_image(payload, object_str, structured=options.structured_output)
+            frame_file = task_frames_dir / f"frame_{current_second}{payload.extension}"
+            if options.save_frames:
+                # Write the preview while the model call is in flight
+                (is_match, description, confidence), _ = await asyncio.gather(
+                    analysis, asyncio.to_thread(frame_file.write_bytes, payload.data)
+                )
+            else:
+                is_match, description, confidence = await analysis
+
+            frame_path = f"/frames/{frames_subdir}/{frame_file.name}" if options.save_frames else None
+            result = {
+                "status": "error" if description == ANALYSIS_ERROR else "success",
+                "frame": {
+                    "second": current_second,
+                    "is_match": is_match,
+                    "description": description,
+                    "confidence": confidence,
+                    "frame_path": frame_path,
+                    "thumbnail_path": f"{frame_path}?w={THUMBNAIL_DEFAULT_WIDTH}" if frame_path else None,
+                    "inferred": False,
+                    "payload": payload.to_dict()
+                }
+            }
+            FRAMES.inc(outcome="analyzed" if result["status"] == "success" else "error")
+            # Persist as soon as it finishes, so a dropped client loses nothing
+            if result["status"] == "success":
+                await asyncio.to_thread(job.append, result)
+            return result
+
+        def reuse_result(current_second, source_second, source_result):
+            frame_result = dict(source_result["frame"])
+            frame_result.update(second=current_second, inferred=True, inferred_from=source_second)
+            # Nothing was sent to the model for this frame
+            frame_result.pop("payload", None)
+            FRAMES.inc(outcome="inferred")
+            # Persisted by the caller, off the event loop
+            return {"status": source_result["status"], "frame": frame_result}
+
+        pipeline = FramePipeline(
+            pending_frames(),
+            analyze_frame,
+            preprocess=prepare_frame,
+            frame_filter=SceneChangeFilter(options.similarity_threshold) if options.skip_similar else None,
+            reuse=reuse_result,
+            # 'concurrency' counts model requests, each carrying up to batch_size frames
+            concurrency=options.concurrency * max(1, options.batch_size),
+            ordered=options.ordered,
+            executor=executor
+        )
+        succeeded = 0
+        async for result in pipeline.run():
+            if result["status"] == "success":
+                succeeded += 1
+                if result["frame"]["inferred"]:
+                    await asyncio.to_thread(job.append, result)
+            yield result
+
+        # Frames that were dropped or failed are retried when the video is resubmitted
+        if succeeded == sampled and (succeeded or stored_results):
+            await asyncio.to_thread(job.mark_complete, video_hash=video_hash, object_str=object_str)
+
     # @app.post("/analyze")
     async def analyze_video(self,
             video: UploadFile = File(...),
-            object_str: str = Form(...)
+            options: VideoAnalysisOptions = Depends(video_analysis_options)
     ):
+        """
+        Streams per-second analysis results as NDJSON.
+        Results are stored per (video content hash, object_str) job: a finished
+        job is replayed as-is, and an interrupted one resumes where it stopped.
+        Up to 'concurrency' frames are analyzed at once; with ordered=False
+        results are sent as they finish and clients sort them by "second".
+        Frames stay in memory and are JPEG-encoded once; the same bytes are
+        written to /frames as a preview only when 'save_frames' is set.
+        Frames are sampled every 'sample_interval' seconds, or 'sample_rate'
+        times per second when given; see FrameSampler for 'sample_mode'.
+        With 'skip_similar', frames within 'similarity_threshold' of the last
+        analyzed frame reuse its result and are marked "inferred".
+        With 'batch_size' > 1, up to that many frames share one model request.
+        Frames are oriented, downscaled to at most 'max_side' pixels (0 keeps
+        the full size), optionally denoised and contrast-enhanced, then encoded
+        as 'payload_format' at the best quality within 'max_payload_bytes'.
+        Each result's "payload" reports the encoded size and encode time.
+        With 'structured_output' the model replies in validated JSON and
+        malformed replies are re-asked; see OllamaBase.analyze_image.
+        Saved previews also get a "thumbnail_path" to a small copy for grids.
+        """
         try:
-            video_path = UPLOAD_DIR / video.filename
-            with open(video_path, "wb") as buffer:
-                shutil.copyfileobj(video.file, buffer)
-
-            task_frames_dir = FRAMES_DIR / video.filename.split('.')[0]
-            task_frames_dir.mkdir(exist_ok=True)
-
-            async def generate_results():
-                cap = cv2.VideoCapture(str(video_path))
-                fps = int(cap.get(cv2.CAP_PROP_FPS))
-                frame_count = 0
-
-                try:
-                    while True:
-                        success, frame = cap.read()
-                        if not success:
-                            break
-
-                        # Ensure frame is valid
-                        if frame is not None:
-                            height, width = frame.shape[:2]
-
-                            # if height < width:  # Portrait orientation
-                            #     frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-                            if width > height:
-                                # Landscape mode
-                                if frame[0, 0][0] > frame[-1, -1][0]:  # Rough check for upside-down
-                                    frame = cv2.rotate(frame, cv2.ROTATE_180)
-
-                            else:
-                                # Portrait mode, rotate 90 degrees
-                                frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-
-                        if frame_count % fps == 0:
-                            current_second = frame_count // fps
-                            frame_path = os.path.join(task_frames_dir, f"frame_{current_second}.jpg")
-                            cv2.imwrite(frame_path, frame)
-
-                            if self.preprocess_image(frame_path):
-                                is_match, description, confidence = await self.analyze_image(frame_path, object_str)
-
-                                result = {
-                                    "status": "success",
-                                    "frame": {
-                                        "second": current_second,
-                                        "is_match": is_match,
-                                        "description": description,
-                                        "confidence": confidence,
-                                        "frame_path": f"/frames/{video.filename.split('.')[0]}/frame_{current_second}.jpg"
-                                    }
-                                }
-                                yield json.dumps(result) + "\n"
-                        frame_count += 1
-                finally:
-                    cap.release()
-
-            return StreamingResponse(generate_results(), media_type="application/json")
-
+            video_path, video_hash = await self._save_video(video)
         except Exception as e:
             return JSONResponse(
                 status_code=500,
                 content={"status": "error", "message": str(e)}
             )
 
+        sampler = self._video_sampler(video_path, options)
+        job = await self._video_job(video_hash, options, sampler)
+
+        async def generate_results():
+            async for result in self._run_video_job(job, sampler, video_hash, options):
+                yield json.dumps(result) + "\n"
+
+        return StreamingResponse(generate_results(), media_type="application/json")
+
+    # Endpoint 5: /api/jobs
+    async def submit_job_endpoint(self,
+            video: UploadFile = File(...),
+            options: VideoAnalysisOptions = Depends(video_analysis_options)
+    ):
+        """
+        Queues a video for background analysis and returns its job id at once.
+        Takes the same fields as /analyze. Resubmitting the same video and
+        object returns the existing job.
+        """
+        try:
+            video_path, video_hash = await self._save_video(video)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"An error occurred while saving the video: {str(e)}"
+            )
+
+        sampler = self._video_sampler(video_path, options)
+        job = await self._video_job(video_hash, options, sampler)
+        try:
+            record = self.job_queue.submit(
+                job.key, job, sampler, video_hash, options,
+                info={"object_str": options.object_str, "filename": video.filename}
+            )
+        except asyncio.QueueFull:
+            raise HTTPException(status_code=503, detail="Too many queued jobs, try again later.")
+        return record.to_dict()
+
+    def _job_record(self, job_id: str):
+        """
+        Returns the queued/running JobRecord, or None for a job that only
+        exists on disk (e.g. from before a restart). Raises 404 if neither.
+        """
+        if not JOB_ID.fullmatch(job_id):
+            raise HTTPException(status_code=404, detail="Job not found.")
+        record = self.job_queue.get(job_id)
+        if record is None and not (self.video_jobs.jobs_dir / job_id).is_dir():
+            raise HTTPException(status_code=404, detail="Job not found.")
+        return record
+
+    # Endpoint 6: /api/jobs/{job_id}
+    async def job_status_endpoint(self, job_id: str):
+        record = self._job_record(job_id)
+        if record is not None:
+            return record.to_dict()
+
+        job = await asyncio.to_thread(self.video_jobs.get, job_id)
+        results = await asyncio.to_thread(job.results)
+        complete = await asyncio.to_thread(lambda: job.complete)
+        return {
+            "job_id": job_id,
+            "status": "complete" if complete else "incomplete",
+            "results": len(results)
+        }
+
+    # Endpoint 7: /api/jobs/{job_id}/results
+    async def job_results_endpoint(self, job_id: str, stream: bool = False):
+        """
+        Returns the job's results so far, or with stream=true streams them as
+        NDJSON and keeps the response open until the job finishes.
+        """
+        record = self._job_record(job_id)
+        if record is None:
+            job = await asyncio.to_thread(self.video_jobs.get, job_id)
+            stored_results = await asyncio.to_thread(job.results)
+            status = "complete" if await asyncio.to_thread(lambda: job.complete) else "incomplete"
+            results = [stored_results[second] for second in sorted(stored_results)]
+        else:
+            status, results = record.status, list(record.results)
+
+        if not stream:
+            return {"job_id": job_id, "status": status, "results": results}
+
+        async def generate_results():
+            if record is None:
+                for result in results:
+                    yield json.dumps(result) + "\n"
+            else:
+                async for result in record.follow():
+                    yield json.dumps(result) + "\n"
+
+        return StreamingResponse(generate_results(), media_type="application/json")
+
+    # Endpoint 8: /api/chat/stream
+    async def chat_stream_endpoint(self, request_data: ChatRequest, request: Request):
+        """
+        Streams the chat completion as Ollama generates it.
+        """
+        chunks = self._call_ollama_chat_stream(prompt=request_data.prompt)
+        return await self._stream_response(request, chunks)
+
+    # Endpoint 9: /api/image-analysis/stream
+    async def image_analysis_stream_endpoint(self, request: Request,
+            prompt: str = Form(...), file: UploadFile = File(...)):
+        """
+        Streaming variant of /image-analysis. A cached analysis is sent as a
+        single final chunk; a completed stream is cached like a normal analysis.
+        """
+        upload_response = await self.upload_endpoint(file)
+        file_entry = upload_response.get("filename")
+        stored_file_path = os.path.join(STORAGE_DIR, file_entry.get('stored_filename'))
+
+        cached = await asyncio.to_thread(self.result_cache.get, file_entry["hash"], prompt, VISION_MODEL)
+        if cached is not None:
+            chunks = self._replay_cached(cached)
+        else:
+            chunks = self._cache_stream(
+                file_entry["hash"], prompt,
+                self._call_image_analysis_stream(prompt=prompt, image_path=stored_file_path, model=VISION_MODEL)
+            )
+        return await self._stream_response(request, chunks)
+
+    async def _replay_cached(self, response: dict) -> AsyncIterator[dict]:
+        yield {**response, "cached": True}
+
+    async def _cache_stream(self, content_hash: str, prompt: str, chunks: AsyncIterator[dict]) -> AsyncIterator[dict]:
+        """
+        Passes chunks through and, once the final one arrives, caches the
+        assembled response in the same shape as a non-streaming reply.
+        """
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk.get("message", {}).get("content", ""))
+            if chunk.get("done"):
+                response = {**chunk, "message": {"role": "assistant", "content": "".join(parts)}}
+                await asyncio.to_thread(self.result_cache.put, content_hash, prompt, VISION_MODEL, response)
+            yield chunk
+
+    async def _stream_response(self, request: Request, chunks: AsyncIterator[dict]) -> StreamingResponse:
+        """
+        Sends 'chunks' as NDJSON, or as server-sent events when the client
+        accepts text/event-stream.
+        The first chunk is awaited before responding so failures before
+        generation starts are still returned as HTTP errors; later failures
+        end the stream with an {"error": ...} chunk. When the client
+        disconnects, Starlette cancels the response and 'chunks' is closed,
+        which closes the upstream connection and aborts the generation.
+        """
+        sse = "text/event-stream" in request.headers.get("accept", "")
+        first = await anext(chunks, None)
+
+        def encode(chunk: dict) -> str:
+            return f"data: {json.dumps(chunk)}\n\n" if sse else json.dumps(chunk) + "\n"
+
+        async def generate():
+            try:
+                chunk = first
+                while chunk is not None:
+                    yield encode(chunk)
+                    chunk = await anext(chunks, None)
+            except HTTPException as e:
+                yield encode({"error": e.detail, "done": True})
+            finally:
+                await asyncio.shield(chunks.aclose())
+
+        return StreamingResponse(generate(), media_type="text/event-stream" if sse else "application/json")
+
+    # Endpoint 10: /api/backends
+    def backends_endpoint(self):
+        """
+        Reports each Ollama backend's availability, models and load.
+        """
+        return {"backends": self.backends.stats()}
+
+    # Endpoint 11: /metrics
+    def metrics_endpoint(self):
+        """
+        Prometheus text exposition of every registered metric.
+        """
+        return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+    # Endpoint 12: /api/metrics/spans
+    def spans_endpoint(self, limit: int = 100, stage: Optional[str] = None):
+        """
+        The most recent timing spans, optionally for one stage only.
+        """
+        return {"spans": recent_spans(limit, stage)}
+
+    # Endpoint 13: /api/storage
+    def storage_endpoint(self):
+        """
+        Reports storage quotas and what the last sweep found and evicted.
+        """
+        return self.storage.stats()
+
+    def _upload_session(self, upload_id: str) -> UploadSession:
+        session = self.upload_sessions.get(upload_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Upload not found")
+        return session
+
+    async def _check_upload_data(self, session: UploadSession):
+        """
+        Raises 410 if the upload's file was deleted or changed behind its
+        back, since appending to it or hashing it would give a wrong video.
+        """
+        if not await asyncio.to_thread(session.data_intact):
+            raise HTTPException(status_code=410, detail="The data of this upload is gone; start a new upload")
+
+    # Endpoint 14: /api/uploads
+    def create_upload_endpoint(self, request_data: UploadSessionRequest):
+        """
+        Starts a resumable video upload. Send the bytes with PUT
+        /uploads/{upload_id}?offset=N in any number of parts, then POST
+        /uploads/{upload_id}/complete. 'size' is the expected total, if known.
+        """
+        if not os.path.splitext(request_data.filename)[1]:
+            raise HTTPException(status_code=400, detail="Uploaded file does not have a valid extension.")
+        return self.upload_sessions.create(request_data.filename, request_data.size).to_dict()
+
+    # Endpoint 15: /api/uploads/{upload_id}
+    async def upload_part_endpoint(self, upload_id: str, offset: int, request: Request):
+        """
+        Appends the request body at 'offset', which must equal the bytes
+        received so far. Whatever arrives before a dropped connection is
+        kept; GET the upload for the offset to resume from.
+        """
+        session = self._upload_session(upload_id)
+        if session.complete:
+            raise HTTPException(status_code=409, detail="Upload is already complete")
+        if not session.write_lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="Another part of this upload is being written")
+        try:
+            if offset != session.offset:
+                raise HTTPException(status_code=409, detail=f"Part must start at offset {session.offset}")
+            await self._check_upload_data(session)
+
+            file = await asyncio.to_thread(session.open_for_append)
+            buffer = bytearray()
+            try:
+                async for chunk in request.stream():
+                    if session.size is not None and session.offset + len(buffer) + len(chunk) > session.size:
+                        raise HTTPException(status_code=413, detail=f"Upload is limited to {session.size} bytes")
+                    buffer += chunk
+                    if len(buffer) >= 1024 * 1024:  # 1 MB writes
+                        await asyncio.to_thread(session.append, file, bytes(buffer))
+                        buffer.clear()
+            except ClientDisconnect:
+                pass
+            finally:
+                if buffer:
+                    await asyncio.to_thread(session.append, file, bytes(buffer))
+                await asyncio.to_thread(file.close)
+                # Also keeps the session from looking abandoned
+                await asyncio.to_thread(session.save)
+        finally:
+            session.write_lock.release()
+        return session.to_dict()
+
+    # Endpoint 16: /api/uploads/{upload_id}
+    def upload_status_endpoint(self, upload_id: str):
+        """
+        Reports how many bytes have arrived, and the video hash once complete.
+        """
+        return self._upload_session(upload_id).to_dict()
+
+    # Endpoint 17: /api/uploads/{upload_id}/complete
+    async def complete_upload_endpoint(self, upload_id: str):
+        """
+        Stores the uploaded video under its content hash, like /analyze does.
+        Completing an upload twice returns the same result.
+        """
+        session = self._upload_session(upload_id)
+        if session.complete:
+            return session.to_dict()
+        if not session.write_lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="A part of this upload is still being written")
+        try:
+            if session.offset == 0 or (session.size is not None and session.offset != session.size):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Upload has {session.offset} of {session.size or 'at least 1'} bytes"
+                )
+            await self._check_upload_data(session)
+            video_hash = await asyncio.to_thread(session.hexdigest)
+            video_extension = os.path.splitext(session.filename)[1]
+            video_path = UPLOAD_DIR / shard_path(f"{video_hash[:32]}{video_extension}")
+            await asyncio.to_thread(move_into_place, session.part_path, video_path)
+            await asyncio.to_thread(session.finish, video_path, video_hash)
+        finally:
+            session.write_lock.release()
+        return session.to_dict()
+
+    # Endpoint 18: /api/uploads/{upload_id}/analyze
+    async def analyze_upload_endpoint(self,
+            upload_id: str,
+            options: VideoAnalysisOptions = Depends(video_analysis_options)
+    ):
+        """
+        /analyze for a resumable upload. It can be called before the upload
+        is complete: frames are then sampled from the file as it grows, so
+        results start arriving before the last byte does. Results for a
+        growing upload are stored under the upload id, because the content
+        hash is only known at the end.
+        """
+        session = self._upload_session(upload_id)
+        if session.complete:
+            await self._check_upload_data(session)
+            sampler = self._video_sampler(session.video_path, options)
+            content_key = session.video_hash
+        else:
+            sampler = self._video_sampler(session, options)
+            content_key = f"upload-{upload_id}"
+        job = await self._video_job(content_key, options, sampler)
+
+        async def generate_results():
+            # Waiting for the upload blocks a sampler thread, so use our own
+            # threads rather than the shared pool
+            executor = ThreadPoolExecutor(2, thread_name_prefix="upload-analysis")
+            try:
+                async for result in self._run_video_job(job, sampler, session.video_hash, options, executor):
+                    yield json.dumps(result) + "\n"
+            finally:
+                if isinstance(sampler, GrowingFileSampler):
+                    # Stops a sampler still waiting for data, e.g. after a client disconnect
+                    sampler.close()
+                executor.shutdown(wait=False, cancel_futures=True)
+
+        return StreamingResponse(generate_results(), media_type="application/json")
+
+    # Endpoint 19: /api/health/live
+    def liveness_endpoint(self):
+        """
+        Answers as long as the server is running, including during warm-up.
+        """
+        return {"status": "alive"}
+
+    # Endpoint 20: /api/health/ready
+    def readiness_endpoint(self):
+        """
+        200 once heavy imports are done and the warm-up models are loaded in
+        Ollama, 503 until then. Both report the warm-up progress.
+        """
+        status = self.warmup.status()
+        if not status["ready"]:
+            return JSONResponse(status_code=503, content=status)
+        return status
+
+    # Endpoint 21: /api/chat/sessions
+    def create_chat_session_endpoint(self, request_data: ChatSessionRequest):
+        """
+        Starts a server-side chat. Clients then send only each new message to
+        /chat/sessions/{session_id}/messages, and earlier turns are added
+        here. The session is kept within 'max_tokens', a quarter of which is
+        left for each reply, and replies are capped to fit it. Past that, the
+        oldest turns are dropped, or with 'summarize', folded into a running
+        summary.
+        'keep_alive' (by default the server's) is sent with every turn.
+        """
+        keep_alive = self.keep_alive if request_data.keep_alive is None else keep_alive_value(request_data.keep_alive)
+        session = self.chat_sessions.create(
+            model=request_data.model,
+            system=request_data.system,
+            keep_alive=keep_alive,
+            max_tokens=request_data.max_tokens,
+            summarize=request_data.summarize
+        )
+        return session.to_dict()
+
+    # Endpoint 22: /api/chat/sessions/{session_id}
+    def chat_session_endpoint(self, session_id: str):
+        """
+        Returns the session's settings, summary and the turns still in context.
+        """
+        session = self.chat_sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        return session.to_dict(include_messages=True)
+
+    # Endpoint 23: /api/chat/sessions/{session_id}
+    def delete_chat_session_endpoint(self, session_id: str):
+        if not self.chat_sessions.delete(session_id):
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        return {"success": True}
+
+    async def _acquire_chat_session(self, session_id: str) -> ChatSession:
+        session = await asyncio.to_thread(self.chat_sessions.acquire, session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Chat session not found")
+        return session
+
+    async def _session_history(self, session: ChatSession, prompt: str) -> List[dict]:
+        """
+        Makes room for 'prompt' in the session's token budget and returns the
+        messages to send before it. With 'summarize', dropped turns are folded
+        into the session's summary; if that call fails they are just dropped.
+        """
+        dropped = session.compact(estimate_tokens(prompt))
+        if not dropped:
+            return session.history()
+        mode = "truncate"
+        if session.summarize:
+            transcript = "\n".join(f"{message['role']}: {message['content']}" for message in dropped)
+            try:
+                response = await self._call_ollama_chat(
+                    summary_prompt(session.summary, transcript, max_words=session.max_tokens // 8),
+                    model=session.model, keep_alive=session.keep_alive
+                )
+                session.set_summary(response.get("message", {}).get("content", ""))
+                mode = "summarize"
+            except HTTPException as e:
+                print(f"Could not summarize chat session {session.session_id}: {e.detail}")
+        CHAT_COMPACTIONS.inc(mode=mode)
+        return session.history()
+
+    # Endpoint 24: /api/chat/sessions/{session_id}/messages
+    async def chat_session_message_endpoint(self, session_id: str, request_data: ChatRequest):
+        """
+        Sends 'prompt' as the session's next turn. Turns of one session run
+        one at a time, and a turn is only kept once the model has replied.
+        """
+        session = await self._acquire_chat_session(session_id)
+        try:
+            async with session.lock:
+                history = await self._session_history(session, request_data.prompt)
+                response = await self._call_ollama_chat(
+                    request_data.prompt, model=session.model, history=history, keep_alive=session.keep_alive,
+                    num_predict=session.reply_tokens
+                )
+                reply = response.get("message", {}).get("content", "")
+                session.add_turn(request_data.prompt, reply, response.get("eval_count"))
+        finally:
+            await asyncio.to_thread(self.chat_sessions.release, session)
+        return {"success": True, "data": response, "session": session.to_dict()}
+
+    # Endpoint 25: /api/chat/sessions/{session_id}/messages/stream
+    async def chat_session_stream_endpoint(self, session_id: str, request_data: ChatRequest, request: Request):
+        """
+        Streaming variant of /messages. The turn is kept only if the reply
+        was generated to the end.
+        """
+        session = await self._acquire_chat_session(session_id)
+        return await self._stream_response(request, self._session_turn_stream(session, request_data.prompt))
+
+    async def _session_turn_stream(self, session: ChatSession, prompt: str) -> AsyncIterator[dict]:
+        try:
+            async with session.lock:
+                history = await self._session_history(session, prompt)
+                chunks = self._call_ollama_chat_stream(
+                    prompt, model=session.model, history=history, keep_alive=session.keep_alive,
+                    num_predict=session.reply_tokens
+                )
+                parts = []
+                async with aclosing(chunks):
+                    async for chunk in chunks:
+                        parts.append(chunk.get("message", {}).get("content", ""))
+                        if chunk.get("done"):
+                            session.add_turn(prompt, "".join(parts), chunk.get("eval_count"))
+                        yield chunk
+        finally:
+            await asyncio.to_thread(self.chat_sessions.release, session)
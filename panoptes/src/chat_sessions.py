@@ -0,0 +1,300 @@
+"""Server-side multi-turn chat sessions, bounded in memory and spilled to disk."""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from metrics import REGISTRY
+from constants import (CHAT_MODEL, CHAT_SESSIONS_DIR, CHAT_SESSIONS_IN_MEMORY, CHAT_SESSION_TTL, CHAT_HISTORY_TOKENS,
+                       CHAT_COMPACT_TARGET, CHAT_CHARS_PER_TOKEN, CHAT_REPLY_SHARE)
+
+SESSION_ID = re.compile(r"[0-9a-f]{32}")
+# Per-message overhead of the chat template (role markers and separators), in tokens
+MESSAGE_OVERHEAD_TOKENS = 4
+
+CHAT_SESSIONS = REGISTRY.gauge("panoptes_chat_sessions_in_memory", "Chat sessions held in memory.")
+CHAT_SESSION_SPILLS = REGISTRY.counter(
+    "panoptes_chat_session_spills_total", "Chat sessions written to disk to make room in memory."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count of a message, for budgeting when Ollama has not
+    reported one.
+    """
+    return len(text) // CHAT_CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def summary_prompt(previous_summary: Optional[str], transcript: str, max_words: int) -> str:
+    earlier = f"Summary of the conversation before this part:\n{previous_summary}\n\n" if previous_summary else ""
+    return (
+        f"{earlier}Conversation:\n{transcript}\n\n"
+        f"Summarize the conversation above in at most {max_words} words. Keep names, facts, decisions and "
+        "open questions that later replies may need. Reply with the summary only."
+    )
+
+
+class ChatSession:
+    """
+    One conversation, kept on the server so clients send only the new message.
+    - 'messages' holds the turns still in context. Each has an estimated
+      token count, or Ollama's own count for replies.
+    - history() is what precedes the next prompt: the system prompt and any
+      summary of dropped turns, then 'messages'.
+    - 'keep_alive' is sent with every turn, so the model stays loaded
+      between turns for as long as this session expects to be used.
+    Ollama reuses its cache for the part of the prompt it has already seen,
+    as long as the model stays loaded. An unchanged history prefix therefore
+    costs nothing to prefill again, and each turn pays only for its new
+    messages. compact() exists to keep that prefix stable; see there.
+    """
+
+    def __init__(
+        self,
+        session_id: str,
+        model: str = CHAT_MODEL,
+        system: Optional[str] = None,
+        keep_alive: Optional[Union[str, float]] = None,
+        max_tokens: int = CHAT_HISTORY_TOKENS,
+        summarize: bool = False,
+        summary: Optional[str] = None,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        turns: int = 0,
+        created_at: Optional[float] = None,
+        last_used: Optional[float] = None
+    ):
+        self.session_id = session_id
+        self.model = model
+        self.system = system
+        self.keep_alive = keep_alive
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.summary = summary
+        self.messages = messages or []
+        self.turns = turns
+        self.created_at = created_at or time.time()
+        self.last_used = last_used or self.created_at
+        self.dirty = True
+        # One turn at a time, so replies land in the order their prompts were sent
+        self.lock = asyncio.Lock()
+        # Requests holding this session; see ChatSessionStore.acquire()
+        self.pins = 0
+
+    def _system_message(self) -> Optional[str]:
+        parts = [self.system] if self.system else []
+        if self.summary:
+            parts.append(f"Summary of the conversation so far:\n{self.summary}")
+        return "\n\n".join(parts) or None
+
+    def history(self) -> List[Dict[str, str]]:
+        system = self._system_message()
+        messages = [{"role": "system", "content": system}] if system else []
+        return messages + [{"role": m["role"], "content": m["content"]} for m in self.messages]
+
+    @property
+    def reply_tokens(self) -> int:
+        """
+        The longest reply a turn may generate, sent to Ollama as num_predict.
+        compact() keeps this much of 'max_tokens' free for it.
+        """
+        return int(self.max_tokens * CHAT_REPLY_SHARE)
+
+    def tokens(self) -> int:
+        system = self._system_message()
+        return (estimate_tokens(system) if system else 0) + sum(m["tokens"] for m in self.messages)
+
+    def compact(self, incoming_tokens: int) -> List[Dict[str, Any]]:
+        """
+        Makes room for a prompt of 'incoming_tokens' and its reply. If the
+        history, the prompt and 'reply_tokens' would go over 'max_tokens',
+        the oldest whole turns are dropped until the history and prompt are
+        down to CHAT_COMPACT_TARGET of what is left for them. The session
+        then stays within 'max_tokens' once the reply is added. Returns the
+        dropped messages, for summarizing.
+        Dropping a large block at once, rather than one turn per request,
+        means the history prefix, and Ollama's cache of it, changes only
+        every few turns instead of on every turn.
+        """
+        budget = self.max_tokens - self.reply_tokens - MESSAGE_OVERHEAD_TOKENS
+        if self.tokens() + incoming_tokens <= budget:
+            return []
+        target = budget * CHAT_COMPACT_TARGET
+        dropped = []
+        while self.messages and self.tokens() + incoming_tokens > target:
+            # A turn is a user message and the replies that follow it
+            dropped.append(self.messages.pop(0))
+            while self.messages and self.messages[0]["role"] != "user":
+                dropped.append(self.messages.pop(0))
+        self.dirty = True
+        return dropped
+
+    def add_turn(self, prompt: str, reply: str, reply_tokens: Optional[int] = None):
+        self.messages.append({"role": "user", "content": prompt, "tokens": estimate_tokens(prompt)})
+        tokens = reply_tokens + MESSAGE_OVERHEAD_TOKENS if reply_tokens else estimate_tokens(reply)
+        self.messages.append({"role": "assistant", "content": reply, "tokens": tokens})
+        self.turns += 1
+        self.last_used = time.time()
+        self.dirty = True
+
+    def set_summary(self, summary: str):
+        self.summary = summary.strip() or self.summary
+        self.dirty = True
+
+    def to_dict(self, include_messages: bool = False) -> Dict[str, Any]:
+        info = {
+            "session_id": self.session_id,
+            "model": self.model,
+            "system": self.system,
+            "keep_alive": self.keep_alive,
+            "max_tokens": self.max_tokens,
+            "summarize": self.summarize,
+            "summary": self.summary,
+            "turns": self.turns,
+            "tokens": self.tokens(),
+            "created_at": self.created_at,
+            "last_used": self.last_used
+        }
+        if include_messages:
+            info["messages"] = self.messages
+        return info
+
+    def save(self, path: Path):
+        state = self.to_dict(include_messages=True)
+        for key in ("session_id", "tokens"):
+            state.pop(key)
+        temp_path = path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(temp_path, path)
+        self.dirty = False
+
+    @classmethod
+    def load(cls, session_id: str, path: Path) -> "ChatSession":
+        with open(path, "r") as f:
+            session = cls(session_id, **json.load(f))
+        session.dirty = False
+        return session
+
+
+class ChatSessionStore:
+    """
+    Holds up to 'max_in_memory' ChatSessions, least recently used first.
+    - Past that limit, the least recently used session not in use is written
+      to 'directory' and dropped from memory. It is read back when next used.
+    - A request taking a turn holds the session with acquire() until
+      release(), so it is never evicted mid-turn and the turn is not lost.
+    - flush() writes every changed session, for shutdown.
+    - Sessions unused for 'ttl' seconds are deleted when new ones are created.
+    """
+
+    def __init__(
+        self,
+        directory: Path = CHAT_SESSIONS_DIR,
+        max_in_memory: int = CHAT_SESSIONS_IN_MEMORY,
+        ttl: float = CHAT_SESSION_TTL
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_in_memory = max_in_memory
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}.json"
+
+    def _evict(self):
+        # Sessions in use stay, even if that means going over for a while
+        idle = [s for s in self._sessions.values() if not s.pins]
+        for session in idle[:max(0, len(self._sessions) - self.max_in_memory)]:
+            if session.dirty:
+                session.save(self._path(session.session_id))
+                CHAT_SESSION_SPILLS.inc()
+            del self._sessions[session.session_id]
+        CHAT_SESSIONS.set(len(self._sessions))
+
+    def create(self, **settings) -> ChatSession:
+        self.remove_stale()
+        session = ChatSession(uuid.uuid4().hex, **settings)
+        with self._lock:
+            self._sessions[session.session_id] = session
+            self._evict()
+        return session
+
+    def get(self, session_id: str, pin: bool = False) -> Optional[ChatSession]:
+        if not SESSION_ID.fullmatch(session_id):
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                path = self._path(session_id)
+                if not path.exists():
+                    return None
+                session = ChatSession.load(session_id, path)
+                self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            session.pins += pin
+            self._evict()
+            return session
+
+    def acquire(self, session_id: str) -> Optional[ChatSession]:
+        """
+        get() for a request that will change the session; pair with release().
+        """
+        return self.get(session_id, pin=True)
+
+    def release(self, session: ChatSession):
+        with self._lock:
+            session.pins -= 1
+            self._evict()
+
+    def delete(self, session_id: str) -> bool:
+        if not SESSION_ID.fullmatch(session_id):
+            return False
+        with self._lock:
+            in_memory = self._sessions.pop(session_id, None) is not None
+            CHAT_SESSIONS.set(len(self._sessions))
+        path = self._path(session_id)
+        on_disk = path.exists()
+        path.unlink(missing_ok=True)
+        return in_memory or on_disk
+
+    def flush(self) -> int:
+        with self._lock:
+            dirty = [session for session in self._sessions.values() if session.dirty]
+            for session in dirty:
+                session.save(self._path(session.session_id))
+        return len(dirty)
+
+    def remove_stale(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [sid for sid, s in self._sessions.items() if s.last_used < cutoff and not s.pins]
+            for session_id in stale:
+                del self._sessions[session_id]
+                self._path(session_id).unlink(missing_ok=True)
+            in_memory = set(self._sessions)
+            CHAT_SESSIONS.set(len(self._sessions))
+        removed = len(stale)
+        for path in self.directory.glob("*.json"):
+            if path.stem in in_memory:
+                continue
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_memory = len(self._sessions)
+        return {"in_memory": in_memory, "max_in_memory": self.max_in_memory, "ttl": self.ttl}
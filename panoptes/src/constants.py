@@ -2,6 +2,8 @@ from pathlib import Path
 
 STORAGE_DIR = "./store"
 LOG_FILE = "./upload_log.json"
+UPLOAD_INDEX_FILE = "./upload_index.db"
+RESULT_CACHE_FILE = "./result_cache.db"
 SUPPORTED_IMAGE_TYPES = ["image/jpeg",
                          "image/png",
                          "image/bmp",
@@ -12,3 +14,97 @@ SUPPORTED_VIDEO_TYPES = ["video/mp4", "video/x-msvideo"]  # MP4 and AVI
 SUPPORTED_FILE_TYPES = SUPPORTED_IMAGE_TYPES + SUPPORTED_VIDEO_TYPES
 UPLOAD_DIR = Path("uploads")
 FRAMES_DIR = Path("frames")
+JOBS_DIR = Path("jobs")
+UPLOAD_SESSIONS_DIR = Path("upload_sessions")  # Resumable uploads in progress; outside every quota area and mount
+UPLOAD_SESSION_TTL = 24 * 3600  # Seconds an unfinished upload is kept without new parts
+UPLOAD_STREAM_MIN_BYTES = 1024 * 1024  # New data needed before each read of a growing upload
+UPLOAD_STALL_TIMEOUT = 300.0  # Seconds analysis of a growing upload waits for more data
+ANALYSIS_CONCURRENCY = 4  # Concurrent vision-model calls per video
+FRAME_JPEG_QUALITY = 95  # Single in-memory encode per sampled frame
+FRAME_SAMPLE_INTERVAL = 1.0  # Seconds between analyzed frames
+SCENE_CHANGE_THRESHOLD = 0.03  # Mean abs difference of 16x16 grayscale signatures
+ANALYSIS_BATCH_SIZE = 1  # Frames per vision-model request
+BATCH_MAX_WAIT = 0.05  # Seconds a partial batch waits for more frames
+ANALYSIS_STRUCTURED_OUTPUT = True  # Ask for JSON matching models.FrameAnalysis
+ANALYSIS_PARSE_RETRIES = 2  # Re-asks after a reply that does not parse
+
+# Frame preprocessing before inference
+FRAME_MAX_SIDE = 672  # Longest side sent to the vision model (LLaVA's largest input tile)
+CLAHE_CLIP_LIMIT = 2.0
+CLAHE_TILE_GRID = (8, 8)
+DENOISE_STRENGTH = 30  # Bilateral filter sigma for lightness; higher smooths more
+
+# Image payloads sent to the vision model
+PAYLOAD_MAX_BYTES = 192 * 1024  # Encoded size budget per image
+PAYLOAD_MIN_QUALITY = 40  # Below this, the image is shrunk instead
+PAYLOAD_FORMAT = "jpeg"
+PAYLOAD_FORMATS = ("jpeg", "webp")
+
+# Media serving for /uploads and /frames
+THUMBNAIL_DIR = Path("thumbs")
+THUMBNAIL_WIDTHS = (160, 320, 640)  # Requested widths are rounded up to one of these
+THUMBNAIL_DEFAULT_WIDTH = 320  # Width linked from analysis results
+THUMBNAIL_JPEG_QUALITY = 80
+THUMBNAIL_CACHE_MAX_BYTES = 256 * 1024 * 1024
+THUMBNAIL_ORIGINALS_MAX = 10_000  # Sources remembered as small enough to serve as they are
+MEDIA_CHUNK_SIZE = 1024 * 1024  # Bytes per read when the server cannot send files itself
+UPLOAD_MAX_AGE = 365 * 24 * 3600  # Seconds; uploads are named by content hash and never change
+FRAME_MAX_AGE = 3600  # Seconds; previews are rewritten when a job is re-run
+
+# Storage quotas and eviction for store/, uploads/, frames/ and jobs/
+STORAGE_QUOTAS = {
+    "store": 20 * 1024 ** 3,  # Uploaded images and files
+    "uploads": 50 * 1024 ** 3,  # Uploaded videos
+    "frames": 20 * 1024 ** 3,  # Video jobs: frame previews and stored results
+}
+STORAGE_TTL = 30 * 24 * 3600  # Seconds unused before anything is deleted
+STORAGE_MIN_AGE = 3600  # Seconds; anything used more recently is never evicted
+STORAGE_TEMP_MAX_AGE = 3600  # Seconds before a temp_ file counts as an abandoned upload
+STORAGE_SWEEP_INTERVAL = 600  # Seconds between sweeps
+STORAGE_LOW_WATERMARK = 0.9  # An area over quota is trimmed to this fraction of it
+STORAGE_SHARD_LEVELS = 2  # Subdirectory levels, 256 directories each
+
+# Analysis result cache
+RESULT_CACHE_MAX_ENTRIES = 100_000
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+RESULT_CACHE_TTL = 7 * 24 * 3600  # Seconds
+
+# Default models
+CHAT_MODEL = "llama3.2"
+VISION_MODEL = "llava:latest"
+
+# Server-side chat sessions
+CHAT_SESSIONS_DIR = Path("chat_sessions")  # Sessions spilled from memory
+CHAT_SESSIONS_IN_MEMORY = 256  # Least recently used sessions beyond this are written to disk
+CHAT_SESSION_TTL = 7 * 24 * 3600  # Seconds an unused session is kept
+CHAT_HISTORY_TOKENS = 1536  # Session budget, reply included; fits Ollama's default 2048-token context
+CHAT_REPLY_SHARE = 0.25  # Fraction of the budget kept free for each reply, which is capped to fit it
+CHAT_COMPACT_TARGET = 0.5  # Fraction of the budget kept when a session's history is compacted
+CHAT_CHARS_PER_TOKEN = 4  # For estimating tokens of text Ollama has not counted
+
+# Shared Ollama HTTP clients, one per backend
+OLLAMA_MAX_CONNECTIONS = 100     # Pool size per backend
+OLLAMA_MAX_KEEPALIVE = 20        # Idle connections kept open for reuse, per backend
+OLLAMA_TIMEOUT = 120.0           # Seconds to wait for a model response
+OLLAMA_CONNECT_TIMEOUT = 10.0
+OLLAMA_RETRIES = 3               # Retries after the first attempt
+OLLAMA_BACKOFF = 0.5             # Base delay in seconds, doubled per retry
+OLLAMA_MAX_INFLIGHT = 16         # Concurrent model calls per backend, across all requests and jobs
+
+# Ollama backend pool
+OLLAMA_HEALTH_INTERVAL = 10.0    # Seconds between /api/tags health checks
+OLLAMA_MAX_FAILURES = 3          # Consecutive failures before a backend is ejected
+OLLAMA_EJECT_SECONDS = 30.0      # How long an ejected backend gets no traffic
+
+# Startup warm-up and model residency
+OLLAMA_KEEP_ALIVE = "30m"        # How long Ollama keeps a model loaded after its last request; "-1" is forever
+WARMUP_MODELS = (CHAT_MODEL, VISION_MODEL)  # Loaded before the server reports ready
+WARMUP_MODULES = ("numpy", "cv2")  # Heavy imports deferred at startup, loaded during warm-up
+WARMUP_RETRY_INTERVAL = 5.0      # Seconds between attempts to load a model that failed to load
+WARMUP_REFRESH_INTERVAL = 600.0  # Seconds between reloads that restart the keep-alive timer; 0 disables
+
+# Background video analysis jobs
+JOB_WORKERS = 2                  # Jobs analyzed at the same time
+JOB_DECODE_WORKERS = 4           # Threads shared by all jobs for decoding and preprocessing
+JOB_QUEUE_SIZE = 100             # Queued jobs before submissions are rejected
+JOB_FINISHED_KEPT = 100          # Finished jobs kept in memory; older ones are answered from jobs/
@@ -0,0 +1,59 @@
+"""Groups concurrent per-frame analysis calls into batched model requests."""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+
+from constants import BATCH_MAX_WAIT
+
+
+class FrameBatcher:
+    """
+    Collects items passed to submit() and hands them to 'analyze_batch' in
+    groups of up to 'batch_size'. A partial batch is sent once its oldest item
+    has waited 'max_wait' seconds, so the tail of a video is not held back.
+    'analyze_batch(items)' must return one result per item, in order.
+    """
+
+    def __init__(
+        self,
+        analyze_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+        batch_size: int,
+        max_wait: float = BATCH_MAX_WAIT
+    ):
+        self.analyze_batch = analyze_batch
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[tuple]):
+        try:
+            results = await self.analyze_batch([item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
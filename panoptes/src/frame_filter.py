@@ -0,0 +1,45 @@
+"""Cheap frame signatures for skipping near-duplicate frames before inference."""
+from __future__ import annotations
+
+from util import LazyModule
+from constants import SCENE_CHANGE_THRESHOLD
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+SIGNATURE_SIZE = 16
+
+
+def frame_signature(frame, size: int = SIGNATURE_SIZE) -> np.ndarray:
+    """
+    Downscales a BGR frame to a size x size grayscale thumbnail in [0, 1].
+    INTER_AREA averages each block, so sensor noise mostly cancels out.
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA)
+    return small.astype(np.float32) / 255.0
+
+
+class SceneChangeFilter:
+    """
+    Flags frames that look like the last analyzed frame.
+    Frames are compared with the last frame that was *not* similar, rather
+    than the previous frame, so slow drift still triggers a new analysis.
+    """
+
+    def __init__(self, threshold: float = SCENE_CHANGE_THRESHOLD, size: int = SIGNATURE_SIZE):
+        self.threshold = threshold
+        self.size = size
+        self._reference = None
+
+    def is_similar(self, frame) -> bool:
+        """
+        Returns True if 'frame' is within the threshold of the reference frame;
+        otherwise makes 'frame' the new reference and returns False.
+        """
+        signature = frame_signature(frame, self.size)
+        if self._reference is not None:
+            if float(np.mean(np.abs(signature - self._reference))) <= self.threshold:
+                return True
+        self._reference = signature
+        return False
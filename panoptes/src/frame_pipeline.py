@@ -0,0 +1,145 @@
+"""Bounded-concurrency pipeline for per-frame video analysis."""
+import asyncio
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Optional, Tuple
+
+from constants import ANALYSIS_CONCURRENCY
+
+_DONE = object()
+_SIMILAR = object()
+
+
+class FramePipeline:
+    """
+    Runs frame analysis as three overlapping stages:
+    1. A decoder producer pulls (seq, frame) pairs from 'frames' in a worker thread.
+    2. 'preprocess(seq, frame)' prepares each frame in a worker thread; returning
+       None drops the frame.
+    Worker threads come from 'executor', or the event loop's default executor.
+    3. 'analyze(seq, item)' is awaited for up to 'concurrency' frames at once.
+
+    Results come out of run() in 'seq' order when 'ordered' is True, otherwise
+    as soon as each one finishes; callers tag results with 'seq' so clients can
+    re-order them.
+
+    With a 'frame_filter' (see frame_filter.SceneChangeFilter), frames it finds
+    similar to the last analyzed frame skip preprocessing and the model call;
+    their result is 'reuse(seq, source_seq, source_result)' instead.
+    """
+
+    def __init__(
+        self,
+        frames: Iterable[Tuple[int, Any]],
+        analyze: Callable[[int, Any], Awaitable[Any]],
+        preprocess: Optional[Callable[[int, Any], Any]] = None,
+        frame_filter: Optional[Any] = None,
+        reuse: Optional[Callable[[int, int, Any], Any]] = None,
+        concurrency: int = ANALYSIS_CONCURRENCY,
+        ordered: bool = True,
+        prefetch: Optional[int] = None,
+        executor: Optional[Executor] = None,
+    ):
+        self.frames = frames
+        self.analyze = analyze
+        self.preprocess = preprocess
+        self.frame_filter = frame_filter
+        self.reuse = reuse or (lambda seq, source_seq, result: result)
+        self.concurrency = max(1, concurrency)
+        self.ordered = ordered
+        # Decoded frames buffered ahead of the model stage
+        self.prefetch = prefetch or self.concurrency * 2
+        self.executor = executor
+
+    def _in_thread(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _produce(self, decoded: asyncio.Queue):
+        iterator = iter(self.frames)
+        try:
+            while True:
+                entry = await self._in_thread(next, iterator, _DONE)
+                await decoded.put(entry)
+                if entry is _DONE:
+                    return
+        except Exception as exc:
+            await decoded.put(exc)
+
+    async def _run_one(self, seq: int, item: Any, slots: asyncio.Semaphore):
+        try:
+            return await self.analyze(seq, item)
+        finally:
+            slots.release()
+
+    async def _reuse_one(self, seq: int, source_seq: int, source: asyncio.Task):
+        # Shielded so a cancelled duplicate never cancels the frame it copies
+        result = await asyncio.shield(source)
+        return self.reuse(seq, source_seq, result)
+
+    def _prepare(self, seq: int, frame: Any):
+        if self.frame_filter is not None and frame is not None and self.frame_filter.is_similar(frame):
+            return _SIMILAR
+        if self.preprocess is not None:
+            return self.preprocess(seq, frame)
+        return frame
+
+    async def _dispatch(self, decoded: asyncio.Queue, results: asyncio.Queue):
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        source = None  # (seq, task) of the last frame sent to the model
+        try:
+            while (entry := await decoded.get()) is not _DONE:
+                if isinstance(entry, Exception):
+                    raise entry
+
+                seq, frame = entry
+                if self.preprocess is None and self.frame_filter is None:
+                    item = frame
+                else:
+                    item = await self._in_thread(self._prepare, seq, frame)
+                    if item is None:
+                        continue
+
+                if item is _SIMILAR:
+                    if source is None:
+                        # The frame it matched was dropped by preprocessing
+                        continue
+                    # No model slot needed; the result is copied from 'source'
+                    task = asyncio.create_task(self._reuse_one(seq, *source))
+                else:
+                    # Wait for a free model slot before taking on another frame
+                    await slots.acquire()
+                    task = asyncio.create_task(self._run_one(seq, item, slots))
+                    source = (seq, task)
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                if self.ordered:
+                    results.put_nowait(task)
+                else:
+                    task.add_done_callback(results.put_nowait)
+
+            if tasks:
+                await asyncio.wait(set(tasks))
+            results.put_nowait(_DONE)
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        except Exception as exc:
+            results.put_nowait(exc)
+
+    async def run(self) -> AsyncIterator[Any]:
+        decoded = asyncio.Queue(maxsize=self.prefetch)
+        results = asyncio.Queue()
+        producer = asyncio.create_task(self._produce(decoded))
+        dispatcher = asyncio.create_task(self._dispatch(decoded, results))
+
+        try:
+            while (entry := await results.get()) is not _DONE:
+                if isinstance(entry, Exception):
+                    raise entry
+                yield await entry
+        finally:
+            # Also reached when the consumer stops early (e.g. client disconnect)
+            producer.cancel()
+            dispatcher.cancel()
+            await asyncio.gather(producer, dispatcher, return_exceptions=True)
@@ -0,0 +1,149 @@
+"""Configurable preprocessing chain applied to frames before model inference."""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Executor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from frame_sampler import correct_orientation
+from util import LazyModule
+from constants import FRAME_MAX_SIDE, FRAME_JPEG_QUALITY, CLAHE_CLIP_LIMIT, CLAHE_TILE_GRID, DENOISE_STRENGTH
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+# Scratch buffers kept per thread; sizes seen at once before they are dropped
+_MAX_BUFFERS = 32
+
+_local = threading.local()
+
+
+def _buffer(name: str, shape: Tuple[int, ...]) -> np.ndarray:
+    """
+    Returns this thread's uint8 scratch buffer for ('name', 'shape').
+    """
+    buffers = getattr(_local, "buffers", None)
+    if buffers is None:
+        buffers = _local.buffers = {}
+    key = (name, shape)
+    buffer = buffers.get(key)
+    if buffer is None:
+        if len(buffers) >= _MAX_BUFFERS:
+            buffers.clear()
+        buffer = buffers[key] = np.empty(shape, np.uint8)
+    return buffer
+
+
+def _clahe(clip_limit: float, tile_grid: Tuple[int, int]):
+    """
+    Returns this thread's CLAHE object for the given settings; a CLAHE object
+    keeps internal state, so it is reused per thread rather than shared.
+    """
+    objects = getattr(_local, "clahe", None)
+    if objects is None:
+        objects = _local.clahe = {}
+    key = (clip_limit, tuple(tile_grid))
+    if key not in objects:
+        objects[key] = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid))
+    return objects[key]
+
+
+class FramePreprocessor:
+    """
+    Runs BGR frames through a chain of steps, each of which can be turned off:
+    1. orient: rotate portrait frames to landscape and flip upside-down ones
+       (see frame_sampler.correct_orientation).
+    2. downscale: shrink so the longer side is at most 'max_side' pixels,
+       the model's input resolution. Frames are never upscaled.
+    3. denoise: edge-preserving bilateral filter on the lightness channel,
+       before CLAHE amplifies the noise. Off by default.
+    4. clahe: contrast-limited histogram equalization of the lightness channel.
+    Intermediate images go into per-thread buffers reused across frames of the
+    same size, and each thread keeps its own CLAHE object. OpenCV releases the
+    GIL, so batches scale across a thread pool (see encode_batch).
+    """
+
+    def __init__(
+        self,
+        orient: bool = True,
+        max_side: Optional[int] = FRAME_MAX_SIDE,
+        denoise: bool = False,
+        clahe: bool = True,
+        clip_limit: float = CLAHE_CLIP_LIMIT,
+        tile_grid: Tuple[int, int] = CLAHE_TILE_GRID,
+        denoise_strength: float = DENOISE_STRENGTH,
+        jpeg_quality: int = FRAME_JPEG_QUALITY
+    ):
+        self.max_side = max_side
+        self.denoise = denoise
+        self.clahe = clahe
+        self.clip_limit = clip_limit
+        self.tile_grid = tuple(tile_grid)
+        self.denoise_strength = denoise_strength
+        self.jpeg_quality = jpeg_quality
+
+        self.steps: List[Callable[[np.ndarray], np.ndarray]] = []
+        if orient:
+            self.steps.append(self._orient)
+        if max_side:
+            self.steps.append(self._downscale)
+        if denoise or clahe:
+            self.steps.append(self._enhance)
+
+    def _orient(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        rotated_shape = frame.shape if width > height else (width, height) + frame.shape[2:]
+        return correct_orientation(frame, dst=_buffer("oriented", rotated_shape))
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        scale = self.max_side / max(height, width)
+        if scale >= 1:
+            return frame
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(
+            frame, size, dst=_buffer("downscaled", (size[1], size[0]) + frame.shape[2:]),
+            interpolation=cv2.INTER_AREA
+        )
+
+    def _enhance(self, frame: np.ndarray) -> np.ndarray:
+        # Work on the L channel of LAB in place, without splitting and merging planes
+        lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB, dst=_buffer("lab", frame.shape))
+        lightness = cv2.extractChannel(lab, 0, dst=_buffer("lightness", frame.shape[:2]))
+        if self.denoise:
+            lightness = cv2.bilateralFilter(
+                lightness, 5, self.denoise_strength, 5, dst=_buffer("denoised", frame.shape[:2])
+            )
+        if self.clahe:
+            _clahe(self.clip_limit, self.tile_grid).apply(lightness, dst=lightness)
+        cv2.insertChannel(lightness, lab, 0)
+        return cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=_buffer("enhanced", frame.shape))
+
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        """
+        Runs the chain on one frame. The result may be a per-thread buffer that
+        the next call on the same thread overwrites; copy it to keep it.
+        """
+        for step in self.steps:
+            frame = step(frame)
+        return frame
+
+    def encode(self, frame: np.ndarray) -> Optional[bytes]:
+        """
+        Runs the chain and JPEG-encodes the result; None if encoding fails.
+        """
+        success, encoded = cv2.imencode(".jpg", self.apply(frame), [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        return encoded.tobytes() if success else None
+
+    def apply_batch(self, frames: Iterable[np.ndarray], executor: Optional[Executor] = None) -> List[np.ndarray]:
+        """
+        Preprocesses 'frames', in parallel when an executor is given; results are copies.
+        """
+        apply = lambda frame: self.apply(frame).copy()
+        return list(executor.map(apply, frames) if executor is not None else map(apply, frames))
+
+    def encode_batch(self, frames: Iterable[np.ndarray], executor: Optional[Executor] = None) -> List[Optional[bytes]]:
+        """
+        Preprocesses and encodes 'frames', in parallel when an executor is given.
+        """
+        return list(executor.map(self.encode, frames) if executor is not None else map(self.encode, frames))
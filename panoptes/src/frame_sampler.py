@@ -0,0 +1,112 @@
+"""Samples video frames at a fixed rate, decoding only the frames that are used."""
+from typing import Iterator, Optional, Tuple, Union
+
+from util import LazyModule
+from constants import FRAME_SAMPLE_INTERVAL
+
+cv2 = LazyModule("cv2")
+
+SAMPLE_MODES = ("grab", "seek")
+
+
+def correct_orientation(frame, dst=None):
+    """
+    Rotates portrait frames to landscape and flips landscape frames that look
+    upside down. A rotated frame is written to 'dst' when given.
+    """
+    height, width = frame.shape[:2]
+
+    if width > height:
+        # Landscape mode
+        if frame[0, 0][0] > frame[-1, -1][0]:  # Rough check for upside-down
+            frame = cv2.rotate(frame, cv2.ROTATE_180, dst=dst)
+
+    else:
+        # Portrait mode, rotate 90 degrees
+        frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE, dst=dst)
+
+    return frame
+
+
+class FrameSampler:
+    """
+    Iterates over (second, frame) pairs sampled every 'interval' seconds.
+    - "grab" mode advances past skipped frames with cap.grab(), which demuxes
+      without decoding, and only retrieves the sampled frames.
+    - "seek" mode jumps straight to each timestamp with CAP_PROP_POS_MSEC,
+      which is cheaper when samples are several keyframes apart.
+    Orientation correction is applied to sampled frames only.
+    """
+
+    def __init__(
+        self,
+        video_path: str,
+        every_seconds: Optional[float] = None,
+        per_second: Optional[float] = None,
+        mode: str = "grab",
+        orient: bool = True,
+        start_index: int = 0
+    ):
+        if mode not in SAMPLE_MODES:
+            raise ValueError(f"Unknown sample mode '{mode}', expected one of {SAMPLE_MODES}")
+        if per_second:
+            self.interval = 1.0 / per_second
+        else:
+            self.interval = every_seconds or FRAME_SAMPLE_INTERVAL
+        if self.interval <= 0:
+            raise ValueError("Sampling interval must be positive")
+
+        self.video_path = str(video_path)
+        self.mode = mode
+        self.orient = orient
+        # Index of the first sample to decode, for resuming part-way through
+        self.start_index = start_index
+
+    def second_at(self, index: int) -> Union[int, float]:
+        """
+        Timestamp in seconds of the sample at 'index'.
+        """
+        second = round(index * self.interval, 3)
+        return int(second) if second.is_integer() else second
+
+    def _grab_frames(self, cap) -> Iterator[Tuple[int, object]]:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 1.0
+        position = 0
+        index = self.start_index
+        if index:
+            position = round(index * self.interval * fps)
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+        while True:
+            target = round(index * self.interval * fps)
+            while position < target:
+                if not cap.grab():
+                    return
+                position += 1
+
+            success, frame = cap.read()
+            if not success:
+                return
+            position += 1
+            yield index, frame
+            index += 1
+
+    def _seek_frames(self, cap) -> Iterator[Tuple[int, object]]:
+        index = self.start_index
+        while True:
+            cap.set(cv2.CAP_PROP_POS_MSEC, index * self.interval * 1000)
+            success, frame = cap.read()
+            if not success:
+                return
+            yield index, frame
+            index += 1
+
+    def __iter__(self) -> Iterator[Tuple[Union[int, float], object]]:
+        cap = cv2.VideoCapture(self.video_path)
+        try:
+            frames = self._grab_frames(cap) if self.mode == "grab" else self._seek_frames(cap)
+            for index, frame in frames:
+                if frame is not None and self.orient:
+                    frame = correct_orientation(frame)
+                yield self.second_at(index), frame
+        finally:
+            cap.release()
@@ -0,0 +1,157 @@
+"""Encodes images for vision-model requests within a size and byte budget."""
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, Optional
+
+from util import LazyModule
+from constants import (FRAME_MAX_SIDE, FRAME_JPEG_QUALITY, PAYLOAD_MAX_BYTES, PAYLOAD_MIN_QUALITY, PAYLOAD_FORMAT,
+                       PAYLOAD_FORMATS)
+
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+
+# Extension and the name of the cv2 quality flag, looked up when first encoding
+_ENCODE_PARAMS = {
+    "jpeg": (".jpg", "IMWRITE_JPEG_QUALITY"),
+    "webp": (".webp", "IMWRITE_WEBP_QUALITY"),
+}
+
+
+class ImagePayload:
+    """
+    An encoded image and how it was produced. 'image_format' is "original"
+    when the input bytes were sent as they were.
+    """
+
+    def __init__(self, data: bytes, image_format: str, quality: Optional[int], width: Optional[int],
+                 height: Optional[int], original_bytes: int, encode_ms: float):
+        self.data = data
+        self.image_format = image_format
+        self.quality = quality
+        self.width = width
+        self.height = height
+        self.original_bytes = original_bytes
+        self.encode_ms = encode_ms
+
+    @property
+    def extension(self) -> str:
+        return _ENCODE_PARAMS[self.image_format][0] if self.image_format in _ENCODE_PARAMS else ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bytes": len(self.data),
+            "original_bytes": self.original_bytes,
+            "format": self.image_format,
+            "quality": self.quality,
+            "width": self.width,
+            "height": self.height,
+            "encode_ms": round(self.encode_ms, 2)
+        }
+
+
+class PayloadOptimizer:
+    """
+    Encodes images as small as the vision model needs them; models such as
+    llava resize to their own input resolution anyway.
+    - Images are shrunk so the longer side is at most 'max_side' pixels.
+    - The highest quality in ['min_quality', 'max_quality'] whose encoding fits
+      in 'max_bytes' is found by binary search, starting with 'max_quality'.
+    - If even 'min_quality' does not fit, the image is shrunk by a quarter and
+      searched again.
+    'image_format' is "jpeg" or "webp"; WebP is smaller at the same quality,
+    but older Ollama builds only decode JPEG and PNG.
+    """
+
+    def __init__(
+        self,
+        max_side: Optional[int] = FRAME_MAX_SIDE,
+        max_bytes: int = PAYLOAD_MAX_BYTES,
+        image_format: str = PAYLOAD_FORMAT,
+        max_quality: int = FRAME_JPEG_QUALITY,
+        min_quality: int = PAYLOAD_MIN_QUALITY
+    ):
+        if image_format not in PAYLOAD_FORMATS:
+            raise ValueError(f"Unknown image format '{image_format}', expected one of {PAYLOAD_FORMATS}")
+        self.max_side = max_side
+        self.max_bytes = max_bytes
+        self.image_format = image_format
+        self.max_quality = max_quality
+        self.min_quality = min(min_quality, max_quality)
+
+    def _encode_at(self, image: np.ndarray, quality: int) -> Optional[bytes]:
+        extension, flag = _ENCODE_PARAMS[self.image_format]
+        success, encoded = cv2.imencode(extension, image, [getattr(cv2, flag), quality])
+        return encoded.tobytes() if success else None
+
+    def _fit_quality(self, image: np.ndarray):
+        """
+        Returns (data, quality) for the best quality within budget, or the
+        'min_quality' encoding with quality None when nothing fits.
+        """
+        data = self._encode_at(image, self.max_quality)
+        if data is None or len(data) <= self.max_bytes:
+            return data, self.max_quality
+
+        best = None
+        low, high = self.min_quality, self.max_quality - 1
+        smallest = None
+        while low <= high:
+            quality = (low + high) // 2
+            data = self._encode_at(image, quality)
+            if data is not None and len(data) <= self.max_bytes:
+                best = (data, quality)
+                low = quality + 1
+            else:
+                if quality == self.min_quality:
+                    smallest = data
+                high = quality - 1
+        return best or (smallest, None)
+
+    def _shrink(self, image: np.ndarray, max_side: int) -> np.ndarray:
+        height, width = image.shape[:2]
+        scale = max_side / max(height, width)
+        if scale >= 1:
+            return image
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+    def encode(self, image: np.ndarray, original_bytes: Optional[int] = None) -> ImagePayload:
+        """
+        Encodes a decoded BGR image within the budget.
+        """
+        start = time.perf_counter()
+        if original_bytes is None:
+            original_bytes = image.nbytes
+        if self.max_side:
+            image = self._shrink(image, self.max_side)
+        while True:
+            data, quality = self._fit_quality(image)
+            height, width = image.shape[:2]
+            if quality is not None or max(height, width) <= 64:
+                break
+            # Even the lowest quality is over budget: trade resolution for it
+            image = self._shrink(image, max(64, int(max(height, width) * 0.75)))
+        if data is None:
+            raise ValueError("Failed to encode image")
+        return ImagePayload(
+            data, self.image_format, quality or self.min_quality, width, height, original_bytes,
+            (time.perf_counter() - start) * 1000
+        )
+
+    def optimize(self, data: bytes) -> ImagePayload:
+        """
+        Re-encodes already-encoded image bytes that exceed the byte budget.
+        Images within budget, and data OpenCV cannot decode, are sent as is.
+        """
+        start = time.perf_counter()
+        image = None
+        if len(data) > self.max_bytes:
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            return ImagePayload(data, "original", None, None, None, len(data), (time.perf_counter() - start) * 1000)
+
+        payload = self.encode(image, original_bytes=len(data))
+        # Include the decode in the reported time
+        payload.encode_ms = (time.perf_counter() - start) * 1000
+        return payload
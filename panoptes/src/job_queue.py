@@ -0,0 +1,174 @@
+"""Background queue and worker pool for video analysis jobs."""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from constants import JOB_WORKERS, JOB_DECODE_WORKERS, JOB_QUEUE_SIZE, JOB_FINISHED_KEPT
+
+# Statuses a job can be resubmitted from
+FINISHED_STATUSES = ("complete", "partial", "failed")
+
+
+class JobRecord:
+    """
+    In-memory status and results of one submitted job.
+    Results are appended as the worker produces them; follow() lets any
+    number of readers stream them while the job runs.
+    """
+
+    def __init__(self, job_id: str, info: Optional[Dict[str, Any]] = None):
+        self.job_id = job_id
+        self.info = info or {}
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.results: List[dict] = []
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Condition()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def add_result(self, result: dict):
+        self.results.append(result)
+        await self._notify()
+
+    async def set_status(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        if status == "running":
+            self.started_at = time.time()
+        elif self.finished:
+            self.finished_at = time.time()
+        await self._notify()
+
+    async def follow(self) -> AsyncIterator[dict]:
+        """
+        Yields every result so far, then new ones until the job finishes.
+        """
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: sent < len(self.results) or self.finished)
+                pending = self.results[sent:]
+                finished = self.finished
+            for result in pending:
+                yield result
+            sent += len(pending)
+            if finished and sent == len(self.results):
+                return
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "error": self.error,
+            "results": len(self.results),
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            **self.info
+        }
+
+
+class AnalysisJobQueue:
+    """
+    Runs video analysis jobs in the background instead of inside the HTTP response.
+    - submit() queues a job and returns its JobRecord straight away.
+    - 'workers' coroutines take jobs off a bounded local queue; when it is
+      full, submit() raises asyncio.QueueFull.
+    - Decoding and preprocessing for every job share one pool of
+      'decode_workers' threads (OpenCV releases the GIL).
+    - Only the 'max_finished' most recently finished records are kept, so
+      their results do not pile up in memory; older jobs are gone from
+      get() and their results are read back from disk instead.
+    Total model calls across jobs are bounded by OllamaBase.model_slots.
+
+    'run_job(*args, executor=...)' is an async generator of result dicts; a
+    job is "partial" if any result has a status other than "success".
+    """
+
+    def __init__(
+        self,
+        run_job: Callable[..., AsyncIterator[dict]],
+        workers: int = JOB_WORKERS,
+        decode_workers: int = JOB_DECODE_WORKERS,
+        max_queued: int = JOB_QUEUE_SIZE,
+        max_finished: int = JOB_FINISHED_KEPT
+    ):
+        self.run_job = run_job
+        self.workers = workers
+        self.decode_workers = decode_workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self.jobs: Dict[str, JobRecord] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        self._executor = ThreadPoolExecutor(self.decode_workers, thread_name_prefix="analysis")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        return self.jobs.get(job_id)
+
+    def submit(self, job_id: str, *args, info: Optional[Dict[str, Any]] = None) -> JobRecord:
+        """
+        Queues 'run_job(*args)' under 'job_id'. A job that is already queued,
+        running or complete is returned as-is instead of being queued again.
+        """
+        self.start()
+        record = self.jobs.get(job_id)
+        if record is not None and record.status in ("queued", "running", "complete"):
+            return record
+
+        record = JobRecord(job_id, info)
+        self._queue.put_nowait((record, args))
+        # Re-inserted at the end, so self.jobs stays in submission order
+        self.jobs.pop(job_id, None)
+        self.jobs[job_id] = record
+        return record
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, record in self.jobs.items() if record.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self.jobs[job_id]
+
+    async def _worker(self):
+        while True:
+            record, args = await self._queue.get()
+            try:
+                await record.set_status("running")
+                failed = False
+                async for result in self.run_job(*args, executor=self._executor):
+                    failed = failed or result.get("status") != "success"
+                    await record.add_result(result)
+                await record.set_status("partial" if failed else "complete")
+            except asyncio.CancelledError:
+                await record.set_status("failed", "Server shutting down")
+                raise
+            except Exception as e:
+                await record.set_status("failed", str(e))
+            finally:
+                self._queue.task_done()
+                self._forget_finished()
@@ -0,0 +1,104 @@
+"""On-disk state for resumable video analysis jobs."""
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Union
+
+from constants import JOBS_DIR
+
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class VideoJob:
+    """
+    A video analysis job persisted under its own directory:
+    - results.ndjson: one result line per analyzed second, appended as each
+      one finishes (not necessarily in order).
+    - state.json: written once every second has been analyzed.
+    """
+
+    def __init__(self, key: str, job_dir: Path):
+        self.key = key
+        self.dir = job_dir
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.results_path = self.dir / "results.ndjson"
+        self.state_path = self.dir / "state.json"
+        self._lock = threading.Lock()
+
+    @property
+    def complete(self) -> bool:
+        if not self.state_path.exists():
+            return False
+        with open(self.state_path, "r") as f:
+            return json.load(f).get("complete", False)
+
+    def results(self) -> Dict[Union[int, float], dict]:
+        """
+        Returns the stored results keyed by second. A line cut short by a crash
+        is removed from the file, and a second stored twice keeps its latest result.
+        """
+        results = {}
+        if not self.results_path.exists():
+            return results
+        with self._lock, open(self.results_path, "rb+") as f:
+            data = f.read()
+            # Drop a partial last line so the next append starts on a fresh line
+            if data and not data.endswith(b"\n"):
+                data = data[:data.rfind(b"\n") + 1]
+                f.truncate(len(data))
+
+        for line in data.splitlines():
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            results[result["frame"]["second"]] = result
+        return results
+
+    def append(self, result: dict):
+        line = json.dumps(result) + "\n"
+        with self._lock, open(self.results_path, "a") as f:
+            f.write(line)
+
+    def mark_complete(self, **info):
+        temp_path = self.state_path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump({"complete": True, **info}, f)
+        os.replace(temp_path, self.state_path)
+
+
+class VideoJobStore:
+    """
+    Maps (video content hash, object, sampling interval, analysis settings)
+    to a VideoJob, so the same video and question share one set of results
+    whatever the filename.
+    """
+
+    def __init__(self, jobs_dir: Path = JOBS_DIR):
+        self.jobs_dir = Path(jobs_dir)
+        self._jobs: Dict[str, VideoJob] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def job_key(video_hash: str, object_str: str, interval: float, **settings) -> str:
+        """
+        The interval is part of the key because it decides which seconds
+        exist; 'settings' are any other options that change the results, so
+        a run with different ones never replays or resumes this one.
+        """
+        raw = f"{video_hash}\0{object_str.strip().lower()}\0{interval}"
+        if settings:
+            raw += "\0" + json.dumps(settings, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, key: str) -> VideoJob:
+        # One VideoJob per key so concurrent requests share its append lock;
+        # one the storage sweep evicted starts over
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is None or not job.dir.is_dir():
+                job = self._jobs[key] = VideoJob(key, self.jobs_dir / key)
+            return job
@@ -1,28 +1,67 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 
 from pathlib import Path
 from dotenv import load_dotenv
 
 from chat_api import ChatAPI, router
+from media import MediaFiles, ThumbnailCache
+from metrics import HTTPMetricsMiddleware
 from bootstrap import prep
+from constants import (UPLOAD_DIR, FRAMES_DIR, THUMBNAIL_DIR, UPLOAD_MAX_AGE, FRAME_MAX_AGE, OLLAMA_KEEP_ALIVE,
+                       WARMUP_MODELS)
 
 load_dotenv()
 OLLAMA_API_KEY = os.getenv("OLLAMA_API_KEY", "")
+# One host, or several separated by commas to spread calls across them
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# How long Ollama keeps a model loaded after its last use: "30m", seconds, or "-1" for forever
+KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", OLLAMA_KEEP_ALIVE)
+# Models loaded at startup, before the server reports ready; "" skips the model warm-up
+WARMUP = [model.strip() for model in os.getenv("WARMUP_MODELS", ",".join(WARMUP_MODELS)).split(",") if model.strip()]
 
-prep()
-app = FastAPI()
 
-# Create an instance of our ChatAPI, passing in the global API key
-ChatAPI(ollama_host=OLLAMA_HOST, api_key=OLLAMA_API_KEY)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Directories, cleanup and index migration finish before the first request is served.
+    # Nothing before this point writes to the working directory, so importing main has no side effects.
+    await asyncio.to_thread(prep)
 
-# Include the router (with the two registered endpoints) in our main FastAPI app
-app.include_router(router)
+    # Create an instance of our ChatAPI, passing in the global API key; it opens the upload index and result cache
+    api = ChatAPI(ollama_host=OLLAMA_HOST, api_key=OLLAMA_API_KEY, keep_alive=KEEP_ALIVE, warmup_models=WARMUP)
+    app.state.api = api
+    # Include the router (with the endpoints ChatAPI registered) in our main FastAPI app
+    app.include_router(router)
+
+    # Media is served with ETag, Range and Cache-Control headers; '?w=320' gives a thumbnail
+    thumbnails = ThumbnailCache(THUMBNAIL_DIR)
+    app.mount("/uploads", MediaFiles(directory=UPLOAD_DIR, max_age=UPLOAD_MAX_AGE, immutable=True,
+                                     thumbnails=thumbnails), name="uploads")
+    app.mount("/frames", MediaFiles(directory=FRAMES_DIR, max_age=FRAME_MAX_AGE, thumbnails=thumbnails),
+              name="frames")
+
+    api.job_queue.start()
+    api.backends.start()
+    api.storage.start()
+    # Heavy imports and model loads run in the background; /api/v1/health/ready reports when they are done
+    api.warmup.start()
+    try:
+        yield
+    finally:
+        await api.warmup.stop()
+        await api.job_queue.stop()
+        await api.storage.stop()
+        # Sessions still only in memory would otherwise be lost
+        await asyncio.to_thread(api.chat_sessions.flush)
+        await api.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(HTTPMetricsMiddleware)
 
 templates = Jinja2Templates(directory="templates")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
-app.mount("/frames", StaticFiles(directory="frames"), name="frames")
+
@@ -0,0 +1,250 @@
+"""Static file serving for uploads and frame previews, with cached thumbnails."""
+import asyncio
+import hashlib
+import os
+import stat
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Sequence
+
+import anyio
+from starlette.datastructures import Headers, QueryParams
+from starlette.exceptions import HTTPException
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+
+from metrics import REGISTRY
+from util import LazyModule
+from constants import (THUMBNAIL_DIR, THUMBNAIL_WIDTHS, THUMBNAIL_JPEG_QUALITY, THUMBNAIL_CACHE_MAX_BYTES,
+                       THUMBNAIL_ORIGINALS_MAX, MEDIA_CHUNK_SIZE)
+
+cv2 = LazyModule("cv2")
+
+# Files that can be thumbnailed; videos and other files are served as-is only
+THUMBNAIL_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+THUMBNAILS = REGISTRY.counter(
+    "panoptes_thumbnails_total", "Thumbnail requests by outcome: hit, generated or original.", ["result"]
+)
+THUMBNAIL_EVICTIONS = REGISTRY.counter("panoptes_thumbnail_evictions_total", "Thumbnails deleted to stay in budget.")
+
+
+class MediaFileResponse(FileResponse):
+    """
+    FileResponse that hands whole-file bodies to the server through the ASGI
+    "http.response.pathsend" extension when the server offers it, so the
+    file can go out with sendfile() instead of through Python. Otherwise,
+    and for Range and HEAD requests, the file is read in MEDIA_CHUNK_SIZE
+    chunks.
+    """
+
+    chunk_size = MEDIA_CHUNK_SIZE
+
+    async def __call__(self, scope, receive, send):
+        if (
+            "http.response.pathsend" not in scope.get("extensions", {})
+            or self.stat_result is None
+            or scope["method"].upper() == "HEAD"
+            or "range" in Headers(scope=scope)
+        ):
+            await super().__call__(scope, receive, send)
+            return
+
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": str(self.path)})
+        if self.background is not None:
+            await self.background()
+
+
+class ThumbnailCache:
+    """
+    JPEG thumbnails kept on disk under 'directory'. Each file is named after
+    the source path, mtime, size and width, so rewriting a source gives it
+    new thumbnails.
+    - Requested widths are rounded up to one of 'widths', capped at the
+      largest, which limits how many copies of each image can exist.
+    - Images no wider than the requested width are served as they are.
+    - Once thumbnails take more than 'max_bytes', the least recently served
+      ones are deleted. Their order is rebuilt from file mtimes at startup.
+    - Up to 'max_originals' sources that are served as they are are
+      remembered, least recently served forgotten first.
+    Concurrent requests for the same missing thumbnail generate it once.
+    """
+
+    def __init__(
+        self,
+        directory: Path = THUMBNAIL_DIR,
+        max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES,
+        widths: Sequence[int] = THUMBNAIL_WIDTHS,
+        quality: int = THUMBNAIL_JPEG_QUALITY,
+        max_originals: int = THUMBNAIL_ORIGINALS_MAX
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.widths = tuple(sorted(widths))
+        self.quality = quality
+        self.max_originals = max_originals
+        self.total_bytes = 0
+        # File name -> size, least recently served first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        # Keys whose source is already small enough to serve directly, least
+        # recently served first
+        self._originals: "OrderedDict[str, None]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        files = []
+        for path in self.directory.iterdir():
+            if path.suffix == ".tmp":
+                # Left behind by a crash mid-write
+                path.unlink(missing_ok=True)
+            elif path.suffix == ".jpg":
+                stat_result = path.stat()
+                files.append((stat_result.st_mtime, path.name, stat_result.st_size))
+        for _, name, size in sorted(files):
+            self._entries[name] = size
+            self.total_bytes += size
+
+    def width_for(self, width: int) -> int:
+        return next((w for w in self.widths if w >= width), self.widths[-1])
+
+    @staticmethod
+    def key(source_path: str, stat_result: os.stat_result, width: int) -> str:
+        raw = f"{source_path}\0{stat_result.st_mtime_ns}\0{stat_result.st_size}\0{width}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + ".jpg"
+
+    async def get(self, source_path: str, stat_result: os.stat_result, width: int) -> str:
+        """
+        Returns the path to serve for 'source_path' at 'width' pixels wide:
+        a cached or new thumbnail, or the source itself. Raises ValueError if
+        the source cannot be decoded.
+        """
+        width = self.width_for(width)
+        name = self.key(source_path, stat_result, width)
+        path = self.directory / name
+        with self._lock:
+            original = name in self._originals
+            if original:
+                self._originals.move_to_end(name)
+        if original:
+            THUMBNAILS.inc(result="original")
+            return source_path
+
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                THUMBNAILS.inc(result="hit")
+                hit = True
+            else:
+                hit = False
+        if hit:
+            try:
+                # The mtime keeps the LRU order across restarts
+                await asyncio.to_thread(os.utime, path)
+                return str(path)
+            except FileNotFoundError:
+                # Deleted behind our back; make it again
+                with self._lock:
+                    self.total_bytes -= self._entries.pop(name, 0)
+
+        pending = self._pending.get(name)
+        if pending is None:
+            pending = asyncio.ensure_future(asyncio.to_thread(self._generate, source_path, name, width))
+            self._pending[name] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(name, None))
+        # Shielded so a client that goes away does not cancel it for the others
+        return await asyncio.shield(pending)
+
+    def _generate(self, source_path: str, name: str, width: int) -> str:
+        image = cv2.imread(source_path, cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError(f"Could not decode {Path(source_path).name}")
+        height, source_width = image.shape[:2]
+        if source_width <= width:
+            with self._lock:
+                self._originals[name] = None
+                while len(self._originals) > self.max_originals:
+                    self._originals.popitem(last=False)
+            THUMBNAILS.inc(result="original")
+            return source_path
+
+        size = (width, max(1, round(height * width / source_width)))
+        thumbnail = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        data = cv2.imencode(".jpg", thumbnail, [cv2.IMWRITE_JPEG_QUALITY, self.quality])[1].tobytes()
+
+        path = self.directory / name
+        temp_path = path.with_name(f"{name}.{os.getpid()}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+        THUMBNAILS.inc(result="generated")
+
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(name, 0)
+            self._entries[name] = len(data)
+            evicted = []
+            # The newest thumbnail is always kept, even if it alone is over budget
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_name, old_size = self._entries.popitem(last=False)
+                self.total_bytes -= old_size
+                evicted.append(old_name)
+        for old_name in evicted:
+            (self.directory / old_name).unlink(missing_ok=True)
+        THUMBNAIL_EVICTIONS.inc(len(evicted))
+        return str(path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes}
+
+
+class MediaFiles(StaticFiles):
+    """
+    StaticFiles with cache headers and on-demand thumbnails.
+    - StaticFiles already sends ETag and Last-Modified and answers
+      If-None-Match with 304; FileResponse handles Range requests.
+    - Responses may be cached for 'max_age' seconds. 'immutable' is for
+      content-addressed files, which never change under the same URL.
+    - '?w=<pixels>' on an image returns a JPEG thumbnail from 'thumbnails'
+      no wider than that, instead of the original.
+    """
+
+    def __init__(self, *args, max_age: int = 0, immutable: bool = False, thumbnails: ThumbnailCache = None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = f"public, max-age={max_age}" + (", immutable" if immutable else "")
+        self.thumbnails = thumbnails
+
+    async def get_response(self, path: str, scope) -> Response:
+        width = QueryParams(scope["query_string"]).get("w")
+        if width is None or self.thumbnails is None:
+            return await super().get_response(path, scope)
+
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+        if not width.isdigit() or int(width) <= 0:
+            raise HTTPException(status_code=400, detail="'w' must be a positive number of pixels")
+        try:
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path)
+        except OSError:
+            raise HTTPException(status_code=404)
+        if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+            raise HTTPException(status_code=404)
+        if not full_path.lower().endswith(THUMBNAIL_SUFFIXES):
+            raise HTTPException(status_code=400, detail="Thumbnails are only available for images")
+
+        try:
+            served_path = await self.thumbnails.get(full_path, stat_result, int(width))
+        except ValueError as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        return self.file_response(served_path, await anyio.to_thread.run_sync(os.stat, served_path), scope)
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        response = MediaFileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        response.headers["cache-control"] = self.cache_control
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
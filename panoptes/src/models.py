@@ -1,4 +1,10 @@
-from pydantic import BaseModel
+from typing import List, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, field_validator
+
+from constants import (ANALYSIS_CONCURRENCY, ANALYSIS_BATCH_SIZE, FRAME_SAMPLE_INTERVAL, SCENE_CHANGE_THRESHOLD,
+                       FRAME_MAX_SIDE, PAYLOAD_MAX_BYTES, PAYLOAD_FORMAT, ANALYSIS_STRUCTURED_OUTPUT, CHAT_MODEL,
+                       CHAT_HISTORY_TOKENS)
 
 # Pydantic models for requests
 class ChatRequest(BaseModel):
@@ -11,3 +17,45 @@ class ImageAnalysisRequest(BaseModel):
     image: str
     prompt: str = "Describe the image."
 
+class UploadSessionRequest(BaseModel):
+    filename: str
+    size: Optional[int] = Field(None, ge=1)
+
+class ChatSessionRequest(BaseModel):
+    model: str = CHAT_MODEL
+    system: Optional[str] = None
+    keep_alive: Optional[Union[str, float]] = None
+    max_tokens: int = Field(CHAT_HISTORY_TOKENS, ge=64)
+    summarize: bool = False
+
+class VideoAnalysisOptions(BaseModel):
+    object_str: str
+    concurrency: int = Field(ANALYSIS_CONCURRENCY, ge=1)
+    ordered: bool = True
+    save_frames: bool = True
+    sample_interval: float = Field(FRAME_SAMPLE_INTERVAL, gt=0)
+    sample_rate: Optional[float] = Field(None, gt=0)
+    sample_mode: str = "grab"
+    skip_similar: bool = False
+    similarity_threshold: float = SCENE_CHANGE_THRESHOLD
+    batch_size: int = Field(ANALYSIS_BATCH_SIZE, ge=1)
+    # 0 keeps frames at full size
+    max_side: int = Field(FRAME_MAX_SIDE, ge=0)
+    denoise: bool = False
+    max_payload_bytes: int = Field(PAYLOAD_MAX_BYTES, ge=1)
+    payload_format: str = PAYLOAD_FORMAT
+    structured_output: bool = ANALYSIS_STRUCTURED_OUTPUT
+
+# Structured vision-model output; the JSON schemas are sent as Ollama's "format"
+class FrameAnalysis(BaseModel):
+    answer: Literal["YES", "NO"]
+    description: str
+    confidence: int = Field(ge=1, le=10)
+
+    @field_validator("answer", mode="before")
+    @classmethod
+    def normalize_answer(cls, value):
+        return value.strip().upper() if isinstance(value, str) else value
+
+class BatchFrameAnalysis(BaseModel):
+    images: List[FrameAnalysis]
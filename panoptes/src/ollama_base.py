@@ -1,20 +1,113 @@
 """OllamaBase class for Ollama API clients."""
 import asyncio
-from typing import List, Optional
+import base64
+import hashlib
+import json
+import random
+import re
+import time
+from typing import AsyncIterator, List, Optional, Tuple, Union
 
 from fastapi import HTTPException
-import ollama
-import base64
-import requests
+import httpx
+
+from backend_pool import BackendPool
+from metrics import REGISTRY, record_span, span
+from image_payload import ImagePayload, PayloadOptimizer
+from result_cache import ResultCache
+from util import compute_file_hash
+from models import BatchFrameAnalysis, FrameAnalysis
+from constants import (CHAT_MODEL, VISION_MODEL, OLLAMA_MAX_CONNECTIONS, OLLAMA_MAX_KEEPALIVE, OLLAMA_TIMEOUT,
+                       OLLAMA_CONNECT_TIMEOUT, OLLAMA_RETRIES, OLLAMA_BACKOFF, OLLAMA_MAX_INFLIGHT,
+                       ANALYSIS_STRUCTURED_OUTPUT, ANALYSIS_PARSE_RETRIES, OLLAMA_KEEP_ALIVE)
+
+# Upstream statuses worth retrying; anything else is returned to the caller
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Image bytes to re-encode if over budget, or an ImagePayload to send as it is
+EncodedImage = Union[bytes, ImagePayload]
+# Description analyze_image returns when the model call itself failed
+ANALYSIS_ERROR = "Error occurred"
+# Sent as Ollama's "format" so replies are constrained to these schemas
+FRAME_ANALYSIS_SCHEMA = FrameAnalysis.model_json_schema()
+BATCH_ANALYSIS_SCHEMA = BatchFrameAnalysis.model_json_schema()
+
+OLLAMA_QUEUE_SECONDS = REGISTRY.histogram(
+    "panoptes_ollama_queue_seconds", "Time waiting for a model slot before calling Ollama.", ["model"]
+)
+OLLAMA_REQUEST_SECONDS = REGISTRY.histogram(
+    "panoptes_ollama_request_seconds", "Ollama round-trip time, excluding the queue wait.", ["model"]
+)
+OLLAMA_FIRST_CHUNK_SECONDS = REGISTRY.histogram(
+    "panoptes_ollama_first_chunk_seconds", "Time from sending a streamed request to its first chunk.", ["model"]
+)
+OLLAMA_ERRORS = REGISTRY.counter(
+    "panoptes_ollama_errors_total", "Failed Ollama attempts, by status code or exception.", ["model", "reason"]
+)
+ANALYSIS_PARSE_FAILURES = REGISTRY.counter(
+    "panoptes_analysis_parse_failures_total", "Image analysis replies that did not parse, by mode.", ["mode"]
+)
 
 class OllamaBase:
-    def __init__(self, ollama_host:str, api_key: str):
+    def __init__(
+        self,
+        ollama_host: Union[str, List[str]],
+        api_key: str,
+        max_connections: int = OLLAMA_MAX_CONNECTIONS,
+        max_keepalive: int = OLLAMA_MAX_KEEPALIVE,
+        timeout: float = OLLAMA_TIMEOUT,
+        retries: int = OLLAMA_RETRIES,
+        backoff: float = OLLAMA_BACKOFF,
+        max_inflight: int = OLLAMA_MAX_INFLIGHT,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        result_cache: Optional[ResultCache] = None,
+        payload_optimizer: Optional[PayloadOptimizer] = None,
+        structured_output: bool = ANALYSIS_STRUCTURED_OUTPUT,
+        parse_retries: int = ANALYSIS_PARSE_RETRIES,
+        keep_alive: Optional[Union[str, float]] = OLLAMA_KEEP_ALIVE
+    ):
+        """
+        'ollama_host' is one host, a comma-separated list or a list of hosts;
+        calls are spread across them by self.backends.
+        'structured_output' is the default mode of analyze_image(); see there.
+        'keep_alive' is sent with every model call, so Ollama keeps the model
+        loaded that long after its last use ("30m", seconds, or negative for
+        forever). None leaves it to Ollama's default of five minutes.
+        """
         self.ollama_host = ollama_host
         self.api_key = api_key
-        self.client = ollama.Client(
-            host=self.ollama_host,
-            headers={'OLLAMA_API_KEY':self.api_key}
+        self.result_cache = result_cache
+        self.payload_optimizer = payload_optimizer or PayloadOptimizer()
+        self.retries = retries
+        self.backoff = backoff
+        self.structured_output = structured_output
+        self.parse_retries = parse_retries
+        self.keep_alive = keep_alive_value(keep_alive)
+        self.backends = BackendPool(
+            ollama_host,
+            headers={"OLLAMA_API_KEY": self.api_key or ""},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            timeout=httpx.Timeout(timeout, connect=OLLAMA_CONNECT_TIMEOUT),
+            transport=transport
         )
+        self.max_inflight = max_inflight * len(self.backends)
+        self._model_slots: Optional[asyncio.Semaphore] = None
+        self._slots_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def model_slots(self) -> asyncio.Semaphore:
+        """
+        Bounds concurrent model calls across every request and background job,
+        so a burst of work queues here instead of overloading Ollama.
+        Created lazily because a semaphore belongs to the loop it is first used on.
+        """
+        loop = asyncio.get_running_loop()
+        if self._model_slots is None or self._slots_loop is not loop:
+            self._model_slots = asyncio.Semaphore(self.max_inflight)
+            self._slots_loop = loop
+        return self._model_slots
+
+    async def aclose(self):
+        await self.backends.aclose()
 
     def _check_api_key(self) -> str:
         """
@@ -27,115 +120,529 @@ class OllamaBase:
             )
         return self.api_key
 
-    def _call_ollama_chat(
+    async def _post_json(self, path: str, payload: dict) -> dict:
+        """
+        POSTs 'payload' to Ollama and returns the decoded JSON body.
+        Connection errors, timeouts and RETRYABLE_STATUS_CODES are retried
+        with exponential backoff and jitter, preferring a backend this call has
+        not tried yet. Each attempt holds one of the 'max_inflight' model slots.
+        """
+        model = payload.get("model")
+        tried = []
+        for attempt in range(self.retries + 1):
+            queued = time.perf_counter()
+            try:
+                async with self.model_slots, self.backends.acquire(model, tried) as backend:
+                    sent = time.perf_counter()
+                    OLLAMA_QUEUE_SECONDS.observe(sent - queued, model=model)
+                    tried.append(backend)
+                    response = await backend.http.post(path, json=payload)
+                    self.backends.record(backend, ok=response.status_code not in RETRYABLE_STATUS_CODES)
+                self._observe_request(model, backend, queued, sent, response.status_code)
+                if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.retries:
+                    response.raise_for_status()
+                    return response.json()
+            except httpx.TransportError as e:
+                OLLAMA_ERRORS.inc(model=model, reason=type(e).__name__)
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt) + random.uniform(0, self.backoff))
+
+    async def _stream_json(self, path: str, payload: dict) -> AsyncIterator[dict]:
+        """
+        POSTs 'payload' with "stream": true and yields each NDJSON chunk Ollama
+        sends. Failures before the response starts are retried like
+        _post_json(). The model slot is held until the stream ends.
+        Closing the generator early closes the upstream connection, which
+        makes Ollama abort the generation.
+        """
+        payload = {**payload, "stream": True}
+        model = payload.get("model")
+        started = False
+        tried = []
+        for attempt in range(self.retries + 1):
+            queued = time.perf_counter()
+            try:
+                async with self.model_slots, self.backends.acquire(model, tried) as backend:
+                    sent = time.perf_counter()
+                    OLLAMA_QUEUE_SECONDS.observe(sent - queued, model=model)
+                    tried.append(backend)
+                    async with backend.http.stream("POST", path, json=payload) as response:
+                        self.backends.record(backend, ok=response.status_code not in RETRYABLE_STATUS_CODES)
+                        if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.retries:
+                            if response.is_error:
+                                self._observe_request(model, backend, queued, sent, response.status_code)
+                                await response.aread()
+                                response.raise_for_status()
+                            async for line in response.aiter_lines():
+                                if line.strip():
+                                    if not started:
+                                        OLLAMA_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - sent, model=model)
+                                    started = True
+                                    yield json.loads(line)
+                            self._observe_request(model, backend, queued, sent, response.status_code)
+                            return
+                    self._observe_request(model, backend, queued, sent, response.status_code)
+            except httpx.TransportError as e:
+                OLLAMA_ERRORS.inc(model=model, reason=type(e).__name__)
+                # Chunks already sent cannot be taken back, so only retry before the first
+                if started or attempt == self.retries:
+                    raise
+            await asyncio.sleep(self.backoff * (2 ** attempt) + random.uniform(0, self.backoff))
+
+    def _observe_request(self, model: str, backend, queued: float, sent: float, status_code: int):
+        duration = time.perf_counter() - sent
+        OLLAMA_REQUEST_SECONDS.observe(duration, model=model)
+        if status_code >= 400:
+            OLLAMA_ERRORS.inc(model=model, reason=str(status_code))
+        record_span(
+            "ollama_request", duration, model=model, backend=backend.host,
+            status=status_code, queue_ms=round((sent - queued) * 1000, 3)
+        )
+
+    async def _call_ollama_chat(
         self,
         prompt: str,
         model: Optional[str] = None,
-        images: Optional[List[bytes]] = None
+        images: Optional[List[bytes]] = None,
+        history: Optional[List[dict]] = None,
+        keep_alive: Optional[Union[str, float]] = None,
+        num_predict: Optional[int] = None
     ):
         """
-        Wraps ollama.chat or ollama.generate calls in a single method.
+        Sends a chat request to Ollama.
         - 'model': if you want to specify a custom model like 'llama3.2'
         - 'images': for image-based queries
+        - 'history': earlier messages of a multi-turn chat, sent before the prompt
+        - 'keep_alive': overrides the default for this call
+        - 'num_predict': the most tokens the reply may have
         """
-        if self.api_key is None:
-            self._check_api_key()
-
         try:
-            response = self.client.chat(model=model or 'llama3.2',
-                messages=[{
-                    'role': 'user',
-                    'content': prompt,
-                },
-            ])
-
-            return response
+            payload = self._chat_payload(prompt, model, images, history, keep_alive, num_predict)
+            return await self._post_json("/api/chat", payload)
         except Exception as exc:
             print(f"Error communicating with Ollama: {exc}")
             raise HTTPException(status_code=500, detail="Failed to communicate with Ollama")
 
+    async def _call_ollama_chat_stream(
+        self,
+        prompt: str,
+        model: Optional[str] = None,
+        images: Optional[List[bytes]] = None,
+        history: Optional[List[dict]] = None,
+        keep_alive: Optional[Union[str, float]] = None,
+        num_predict: Optional[int] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Streaming variant of _call_ollama_chat(); yields Ollama's chunks as
+        they are generated.
+        """
+        payload = self._chat_payload(prompt, model, images, history, keep_alive, num_predict)
+        try:
+            async for chunk in self._stream_json("/api/chat", payload):
+                yield chunk
+        except httpx.HTTPError as exc:
+            print(f"Error communicating with Ollama: {exc}")
+            raise HTTPException(status_code=500, detail="Failed to communicate with Ollama")
 
-    def _call_image_analysis(self, prompt: str, image_path: str, model: str = "llava:latest"):
+    def _chat_payload(
+        self,
+        prompt: str,
+        model: Optional[str],
+        images: Optional[List[bytes]],
+        history: Optional[List[dict]] = None,
+        keep_alive: Optional[Union[str, float]] = None,
+        num_predict: Optional[int] = None
+    ) -> dict:
         if self.api_key is None:
             self._check_api_key()
 
-        # Encode image into Base64
-        with open(image_path, "rb") as f:
-            raw_bytes = f.read()
-        encoded_str = base64.b64encode(raw_bytes).decode("utf-8")
-
-        # Prepare the payload
+        message = {'role': 'user', 'content': prompt}
+        if images:
+            message['images'] = [base64.b64encode(image).decode("utf-8") for image in images]
         payload = {
-            "model": model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
-            "images": [encoded_str],
+            "model": model or CHAT_MODEL,
+            "messages": [*(history or []), message],
             "stream": False
         }
+        if num_predict is not None:
+            payload["options"] = {"num_predict": num_predict}
+        return self._with_keep_alive(payload, keep_alive)
 
-        # Post to Ollama’s /chat or /generate endpoint
-        # (the path can differ based on your version/config)
-        # Typically it’s:  http://<ollama_host>:<port>/api/chat
-        # or if you're connecting to the default local Docker, it might be:
-        # http://127.0.0.1:11411/api/chat
-        url = f"{self.ollama_host}/api/chat"
-        headers = {
-            "Content-Type": "application/json",
-            "OLLAMA_API_KEY": self.api_key,
-        }
+    def _with_keep_alive(self, payload: dict, keep_alive: Optional[Union[str, float]] = None) -> dict:
+        keep_alive = self.keep_alive if keep_alive is None else keep_alive_value(keep_alive)
+        if keep_alive is not None:
+            payload["keep_alive"] = keep_alive
+        return payload
+
+
+    async def _call_image_analysis(
+        self,
+        prompt: str,
+        image_path: Optional[str] = None,
+        model: str = VISION_MODEL,
+        image_bytes: Optional[Union[EncodedImage, List[EncodedImage]]] = None,
+        response_format: Optional[dict] = None
+    ):
+        """
+        Sends an image to the vision model.
+        Pass either 'image_path' or already-encoded 'image_bytes'; the latter
+        skips the disk read for frames that only exist in memory. A list of
+        encoded images is sent together in one message.
+        Raw bytes over the payload budget are re-encoded first, while an
+        ImagePayload was encoded for this request and is sent as it is; the
+        response's "payload" lists each image's size and encode time.
+        'response_format' is a JSON schema the reply must follow.
+        """
+        payload, images = await self._image_payload(prompt, image_path, model, image_bytes)
+        if response_format is not None:
+            payload["format"] = response_format
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=120)
-            response.raise_for_status()
-            return response.json()
+            response = await self._post_json("/api/chat", payload)
         except Exception as e:
             raise HTTPException(
                 status_code=500,
                 detail=f"Error communicating with Ollama: {e}"
             )
+        response["payload"] = [image.to_dict() for image in images]
+        return response
 
+    async def _call_image_analysis_stream(
+        self,
+        prompt: str,
+        image_path: Optional[str] = None,
+        model: str = VISION_MODEL,
+        image_bytes: Optional[Union[EncodedImage, List[EncodedImage]]] = None
+    ) -> AsyncIterator[dict]:
+        """
+        Streaming variant of _call_image_analysis(); yields Ollama's chunks as
+        they are generated. The final chunk carries the "payload" report.
+        """
+        payload, images = await self._image_payload(prompt, image_path, model, image_bytes)
+        try:
+            async for chunk in self._stream_json("/api/chat", payload):
+                if chunk.get("done"):
+                    chunk["payload"] = [image.to_dict() for image in images]
+                yield chunk
+        except httpx.HTTPError as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error communicating with Ollama: {e}"
+            )
 
-    async def analyze_image(self, image_path: str, object_str: str, model: str = "llava:latest"):
+    async def _image_payload(
+        self,
+        prompt: str,
+        image_path: Optional[str],
+        model: str,
+        image_bytes: Optional[Union[EncodedImage, List[EncodedImage]]]
+    ) -> Tuple[dict, List[ImagePayload]]:
+        """
+        Returns the request payload and the ImagePayload sent for each image.
+        """
+        if self.api_key is None:
+            self._check_api_key()
+
+        raw_images = image_bytes if isinstance(image_bytes, list) else [image_bytes]
+        if image_bytes is None:
+            raw_images = [await asyncio.to_thread(self._read_bytes, image_path)]
+        images = []
+        for raw_bytes in raw_images:
+            if isinstance(raw_bytes, ImagePayload):
+                images.append(raw_bytes)
+            elif len(raw_bytes) > self.payload_optimizer.max_bytes:
+                images.append(await asyncio.to_thread(self.payload_optimizer.optimize, raw_bytes))
+            else:
+                images.append(self.payload_optimizer.optimize(raw_bytes))
+
+        # Encode images into Base64; Ollama's /api/chat takes them on the message
+        encoded = [base64.b64encode(image.data).decode("utf-8") for image in images]
+        return self._with_keep_alive({
+            "model": model,
+            "messages": [
+                {"role": "user", "content": prompt, "images": encoded}
+            ],
+            "stream": False
+        }), images
+
+    @staticmethod
+    def _read_bytes(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+
+    async def _content_hash(self, image: Union[str, EncodedImage]) -> str:
+        if isinstance(image, ImagePayload):
+            image = image.data
+        if isinstance(image, bytes):
+            return hashlib.blake2b(image).hexdigest()
+        return await asyncio.to_thread(compute_file_hash, image, "blake2b")
+
+    async def analyze_image(
+            self,
+            image: Union[str, EncodedImage],
+            object_str: str,
+            model: str = VISION_MODEL,
+            structured: Optional[bool] = None
+    ):
             """
             Sends an image to Ollama for object detection and structured analysis.
+            'image' is a file path, encoded image bytes, or an ImagePayload
+            that is sent without being re-encoded.
+            With 'structured' (default self.structured_output) the reply is
+            requested as JSON matching models.FrameAnalysis and validated into
+            it; a reply that does not validate is asked for again up to
+            self.parse_retries times, then reported as an error rather than
+            guessed at. Otherwise the Answer/Description/Confidence text reply
+            is parsed as-is.
+            Results are served from self.result_cache when one is configured.
             Returns: (bool is_match, str description, int confidence)
             """
-            prompt_str = f"""Please analyze the image and answer the following questions:
+            if structured is None:
+                structured = self.structured_output
+            prompt_str = analysis_prompt(object_str, structured=structured)
+
+            content_hash = None
+            if self.result_cache is not None:
+                content_hash = await self._content_hash(image)
+                cached = await asyncio.to_thread(self.result_cache.get, content_hash, prompt_str, model)
+                if cached is not None:
+                    return tuple(cached)
+
+            image_path, image_bytes = (image, None) if isinstance(image, str) else (None, image)
+            attempts = 1 + self.parse_retries if structured else 1
+            try:
+                for _ in range(attempts):
+                    response = await self._call_image_analysis(
+                        prompt_str, image_path, model, image_bytes,
+                        response_format=FRAME_ANALYSIS_SCHEMA if structured else None
+                    )
+                    response_text = response.get("message", {}).get("content", "")
+                    with span("parse"):
+                        if structured:
+                            answer, description, confidence = parse_structured_analysis(response_text)
+                        else:
+                            answer, description, confidence = parse_analysis(response_text)
+                    if answer is not None:
+                        break
+                    ANALYSIS_PARSE_FAILURES.inc(mode="structured" if structured else "text")
+
+                if answer is None and structured:
+                    print(f"Image analysis reply did not parse after {attempts} attempts")
+                    return False, ANALYSIS_ERROR, 0
+
+                result = (answer == "YES" and confidence >= 7, description, confidence)
+                # Only cache responses that followed the requested structure
+                if content_hash is not None and answer is not None:
+                    await asyncio.to_thread(self.result_cache.put, content_hash, prompt_str, model, list(result))
+                return result
+            except Exception as e:
+                print(f"Error during image analysis: {str(e)}")
+                return False, ANALYSIS_ERROR, 0
+
+    async def analyze_images_batch(
+        self,
+        images: List[EncodedImage],
+        object_str: str,
+        model: str = VISION_MODEL,
+        structured: Optional[bool] = None
+    ):
+        """
+        Analyzes several encoded images with one multi-image model request.
+        The structured prompt is sent once and the reply is split back into
+        per-image results: a JSON "images" array with 'structured', else
+        Answer/Description/Confidence blocks. Cached images are not sent, and
+        images whose entry is missing or malformed are re-asked one at a time.
+        Results are cached under the single-image prompt.
+        Returns one (is_match, description, confidence) tuple per image, in order.
+        """
+        if structured is None:
+            structured = self.structured_output
+        prompt_str = analysis_prompt(object_str, structured=structured)
+        results = [None] * len(images)
+        hashes = [None] * len(images)
+        if self.result_cache is not None:
+            for i, image in enumerate(images):
+                hashes[i] = await self._content_hash(image)
+                cached = await asyncio.to_thread(self.result_cache.get, hashes[i], prompt_str, model)
+                if cached is not None:
+                    results[i] = tuple(cached)
+
+        pending = [i for i, result in enumerate(results) if result is None]
+        if len(pending) > 1:
+            try:
+                if structured:
+                    schema, parse = BATCH_ANALYSIS_SCHEMA, parse_structured_batch
+                else:
+                    schema, parse = None, parse_batch_analysis
+                response = await self._call_image_analysis(
+                    analysis_prompt(object_str, len(pending), structured),
+                    model=model,
+                    image_bytes=[images[i] for i in pending],
+                    response_format=schema
+                )
+                with span("parse", images=len(pending)):
+                    blocks = parse(response.get("message", {}).get("content", ""), len(pending))
+            except Exception as e:
+                print(f"Error during batch image analysis: {str(e)}")
+                return [result or (False, ANALYSIS_ERROR, 0) for result in results]
+
+            for i, (answer, description, confidence) in zip(pending, blocks):
+                if answer is None:
+                    ANALYSIS_PARSE_FAILURES.inc(mode="structured" if structured else "text")
+                    continue
+                results[i] = (answer == "YES" and confidence >= 7, description, confidence)
+                if hashes[i] is not None:
+                    await asyncio.to_thread(self.result_cache.put, hashes[i], prompt_str, model, list(results[i]))
+
+        retry = [i for i, result in enumerate(results) if result is None]
+        retried = await asyncio.gather(*(self.analyze_image(images[i], object_str, model, structured) for i in retry))
+        for i, result in zip(retry, retried):
+            results[i] = result
+        return results
+
+
+def keep_alive_value(value: Optional[Union[str, float]]) -> Optional[Union[str, float]]:
+    """
+    Ollama reads a numeric keep_alive as seconds but a string as a duration
+    like "30m", so "-1" from an environment variable is sent as the number -1.
+    """
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return value or None
+    return value
+
+
+def analysis_prompt(object_str: str, count: Optional[int] = None, structured: bool = False) -> str:
+    """
+    The question asked about each image. With 'count' it covers that many
+    attached images; 'structured' asks for JSON instead of the
+    Answer/Description/Confidence text format.
+    """
+    if count is None:
+        intro = "Please analyze the image and answer the following questions:"
+    else:
+        intro = (f"You are given {count} images, numbered 1 to {count} in the order they are attached.\n"
+                 "            Analyze each image separately and answer the following questions for each:")
+    if structured and count is None:
+        reply_format = """Respond with a JSON object with the fields "answer" ("YES" or "NO"),
+            "description" (your detailed description) and "confidence" (1-10)."""
+    elif structured:
+        reply_format = """Respond with a JSON object whose "images" array has one entry per image, in order,
+            each with the fields "answer" ("YES" or "NO"), "description" (your detailed
+            description) and "confidence" (1-10)."""
+    elif count is None:
+        reply_format = """Please structure your response as follows:
+            Answer: [YES/NO]
+            Description: [Your detailed description]
+            Confidence: [1-10]"""
+    else:
+        reply_format = """Please structure your response as follows, with one block per image:
+            Image 1:
+            Answer: [YES/NO]
+            Description: [Your detailed description]
+            Confidence: [1-10]
+
+            Image 2:
+            ..."""
+    return f"""{intro}
             1. Is there a {object_str} in the image?
             2. If yes, describe its appearance and location in the image in detail.
             3. If no, describe what you see in the image instead.
             4. On a scale of 1-10, how confident are you in your answer?
 
-            Please structure your response as follows:
-            Answer: [YES/NO]
-            Description: [Your detailed description]
-            Confidence: [1-10]"""
+            {reply_format}"""
+
+
+def parse_analysis(response_text: str):
+    """
+    Parses an Answer/Description/Confidence reply.
+    Returns (answer or None, description or None, confidence).
+    """
+    response_lines = response_text.strip().split('\n')
 
+    answer = None
+    description = None
+    confidence = 10  # Default confidence level
+
+    for line in response_lines:
+        line = line.strip()
+        if line.lower().startswith('answer:'):
+            answer = line.split(':', 1)[1].strip().upper()
+        elif any(line.lower().startswith(prefix) for prefix in ['description:', 'reasoning:', 'alternative description:']):
+            description = line.split(':', 1)[1].strip()
+        elif line.lower().startswith('confidence:'):
             try:
-                response = await asyncio.to_thread(
-                    self._call_image_analysis, prompt_str, image_path, model
-                )
+                confidence = int(line.split(':', 1)[1].strip())
+            except ValueError:
+                confidence = 10  # Default confidence if parsing fails
 
-                response_text = response.get("message", {}).get("content", "")
-                response_lines = response_text.strip().split('\n')
-
-                answer = None
-                description = None
-                confidence = 10  # Default confidence level
-
-                for line in response_lines:
-                    line = line.strip()
-                    if line.lower().startswith('answer:'):
-                        answer = line.split(':', 1)[1].strip().upper()
-                    elif any(line.lower().startswith(prefix) for prefix in ['description:', 'reasoning:', 'alternative description:']):
-                        description = line.split(':', 1)[1].strip()
-                    elif line.lower().startswith('confidence:'):
-                        try:
-                            confidence = int(line.split(':', 1)[1].strip())
-                        except ValueError:
-                            confidence = 10  # Default confidence if parsing fails
-
-                return answer == "YES" and confidence >= 7, description, confidence
-            except Exception as e:
-                print(f"Error during image analysis: {str(e)}")
-                return False, "Error occurred", 0
\ No newline at end of file
+    return answer, description, confidence
+
+
+# Matches block headers such as "Image 2:", "**Image 2**" or "### Image #2"
+IMAGE_BLOCK_HEADER = re.compile(r'^[\W_]*image\s*#?\s*(\d+)\b[\W_]*$', re.IGNORECASE | re.MULTILINE)
+
+def parse_batch_analysis(response_text: str, count: int):
+    """
+    Splits a multi-image reply into 'count' parse_analysis() results, in image
+    order. Images without a block get (None, None, 10).
+    """
+    blocks = {}
+    headers = list(IMAGE_BLOCK_HEADER.finditer(response_text))
+    for header, following in zip(headers, headers[1:] + [None]):
+        end = following.start() if following is not None else len(response_text)
+        blocks[int(header.group(1))] = response_text[header.end():end]
+    return [parse_analysis(blocks.get(number, "")) for number in range(1, count + 1)]
+
+
+def _json_object(response_text: str) -> str:
+    # Tolerates text or code fences around the object
+    text = response_text.strip()
+    if not text.startswith("{") and "{" in text:
+        text = text[text.find("{"):text.rfind("}") + 1]
+    return text
+
+
+def parse_structured_analysis(response_text: str):
+    """
+    Validates a JSON reply into FrameAnalysis. A reply that is not JSON,
+    e.g. from an Ollama without "format" support, goes through
+    parse_analysis() and counts only if it has a YES/NO answer.
+    Returns (answer or None, description, confidence) like parse_analysis().
+    """
+    try:
+        analysis = FrameAnalysis.model_validate_json(_json_object(response_text))
+    except ValueError:
+        answer, description, confidence = parse_analysis(response_text)
+        if answer not in ("YES", "NO"):
+            return None, None, 0
+        return answer, description, confidence
+    return analysis.answer, analysis.description, analysis.confidence
+
+
+def parse_structured_batch(response_text: str, count: int):
+    """
+    Splits a JSON {"images": [...]} reply into 'count' parse_structured_analysis()
+    results, in image order. Entries that are missing or fail validation get
+    (None, None, 0); a reply that is not JSON goes through parse_batch_analysis().
+    """
+    try:
+        data = json.loads(_json_object(response_text))
+        items = data.get("images") if isinstance(data, dict) else data
+        if not isinstance(items, list):
+            raise ValueError("No images array")
+    except ValueError:
+        return parse_batch_analysis(response_text, count)
+
+    results = []
+    for item in items[:count]:
+        try:
+            analysis = FrameAnalysis.model_validate(item)
+        except ValueError:
+            results.append((None, None, 0))
+            continue
+        results.append((analysis.answer, analysis.description, analysis.confidence))
+    return results + [(None, None, 0)] * (count - len(results))
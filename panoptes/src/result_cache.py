@@ -0,0 +1,145 @@
+"""Persistent cache of model analysis results keyed by content hash, prompt and model."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from metrics import REGISTRY
+from constants import RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "panoptes_cache_requests_total", "Result cache lookups by outcome.", ["result"]
+)
+CACHE_EVICTIONS = REGISTRY.counter("panoptes_cache_evictions_total", "Result cache entries expired or evicted.")
+
+
+class ResultCache:
+    """
+    SQLite-backed LRU cache of analysis results.
+    - Entries older than 'ttl' seconds are treated as misses and pruned.
+    - Least recently used entries are evicted once the cache holds more than
+      'max_entries' results or 'max_bytes' of serialized values.
+    Hit, miss and eviction counters are kept per process; see stats().
+    """
+
+    # Limits are enforced every 'prune_interval' writes rather than on each one
+    prune_interval = 100
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        ttl: float = RESULT_CACHE_TTL
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+
+    @staticmethod
+    def make_key(content_hash: str, prompt: str, model: str) -> str:
+        return hashlib.sha256(f"{content_hash}\0{prompt}\0{model}".encode("utf-8")).hexdigest()
+
+    def get(self, content_hash: str, prompt: str, model: str) -> Optional[Any]:
+        """
+        Returns the cached result, or None on a miss or expired entry.
+        """
+        key = self.make_key(content_hash, prompt, model)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                self.misses += 1
+                CACHE_REQUESTS.inc(result="miss")
+                return None
+            self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            CACHE_REQUESTS.inc(result="hit")
+        return json.loads(row[0])
+
+    def put(self, content_hash: str, prompt: str, model: str, value: Any):
+        key = self.make_key(content_hash, prompt, model)
+        serialized = json.dumps(value)
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, len(serialized), now, now)
+            )
+            self._writes += 1
+            if self._writes % self.prune_interval == 0:
+                self._prune(now)
+
+    def prune(self):
+        with self._lock, self._conn:
+            self._prune(time.time())
+
+    def _prune(self, now: float):
+        """
+        Drops expired entries, then evicts LRU entries until within limits.
+        Callers hold the lock and an open transaction.
+        """
+        cursor = self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.ttl,))
+        self.evictions += cursor.rowcount
+        CACHE_EVICTIONS.inc(cursor.rowcount)
+
+        count, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        # Walk from least recently used, keeping a running total of what is freed
+        evict = []
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY accessed_at, rowid"):
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            evict.append((key,))
+            count -= 1
+            total_bytes -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", evict)
+        self.evictions += len(evict)
+        CACHE_EVICTIONS.inc(len(evict))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": total_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
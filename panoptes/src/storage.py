@@ -0,0 +1,274 @@
+"""Disk quotas, eviction and sharded layout for stored uploads, videos, frame previews and video jobs."""
+import asyncio
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics import REGISTRY
+from upload_store import UploadStore
+from constants import (STORAGE_DIR, UPLOAD_DIR, FRAMES_DIR, JOBS_DIR, STORAGE_QUOTAS, STORAGE_TTL, STORAGE_MIN_AGE,
+                       STORAGE_TEMP_MAX_AGE, STORAGE_SWEEP_INTERVAL, STORAGE_LOW_WATERMARK, STORAGE_SHARD_LEVELS)
+
+STORAGE_BYTES = REGISTRY.gauge("panoptes_storage_bytes", "Bytes stored per area at the last sweep.", ["area"])
+STORAGE_EVICTIONS = REGISTRY.counter(
+    "panoptes_storage_evictions_total", "Files or frame directories deleted, by reason: ttl, quota, orphan or temp.",
+    ["area", "reason"]
+)
+
+# (last used, size in bytes, path, upload index hash or None)
+Unit = Tuple[float, int, Path, Optional[str]]
+
+
+def shard_path(name: str, levels: int = STORAGE_SHARD_LEVELS) -> str:
+    """
+    Returns 'name' under 'levels' subdirectories named after its leading
+    characters, e.g. "3f/a2/3fa2c1....jpg", so no single directory grows
+    huge. 'name' should start with hex digits (a hash or uuid).
+    """
+    return "/".join([name[2 * i:2 * i + 2] for i in range(levels)] + [name])
+
+
+def move_into_place(source, destination):
+    """
+    Moves 'source' to 'destination', creating its shard directories. Tries
+    twice, in case a sweep removes a directory that was empty in between.
+    """
+    for attempt in range(2):
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        try:
+            os.replace(source, destination)
+            return
+        except FileNotFoundError:
+            if attempt or not os.path.exists(source):
+                raise
+
+
+def remove_temp_files(directories: Iterable, older_than: float = STORAGE_TEMP_MAX_AGE) -> int:
+    """
+    Deletes the 'temp_*' files that failed uploads leave at the top of
+    'directories', skipping any modified in the last 'older_than' seconds
+    because those may still be being written. Returns how many were removed.
+    """
+    cutoff = time.time() - older_than
+    removed = 0
+    for directory in map(Path, directories):
+        if not directory.is_dir():
+            continue
+        for path in directory.glob("temp_*"):
+            try:
+                if path.is_file() and path.stat().st_mtime <= cutoff:
+                    path.unlink()
+                    removed += 1
+                    STORAGE_EVICTIONS.inc(area=directory.name, reason="temp")
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+class StorageManager:
+    """
+    Keeps each storage area under its byte quota:
+    - "store": uploaded files indexed in the UploadStore. Last use is the
+      index's accessed_at, and an evicted file's index entry is removed with
+      it so later duplicates are stored again. Files the index does not know
+      about are deleted as orphans.
+    - "uploads": uploaded videos, by file mtime.
+    - "frames": video jobs, by their newest file. A job is its directory of
+      previews under frames/ and its results under 'jobs_dir', deleted
+      together so a replayed job never links to previews that are gone.
+    A sweep deletes anything unused for 'ttl' seconds. Then, in any area over
+    its quota, it deletes the least recently used entries until the area is
+    down to STORAGE_LOW_WATERMARK of the quota. Nothing used in the last
+    'min_age' seconds is touched, since it may still be in use.
+    Sweeps also remove abandoned temp_ files, and run every 'interval'
+    seconds once start() is called.
+    """
+
+    def __init__(
+        self,
+        upload_store: UploadStore,
+        store_dir=STORAGE_DIR,
+        upload_dir=UPLOAD_DIR,
+        frames_dir=FRAMES_DIR,
+        jobs_dir=JOBS_DIR,
+        quotas: Optional[Dict[str, int]] = None,
+        ttl: float = STORAGE_TTL,
+        min_age: float = STORAGE_MIN_AGE,
+        interval: float = STORAGE_SWEEP_INTERVAL
+    ):
+        self.upload_store = upload_store
+        self.roots = {"store": Path(store_dir), "uploads": Path(upload_dir), "frames": Path(frames_dir)}
+        self.jobs_dir = Path(jobs_dir)
+        self.quotas = {**STORAGE_QUOTAS, **(quotas or {})}
+        self.ttl = ttl
+        self.min_age = min_age
+        self.interval = interval
+        self.last_sweep: Dict[str, dict] = {}
+        self._sweep_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _files(self, root: Path) -> Iterable[Tuple[Path, os.stat_result]]:
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.startswith("temp_"):
+                    continue
+                path = Path(dirpath) / filename
+                try:
+                    yield path, path.stat()
+                except FileNotFoundError:
+                    continue
+
+    def _store_units(self, root: Path) -> List[Unit]:
+        # Read the index before listing files, so a file indexed in between
+        # is seen as a recent unindexed file rather than a missing one
+        usage = self.upload_store.usage()
+        on_disk = {path: stat_result for path, stat_result in self._files(root)}
+        units = []
+        for file_hash, stored_filename, last_used in usage:
+            path = root / stored_filename
+            stat_result = on_disk.pop(path, None)
+            if stat_result is None:
+                if not path.exists():
+                    # Deleted by hand; drop the entry so the next upload stores it again
+                    self.upload_store.remove(file_hash)
+                continue
+            units.append((last_used, stat_result.st_size, path, file_hash))
+
+        cutoff = time.time() - self.min_age
+        for path, stat_result in on_disk.items():
+            if stat_result.st_mtime <= cutoff:
+                self._delete(root, path)
+                STORAGE_EVICTIONS.inc(area="store", reason="orphan")
+            else:
+                # Possibly an upload that is being indexed right now
+                units.append((stat_result.st_mtime, stat_result.st_size, path, None))
+        return units
+
+    def _file_units(self, root: Path) -> List[Unit]:
+        return [(stat_result.st_mtime, stat_result.st_size, path, None) for path, stat_result in self._files(root)]
+
+    def _directory_units(self, root: Path) -> List[Unit]:
+        directories: Dict[Path, List[float]] = {}
+        for path, stat_result in self._files(root):
+            usage = directories.setdefault(path.parent, [0.0, 0])
+            usage[0] = max(usage[0], stat_result.st_mtime)
+            usage[1] += stat_result.st_size
+        return [(last_used, size, path, None) for path, (last_used, size) in directories.items() if path != root]
+
+    def _job_units(self, root: Path) -> List[Unit]:
+        # Frame directories are named after their job's key
+        jobs = {path.name: [last_used, size, path] for last_used, size, path, _ in self._directory_units(root)}
+        if self.jobs_dir.is_dir():
+            for job_dir in self.jobs_dir.iterdir():
+                try:
+                    # A job that has no results yet was still just created
+                    created = job_dir.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                usage = jobs.setdefault(job_dir.name, [0.0, 0, root / shard_path(job_dir.name)])
+                usage[0] = max(usage[0], created)
+                for path, stat_result in self._files(job_dir):
+                    usage[0] = max(usage[0], stat_result.st_mtime)
+                    usage[1] += stat_result.st_size
+        return [(last_used, size, path, None) for last_used, size, path in jobs.values()]
+
+    def _units(self, area: str) -> List[Unit]:
+        root = self.roots[area]
+        if not root.is_dir():
+            return []
+        if area == "store":
+            return self._store_units(root)
+        if area == "frames":
+            return self._job_units(root)
+        return self._file_units(root)
+
+    def _delete(self, root: Path, path: Path, file_hash: Optional[str] = None):
+        if file_hash is not None:
+            # Index first, so no request is pointed at a file that is going away
+            self.upload_store.remove(file_hash)
+        if root == self.roots["frames"]:
+            # Results first, so a replay never links to previews that are going away
+            shutil.rmtree(self.jobs_dir / path.name, ignore_errors=True)
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+        # Remove shard directories left empty
+        parent = path.parent
+        while parent != root and root in parent.parents:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+
+    def sweep_area(self, area: str) -> dict:
+        root = self.roots[area]
+        quota = self.quotas[area]
+        now = time.time()
+        units = sorted(self._units(area), key=lambda unit: unit[0])
+        total = sum(unit[1] for unit in units)
+        target = quota * STORAGE_LOW_WATERMARK if total > quota else None
+        evicted = {"ttl": 0, "quota": 0}
+
+        for last_used, size, path, file_hash in units:
+            age = now - last_used
+            if age < self.min_age:
+                break
+            if age > self.ttl:
+                reason = "ttl"
+            elif target is not None and total > target:
+                reason = "quota"
+            else:
+                break
+            self._delete(root, path, file_hash)
+            total -= size
+            evicted[reason] += 1
+            STORAGE_EVICTIONS.inc(area=area, reason=reason)
+
+        STORAGE_BYTES.set(total, area=area)
+        return {
+            "bytes": total,
+            "max_bytes": quota,
+            "entries": len(units) - sum(evicted.values()),
+            "evicted": evicted
+        }
+
+    def sweep(self) -> Dict[str, dict]:
+        """
+        Runs one sweep over every area and returns per-area stats; a sweep
+        already running in another thread makes this a no-op.
+        """
+        if not self._sweep_lock.acquire(blocking=False):
+            return self.last_sweep
+        try:
+            remove_temp_files([self.roots["store"], self.roots["uploads"]])
+            stats = {area: self.sweep_area(area) for area in self.roots}
+            self.last_sweep = {**stats, "swept_at": time.time()}
+            return self.last_sweep
+        finally:
+            self._sweep_lock.release()
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                print(f"Storage sweep failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"quotas": self.quotas, "ttl": self.ttl, "last_sweep": self.last_sweep}
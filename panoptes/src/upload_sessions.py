@@ -0,0 +1,260 @@
+"""Resumable chunked uploads, readable while they are still arriving."""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+
+from frame_sampler import FrameSampler
+from constants import UPLOAD_SESSIONS_DIR, UPLOAD_SESSION_TTL, UPLOAD_STREAM_MIN_BYTES, UPLOAD_STALL_TIMEOUT
+
+UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class UploadSession:
+    """
+    One resumable upload, kept as '<id>.part' (data) and '<id>.json'
+    (metadata) under the sessions directory.
+    - 'offset' counts the bytes received. Each part must start exactly
+      there, so a client whose connection dropped reads the offset back
+      and resumes from it.
+    - 'size', when declared up front, is the expected total.
+    - Readers of the growing file wait for more data with wait_for().
+    - After finish(), 'video_path' and 'video_hash' name the stored video.
+    Only one part is written at a time; see 'write_lock'.
+    """
+
+    def __init__(
+        self,
+        upload_id: str,
+        directory: Path,
+        filename: str,
+        size: Optional[int] = None,
+        created_at: Optional[float] = None,
+        video_path: Optional[str] = None,
+        video_hash: Optional[str] = None
+    ):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.created_at = created_at or time.time()
+        self.part_path = Path(directory) / f"{upload_id}.part"
+        self.meta_path = Path(directory) / f"{upload_id}.json"
+        self.video_path = Path(video_path) if video_path else None
+        self.video_hash = video_hash
+        self.offset = self.part_path.stat().st_size if self.part_path.exists() else 0
+        self.write_lock = threading.Lock()
+        self._changed = threading.Condition()
+        # Hashed as parts arrive; lost on restart, then recomputed at finish()
+        self._hasher = hashlib.blake2b() if self.offset == 0 else None
+
+    @property
+    def complete(self) -> bool:
+        return self.video_path is not None
+
+    @property
+    def path(self) -> Path:
+        """The file as it is now: the partial upload, or the stored video."""
+        return self.video_path if self.complete else self.part_path
+
+    def save(self):
+        temp_path = self.meta_path.with_suffix(".tmp")
+        with open(temp_path, "w") as f:
+            json.dump({
+                "filename": self.filename,
+                "size": self.size,
+                "created_at": self.created_at,
+                "video_path": str(self.video_path) if self.video_path else None,
+                "video_hash": self.video_hash
+            }, f)
+        os.replace(temp_path, self.meta_path)
+
+    def open_for_append(self):
+        # Unbuffered, so readers of the growing file see every byte written
+        return open(self.part_path, "ab", buffering=0)
+
+    def append(self, file, data: bytes):
+        file.write(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
+        with self._changed:
+            self.offset += len(data)
+            self._changed.notify_all()
+
+    def hexdigest(self) -> str:
+        """BLAKE2b of the uploaded bytes; reads the file only after a restart."""
+        if self._hasher is not None:
+            return self._hasher.hexdigest()
+        hasher = hashlib.blake2b()
+        with open(self.part_path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+
+    def finish(self, video_path: Path, video_hash: str):
+        with self._changed:
+            self.video_path = Path(video_path)
+            self.video_hash = video_hash
+            self._changed.notify_all()
+        self.save()
+
+    def data_intact(self) -> bool:
+        """
+        Whether the data on disk still matches this session: the partial
+        file holds exactly 'offset' bytes, or the stored video exists. Call
+        it holding 'write_lock' while the upload is in progress.
+        """
+        if self.complete:
+            return self.video_path.exists()
+        try:
+            return self.part_path.stat().st_size == self.offset
+        except FileNotFoundError:
+            return self.offset == 0
+
+    def wait_for(self, offset: int, timeout: float) -> bool:
+        """
+        Blocks until at least 'offset' bytes have arrived or the upload is
+        complete. Returns False if 'timeout' seconds passed first.
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self.offset >= offset or self.complete, timeout)
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "offset": self.offset,
+            "size": self.size,
+            "complete": self.complete,
+            "video_hash": self.video_hash
+        }
+
+
+class UploadSessionStore:
+    """
+    Creates and finds UploadSessions. Sessions survive restarts because
+    their state is on disk. Sessions left untouched for 'ttl' seconds are
+    deleted when new ones are created.
+    """
+
+    def __init__(self, directory: Path = UPLOAD_SESSIONS_DIR, ttl: float = UPLOAD_SESSION_TTL):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._sessions: Dict[str, UploadSession] = {}
+        self._lock = threading.Lock()
+
+    def create(self, filename: str, size: Optional[int] = None) -> UploadSession:
+        self.remove_stale()
+        session = UploadSession(uuid.uuid4().hex, self.directory, filename, size)
+        session.save()
+        with self._lock:
+            self._sessions[session.upload_id] = session
+        return session
+
+    def get(self, upload_id: str) -> Optional[UploadSession]:
+        if not UPLOAD_ID.fullmatch(upload_id):
+            return None
+        with self._lock:
+            session = self._sessions.get(upload_id)
+            if session is not None:
+                return session
+            meta_path = self.directory / f"{upload_id}.json"
+            if not meta_path.exists():
+                return None
+            with open(meta_path, "r") as f:
+                session = UploadSession(upload_id, self.directory, **json.load(f))
+            self._sessions[upload_id] = session
+            return session
+
+    def remove_stale(self) -> int:
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for meta_path in self.directory.glob("*.json"):
+            upload_id = meta_path.stem
+            part_path = meta_path.with_suffix(".part")
+            try:
+                last_used = max(p.stat().st_mtime for p in (meta_path, part_path) if p.exists())
+            except FileNotFoundError:
+                continue
+            if last_used > cutoff:
+                continue
+            with self._lock:
+                session = self._sessions.get(upload_id)
+                if session is not None and not session.write_lock.acquire(blocking=False):
+                    continue  # A part is being written right now
+                self._sessions.pop(upload_id, None)
+            part_path.unlink(missing_ok=True)
+            meta_path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+
+class GrowingFileSampler(FrameSampler):
+    """
+    FrameSampler over an upload that may still be arriving.
+    - Sampling starts once 'min_bytes' have arrived. Each pass opens the
+      file as it is now and continues from the next unseen sample.
+    - When a pass runs out of frames before the upload is complete, the
+      sampler waits for 'min_bytes' more data, or completion, and tries again.
+    - Until the upload completes, the last frame of each pass is held back,
+      because it may have been decoded from a partly written packet.
+    Containers whose index sits at the end of the file, such as MP4 without
+    faststart, decode nothing until the upload completes and then proceed
+    as usual. Raises TimeoutError if no data arrives for 'stall_timeout'
+    seconds. Waiting blocks the calling thread; close() ends it early.
+    """
+
+    # Seconds between checks for close() while waiting
+    poll_interval = 0.5
+
+    def __init__(
+        self,
+        session: UploadSession,
+        min_bytes: int = UPLOAD_STREAM_MIN_BYTES,
+        stall_timeout: float = UPLOAD_STALL_TIMEOUT,
+        **kwargs
+    ):
+        super().__init__(session.path, **kwargs)
+        self.session = session
+        self.min_bytes = min_bytes
+        self.stall_timeout = stall_timeout
+        self._closed = threading.Event()
+
+    def close(self):
+        self._closed.set()
+
+    def _wait(self, offset: int) -> bool:
+        """Returns False if close() was called while waiting."""
+        last, last_change = self.session.offset, time.monotonic()
+        while not self.session.wait_for(offset, self.poll_interval):
+            if self._closed.is_set():
+                return False
+            if self.session.offset != last:
+                last, last_change = self.session.offset, time.monotonic()
+            elif time.monotonic() - last_change > self.stall_timeout:
+                raise TimeoutError(f"No data received for {self.stall_timeout} seconds")
+        return True
+
+    def __iter__(self):
+        if not self._wait(self.min_bytes):
+            return
+        while True:
+            complete = self.session.complete
+            offset = self.session.offset
+            self.video_path = str(self.session.path)
+            held = None
+            for sample in super().__iter__():
+                if held is not None:
+                    yield held
+                    self.start_index += 1
+                held = sample
+            if held is not None and complete:
+                yield held
+                self.start_index += 1
+            if complete or not self._wait(offset + self.min_bytes):
+                return
@@ -0,0 +1,148 @@
+"""SQLite-backed index of uploaded files, keyed by content hash."""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class UploadStore:
+    """
+    Replaces the flat upload_log.json scan with an indexed table.
+    - Duplicate lookup is a primary-key read instead of a walk over every entry.
+    - New entries are appended with INSERT OR IGNORE, so two concurrent uploads
+      of the same content cannot overwrite each other; the loser sees the winner.
+    """
+
+    # (column, declaration); new columns are appended here and added to
+    # existing databases by _ensure_schema.
+    _COLUMNS = (
+        ("hash", "TEXT PRIMARY KEY"),
+        ("original_filename", "TEXT"),
+        ("file_type", "TEXT"),
+        ("stored_filename", "TEXT NOT NULL"),
+        ("created_at", "REAL"),
+        ("blake2b", "TEXT"),
+        ("accessed_at", "REAL"),
+    )
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._ensure_schema()
+
+    def _ensure_schema(self):
+        columns = ", ".join(f"{name} {decl}" for name, decl in self._COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS uploads ({columns})")
+            existing = {row["name"] for row in self._conn.execute("PRAGMA table_info(uploads)")}
+            for name, decl in self._COLUMNS:
+                if name not in existing:
+                    self._conn.execute(f"ALTER TABLE uploads ADD COLUMN {name} {decl}")
+
+    @staticmethod
+    def _to_entry(row: Optional[sqlite3.Row]) -> Optional[Dict]:
+        if row is None:
+            return None
+        # Columns added after an entry was written read back as NULL; leave
+        # them out so legacy entries keep their original shape.
+        return {
+            name: value for name, value in dict(row).items()
+            if name not in ("created_at", "accessed_at") and value is not None
+        }
+
+    def get(self, file_hash: str) -> Optional[Dict]:
+        """
+        Returns the entry for 'file_hash', or None if it was never uploaded.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM uploads WHERE hash = ?", (file_hash,)
+            ).fetchone()
+        return self._to_entry(row)
+
+    def add(self, entry: Dict) -> Tuple[Dict, bool]:
+        """
+        Atomically records 'entry' unless its hash is already indexed.
+        Returns (stored entry, created). When created is False the returned
+        entry is the one that was already there.
+        """
+        names = [name for name, _ in self._COLUMNS if name in entry]
+        values = [entry[name] for name in names]
+        if "created_at" not in entry:
+            names.append("created_at")
+            values.append(time.time())
+
+        placeholders = ", ".join("?" for _ in names)
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                f"INSERT OR IGNORE INTO uploads ({', '.join(names)}) VALUES ({placeholders})",
+                values,
+            )
+            created = cursor.rowcount == 1
+            row = self._conn.execute(
+                "SELECT * FROM uploads WHERE hash = ?", (entry["hash"],)
+            ).fetchone()
+        return self._to_entry(row), created
+
+    def remove(self, file_hash: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM uploads WHERE hash = ?", (file_hash,))
+        return cursor.rowcount == 1
+
+    def touch(self, file_hash: str):
+        """
+        Marks 'file_hash' as used now, for least-recently-used eviction.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE uploads SET accessed_at = ? WHERE hash = ?", (time.time(), file_hash))
+
+    def usage(self) -> List[Tuple[str, str, float]]:
+        """
+        Returns (hash, stored_filename, last used) for every entry, least
+        recently used first. Entries never touched count from their creation.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT hash, stored_filename, COALESCE(accessed_at, created_at, 0) AS last_used "
+                "FROM uploads ORDER BY last_used"
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM uploads").fetchone()[0]
+
+    def migrate_json_log(self, log_file: str) -> int:
+        """
+        Imports entries from the legacy upload_log.json, then renames it to
+        '<log_file>.migrated' so the import only runs once.
+        Returns the number of entries imported.
+        """
+        if not os.path.exists(log_file):
+            return 0
+
+        with open(log_file, "r") as f:
+            try:
+                log_data = json.load(f)
+            except json.JSONDecodeError:
+                log_data = []
+
+        imported = 0
+        for entry in log_data:
+            if not entry.get("hash") or not entry.get("stored_filename"):
+                continue
+            _, created = self.add(entry)
+            imported += created
+
+        os.replace(log_file, f"{log_file}.migrated")
+        return imported
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
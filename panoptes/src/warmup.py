@@ -0,0 +1,137 @@
+"""Startup warm-up of heavy imports and Ollama models, and the readiness it decides."""
+import asyncio
+import importlib
+import time
+from typing import Any, Dict, Optional, Sequence, Union
+
+from backend_pool import Backend, BackendPool
+from metrics import REGISTRY
+from ollama_base import keep_alive_value
+from constants import (OLLAMA_KEEP_ALIVE, WARMUP_MODELS, WARMUP_MODULES, WARMUP_RETRY_INTERVAL,
+                       WARMUP_REFRESH_INTERVAL)
+
+MODEL_LOAD_SECONDS = REGISTRY.histogram(
+    "panoptes_model_load_seconds", "Time for Ollama to answer a warm-up load, per model.", ["model"]
+)
+READY = REGISTRY.gauge("panoptes_ready", "1 once warm-up has finished and the server reports ready.")
+
+
+class ModelWarmup:
+    """
+    Prepares the server so its first request does not pay for cold starts.
+    - Imports 'modules' such as cv2 in a thread, so the event loop keeps
+      answering liveness probes meanwhile.
+    - Loads each of 'models' on every backend that serves it. It sends
+      Ollama an empty /api/generate request with 'keep_alive', which loads
+      the model and keeps it in memory that long after its last use.
+      Failed loads are retried every 'retry_interval' seconds.
+    - After that, the models are loaded again every 'refresh_interval'
+      seconds (0 disables this). Reloading restarts the keep_alive timer, so
+      the models stay in memory through idle periods while the server runs.
+    'ready' turns True once the modules are imported and every model is
+    loaded on at least one backend. It then stays True, so a later Ollama
+    outage shows up as failed requests, not as every replica dropping out.
+    """
+
+    def __init__(
+        self,
+        backends: BackendPool,
+        models: Sequence[str] = WARMUP_MODELS,
+        keep_alive: Optional[Union[str, float]] = OLLAMA_KEEP_ALIVE,
+        modules: Sequence[str] = WARMUP_MODULES,
+        retry_interval: float = WARMUP_RETRY_INTERVAL,
+        refresh_interval: float = WARMUP_REFRESH_INTERVAL
+    ):
+        self.backends = backends
+        self.models = list(dict.fromkeys(models))
+        self.keep_alive = keep_alive_value(keep_alive)
+        self.modules = tuple(modules)
+        self.retry_interval = retry_interval
+        self.refresh_interval = refresh_interval
+        self.modules_loaded = False
+        self.error: Optional[str] = None
+        self.warmup_seconds: Optional[float] = None
+        self._state: Dict[str, Dict[str, Any]] = {
+            model: {"loaded_on": [], "load_seconds": None, "error": None} for model in self.models
+        }
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self.warmup_seconds is not None
+
+    def _import_modules(self):
+        for name in self.modules:
+            importlib.import_module(name)
+
+    async def load_model(self, backend: Backend, model: str) -> float:
+        """
+        Has one backend load 'model' and returns the seconds it took.
+        """
+        payload = {"model": model}
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        start = time.perf_counter()
+        response = await backend.http.post("/api/generate", json=payload)
+        response.raise_for_status()
+        seconds = time.perf_counter() - start
+        MODEL_LOAD_SECONDS.observe(seconds, model=model)
+        return seconds
+
+    async def _load_everywhere(self, model: str) -> bool:
+        candidates = [b for b in self.backends.backends if b.serves(model)] or self.backends.backends
+        results = await asyncio.gather(*(self.load_model(b, model) for b in candidates), return_exceptions=True)
+        loaded = {b.host: r for b, r in zip(candidates, results) if not isinstance(r, BaseException)}
+        errors = [f"{b.host}: {r!r}" for b, r in zip(candidates, results) if isinstance(r, BaseException)]
+        self._state[model] = {
+            "loaded_on": sorted(loaded),
+            "load_seconds": round(max(loaded.values()), 3) if loaded else None,
+            "error": "; ".join(errors) or None
+        }
+        if errors:
+            print(f"Could not load model {model}: {'; '.join(errors)}")
+        return bool(loaded)
+
+    async def _run(self):
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._import_modules)
+        except Exception as e:
+            self.error = f"Import failed: {e!r}"
+            print(f"Warm-up stopped: {self.error}")
+            return
+        self.modules_loaded = True
+
+        pending = list(self.models)
+        while pending:
+            loaded = await asyncio.gather(*(self._load_everywhere(model) for model in pending))
+            pending = [model for model, ok in zip(pending, loaded) if not ok]
+            if pending:
+                await asyncio.sleep(self.retry_interval)
+        self.warmup_seconds = round(time.perf_counter() - start, 3)
+        READY.set(1)
+        print(f"Warm-up finished in {self.warmup_seconds}s; ready")
+
+        while self.refresh_interval > 0 and self.models:
+            await asyncio.sleep(self.refresh_interval)
+            await asyncio.gather(*(self._load_everywhere(model) for model in self.models))
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "warmup_seconds": self.warmup_seconds,
+            "modules_loaded": self.modules_loaded,
+            "keep_alive": self.keep_alive,
+            "models": {model: dict(state) for model, state in self._state.items()},
+            "error": self.error
+        }
@@ -0,0 +1,109 @@
+import asyncio
+import json
+from collections import Counter
+
+import httpx
+
+from backend_pool import BackendPool, parse_hosts
+from ollama_base import OllamaBase
+
+def make_base(handler, hosts, **kwargs):
+    return OllamaBase(
+        ollama_host=hosts,
+        api_key="TEST_API_KEY",
+        transport=httpx.MockTransport(handler),
+        backoff=0,
+        **kwargs
+    )
+
+def tags(*names):
+    return httpx.Response(200, json={"models": [{"name": name} for name in names]})
+
+def test_parse_hosts():
+    assert parse_hosts("http://a:11434/, http://b:11434") == ["http://a:11434", "http://b:11434"]
+
+def test_routes_by_model():
+    served = []
+
+    def handler(request):
+        if request.url.path == "/api/tags":
+            return tags("llama3.2:latest") if request.url.host == "chat" else tags("llava:latest")
+        served.append((request.url.host, json.loads(request.content)["model"]))
+        return httpx.Response(200, json={"message": {"content": "ok"}})
+
+    base = make_base(handler, "http://chat,http://vision")
+
+    async def main():
+        await base.backends.check_all()
+        await base._call_ollama_chat("Hello")
+        await base._call_image_analysis("Look", image_bytes=b"IMG")
+
+    asyncio.run(main())
+    assert served == [("chat", "llama3.2"), ("vision", "llava:latest")]
+
+def test_least_outstanding_requests_spreads_load():
+    served = Counter()
+
+    async def handler(request):
+        served[request.url.host] += 1
+        # One slow host keeps its requests outstanding longer
+        await asyncio.sleep(0.05 if request.url.host == "slow" else 0.01)
+        return httpx.Response(200, json={"message": {"content": "ok"}})
+
+    base = make_base(handler, ["http://slow", "http://fast"])
+
+    async def worker():
+        for _ in range(5):
+            await base._call_ollama_chat("Hello")
+
+    async def main():
+        await asyncio.gather(*(worker() for _ in range(4)))
+
+    asyncio.run(main())
+    assert served["fast"] > served["slow"] > 0
+
+def test_failing_backend_is_ejected_and_retried_elsewhere():
+    served = Counter()
+
+    def handler(request):
+        served[request.url.host] += 1
+        if request.url.host == "down":
+            raise httpx.ConnectError("refused")
+        return httpx.Response(200, json={"message": {"content": "ok"}})
+
+    base = make_base(handler, ["http://down", "http://up"])
+    base.backends.max_failures = 2
+
+    async def main():
+        for _ in range(6):
+            assert await base._call_ollama_chat("Hello") == {"message": {"content": "ok"}}
+
+    asyncio.run(main())
+    assert served["down"] == 2
+    assert served["up"] == 6
+    assert [backend["available"] for backend in base.backends.stats()] == [False, True]
+
+def test_health_check_ejects_and_restores():
+    healthy = {"a": True}
+
+    def handler(request):
+        if not healthy["a"]:
+            return httpx.Response(500)
+        return tags("llava")
+
+    pool = BackendPool("http://a", transport=httpx.MockTransport(handler))
+
+    async def main():
+        assert await pool.check_all() == [True]
+        healthy["a"] = False
+        assert await pool.check_all() == [False]
+        unavailable = pool.stats()[0]["available"]
+        healthy["a"] = True
+        assert await pool.check_all() == [True]
+        return unavailable
+
+    assert asyncio.run(main()) is False
+    assert pool.stats()[0] == {
+        "host": "http://a", "available": True, "models": ["llava:latest"],
+        "inflight": 0, "requests": 0, "failures": 0
+    }
@@ -1,10 +1,19 @@
 import base64
+import json
+from pathlib import Path
+
+import cv2
+import httpx
+import numpy as np
 import pytest
 from unittest.mock import patch
-from fastapi import FastAPI
+from fastapi import APIRouter, FastAPI
 from fastapi.testclient import TestClient
 
+import chat_api
 from chat_api import ChatAPI, router
+from image_payload import PayloadOptimizer
+from bootstrap import prep
 
 @pytest.fixture
 def client():
@@ -77,3 +86,287 @@ def test_image_analysis_invalid_base64(client):
 
     assert response.status_code == 400
     assert json_data["detail"] == "Invalid base64 image data"
+
+
+class FakeOllama:
+    """
+    MockTransport handler standing in for Ollama's /api/chat. Records every
+    payload, answers calls whose number is in 'fail_calls' with a 500, and
+    replies with JSON when a "format" is requested, else with 'reply'.
+    """
+
+    def __init__(self, reply="Hello there"):
+        self.reply = reply
+        self.calls = []
+        self.fail_calls = set()
+
+    def __call__(self, request):
+        payload = json.loads(request.content)
+        self.calls.append(payload)
+        if len(self.calls) in self.fail_calls:
+            return httpx.Response(500)
+        if payload.get("format"):
+            content = json.dumps({"answer": "YES", "description": "A cat.", "confidence": 9})
+        else:
+            content = self.reply
+        if payload.get("stream"):
+            words = content.split(" ")
+            lines = [json.dumps({"message": {"role": "assistant", "content": f"{word} "}, "done": False})
+                     for word in words]
+            lines.append(json.dumps({"message": {"role": "assistant", "content": ""}, "done": True,
+                                     "eval_count": len(words)}))
+            return httpx.Response(200, content="\n".join(lines).encode())
+        return httpx.Response(200, json={"message": {"role": "assistant", "content": content}, "done": True,
+                                         "eval_count": len(content.split())})
+
+    @property
+    def chat_calls(self):
+        return [payload for payload in self.calls if payload.get("messages")]
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    """
+    A ChatAPI talking to FakeOllama, with its files under tmp_path.
+    Yields (TestClient, FakeOllama, ChatAPI).
+    """
+    monkeypatch.chdir(tmp_path)
+    prep()
+    # A router of its own, so the routes are bound to this test's ChatAPI
+    monkeypatch.setattr(chat_api, "router", APIRouter())
+    ollama = FakeOllama()
+    instance = ChatAPI("http://ollama.test", "TEST_API_KEY", transport=httpx.MockTransport(ollama),
+                       retries=0, backoff=0, warmup_models=())
+    app = FastAPI()
+    app.include_router(chat_api.router)
+    with TestClient(app) as test_client:
+        yield test_client, ollama, instance
+
+
+def write_video(path, seconds, fps=10, size=(64, 48), step=4):
+    width, height = size
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for i in range(seconds * fps):
+        writer.write(np.full((height, width, 3), i * step % 256, np.uint8))
+    writer.release()
+    return path.read_bytes()
+
+
+def analyze(client, data, **fields):
+    response = client.post("/api/v1/analyze", files={"video": ("clip.avi", data, "video/x-msvideo")},
+                           data={"object_str": "cat", "concurrency": 1, **fields})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_video_job_resumes_then_replays(api, tmp_path):
+    client, ollama, _ = api
+    data = write_video(tmp_path / "source.avi", seconds=4)
+    ollama.fail_calls = {2}
+
+    first = analyze(client, data)
+    assert [result["status"] for result in first] == ["success", "error", "success", "success"]
+    assert not list(Path("jobs").rglob("state.json"))
+
+    # Only the failed second is sent again, and the job is then complete
+    second = analyze(client, data)
+    assert len(ollama.chat_calls) == 5
+    assert sorted(result["frame"]["second"] for result in second) == [0, 1, 2, 3]
+    assert all(result["status"] == "success" for result in second)
+
+    replayed = analyze(client, data)
+    assert len(ollama.chat_calls) == 5
+    assert [result["frame"]["second"] for result in replayed] == [0, 1, 2, 3]
+
+    # Different output settings are a different job
+    analyze(client, data, max_side=32)
+    assert len(list(Path("jobs").rglob("state.json"))) == 2
+
+
+def test_inferred_results_are_stored(api, tmp_path):
+    client, ollama, _ = api
+    data = write_video(tmp_path / "still.avi", seconds=3, step=0)
+
+    first = analyze(client, data, skip_similar=True)
+    assert [result["frame"]["inferred"] for result in first] == [False, True, True]
+    # Replayed from the job, inferred seconds included
+    assert analyze(client, data, skip_similar=True) == first
+    assert len(ollama.chat_calls) == 1
+
+
+def test_frames_are_sent_as_encoded_for_the_request(api, tmp_path, monkeypatch):
+    client, ollama, instance = api
+    # The instance-wide optimizer (JPEG, 672px) must not touch these frames
+    monkeypatch.setattr(instance.payload_optimizer, "optimize", lambda data: pytest.fail("frame re-encoded"))
+
+    # Sizes differ so the second video's frames are not result-cache hits
+    for batch_size, (width, height) in ((1, (800, 600)), (2, (720, 560))):
+        data = write_video(tmp_path / f"large{batch_size}.avi", seconds=2, size=(width, height))
+        calls = len(ollama.chat_calls)
+        results = analyze(client, data, max_side=0, payload_format="webp", max_payload_bytes=400000,
+                          batch_size=batch_size)
+        # The batch reply does not parse, so its frames are then re-sent singly
+        sent = [base64.b64decode(image) for payload in ollama.chat_calls[calls:]
+                for image in payload["messages"][0]["images"]]
+        assert len(sent) == 2 * batch_size
+        for result, image in zip(results, sent):
+            assert image[:4] == b"RIFF" and image[8:12] == b"WEBP" and len(image) <= 400000
+            assert cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_COLOR).shape[:2] == (height, width)
+            report = result["frame"]["payload"]
+            assert report["format"] == "webp" and report["bytes"] == len(image) and report["width"] == width
+
+
+@pytest.mark.parametrize("field, value", [("max_side", -5), ("concurrency", 0), ("batch_size", 0),
+                                          ("max_payload_bytes", 0), ("sample_interval", -1)])
+def test_out_of_range_options_are_rejected(api, field, value):
+    client, ollama, _ = api
+    response = client.post("/api/v1/analyze", files={"video": ("clip.avi", b"data", "video/x-msvideo")},
+                           data={"object_str": "cat", field: value})
+    assert response.status_code == 400
+    assert field in response.json()["detail"]
+    assert ollama.calls == []
+
+
+def test_frames_are_encoded_once_and_not_saved(api, tmp_path, monkeypatch):
+    client, ollama, instance = api
+    encodes = []
+    encode = PayloadOptimizer.encode
+    monkeypatch.setattr(PayloadOptimizer, "encode",
+                        lambda self, *args, **kwargs: encodes.append(1) or encode(self, *args, **kwargs))
+    monkeypatch.setattr(PayloadOptimizer, "optimize", lambda self, data: pytest.fail("frame re-encoded"))
+    data = write_video(tmp_path / "source.avi", seconds=3)
+
+    results = analyze(client, data, save_frames=False)
+    assert len(results) == 3 and len(encodes) == 3
+    assert all(result["frame"]["frame_path"] is None for result in results)
+    assert not [path for path in Path("frames").rglob("*") if path.is_file()]
+
+
+def test_video_without_results_is_not_complete(api):
+    client, ollama, _ = api
+    assert analyze(client, b"not a video") == []
+    assert analyze(client, b"not a video") == []
+    assert not list(Path("jobs").rglob("state.json"))
+    assert ollama.calls == []
+
+
+def test_background_job_submit_status_and_stream(api, tmp_path):
+    client, ollama, _ = api
+    data = write_video(tmp_path / "source.avi", seconds=3)
+    files = {"video": ("clip.avi", data, "video/x-msvideo")}
+
+    submitted = client.post("/api/v1/jobs", files=files, data={"object_str": "cat"})
+    assert submitted.status_code == 202
+    job_id = submitted.json()["job_id"]
+
+    streamed = client.get(f"/api/v1/jobs/{job_id}/results", params={"stream": True})
+    assert sorted(json.loads(line)["frame"]["second"] for line in streamed.text.splitlines()) == [0, 1, 2]
+    status = client.get(f"/api/v1/jobs/{job_id}").json()
+    assert (status["status"], status["results"], status["filename"]) == ("complete", 3, "clip.avi")
+
+    # Once forgotten in memory, the job is answered from disk
+    api[2].job_queue.jobs.clear()
+    assert client.get(f"/api/v1/jobs/{job_id}").json() == {"job_id": job_id, "status": "complete", "results": 3}
+    assert len(client.get(f"/api/v1/jobs/{job_id}/results").json()["results"]) == 3
+
+
+def test_job_ids_are_validated(api):
+    client, _, _ = api
+    for job_id in ("..", "0" * 32, "%2E%2E", "ABC"):
+        assert client.get(f"/api/v1/jobs/{job_id}").status_code == 404
+    assert list(Path("jobs").iterdir()) == []
+
+
+def test_chunked_upload_complete_and_analyze(api, tmp_path):
+    client, ollama, _ = api
+    data = write_video(tmp_path / "source.avi", seconds=2)
+    upload = client.post("/api/v1/uploads", json={"filename": "clip.avi", "size": len(data)}).json()
+    url = f"/api/v1/uploads/{upload['upload_id']}"
+
+    half = len(data) // 2
+    assert client.put(url, params={"offset": 0}, content=data[:half]).json()["offset"] == half
+    # A part must start where the upload stands
+    assert client.put(url, params={"offset": 0}, content=data[half:]).status_code == 409
+    assert client.post(f"{url}/complete").status_code == 400
+    assert client.put(url, params={"offset": half}, content=data[half:]).json()["offset"] == len(data)
+
+    completed = client.post(f"{url}/complete").json()
+    assert completed["complete"] and completed["video_hash"]
+    assert client.get(url).json() == completed
+    # Unfinished uploads live outside the served and evicted uploads/ tree
+    assert not Path("uploads", "sessions").exists() and Path("upload_sessions").is_dir()
+
+    response = client.post(f"{url}/analyze", data={"object_str": "cat"})
+    assert [json.loads(line)["frame"]["second"] for line in response.text.splitlines()] == [0, 1]
+    assert len(ollama.chat_calls) == 2
+
+
+def test_upload_with_lost_data_is_gone(api):
+    client, _, instance = api
+    upload = client.post("/api/v1/uploads", json={"filename": "clip.avi"}).json()
+    url = f"/api/v1/uploads/{upload['upload_id']}"
+    assert client.put(url, params={"offset": 0}, content=b"x" * 5000).status_code == 200
+
+    instance.upload_sessions.get(upload["upload_id"]).part_path.unlink()
+    assert client.put(url, params={"offset": 5000}, content=b"y" * 10).status_code == 410
+    assert client.post(f"{url}/complete").status_code == 410
+
+
+def test_chat_session_carries_and_summarizes_history(api):
+    client, ollama, _ = api
+    created = client.post("/api/v1/chat/sessions", json={"system": "Be brief.", "max_tokens": 64, "summarize": True})
+    assert created.status_code == 201
+    url = f"/api/v1/chat/sessions/{created.json()['session_id']}"
+
+    first = client.post(f"{url}/messages", json={"prompt": "question one " * 6}).json()
+    assert first["data"]["message"]["content"] == "Hello there"
+    assert ollama.calls[0]["messages"][0] == {"role": "system", "content": "Be brief."}
+    assert ollama.calls[0]["options"] == {"num_predict": 16}
+
+    # The second prompt does not fit beside the first turn, which is summarized away
+    second = client.post(f"{url}/messages", json={"prompt": "question two " * 6}).json()
+    summary_call, turn_call = ollama.calls[1:]
+    assert "question one" in summary_call["messages"][-1]["content"]
+    assert turn_call["messages"][0]["content"] == "Be brief.\n\nSummary of the conversation so far:\nHello there"
+    assert [message["role"] for message in turn_call["messages"]] == ["system", "user"]
+    assert second["session"]["summary"] == "Hello there"
+    assert second["session"]["tokens"] <= 64
+
+    session = client.get(url).json()
+    assert [message["content"] for message in session["messages"]] == ["question two " * 6, "Hello there"]
+
+    assert client.delete(url).status_code == 200
+    assert client.get(url).status_code == 404
+    assert client.post(f"{url}/messages", json={"prompt": "Hi"}).status_code == 404
+
+
+def test_chat_session_stream_keeps_the_turn(api):
+    client, ollama, _ = api
+    created = client.post("/api/v1/chat/sessions", json={}).json()
+    url = f"/api/v1/chat/sessions/{created['session_id']}"
+
+    streamed = client.post(f"{url}/messages/stream", json={"prompt": "Hi"})
+    chunks = [json.loads(line) for line in streamed.text.splitlines()]
+    assert chunks[-1]["done"]
+    client.post(f"{url}/messages", json={"prompt": "Again"})
+
+    assert ollama.calls[1]["messages"][-3:] == [
+        {"role": "user", "content": "Hi"},
+        {"role": "assistant", "content": "Hello there "},
+        {"role": "user", "content": "Again"}
+    ]
+    assert client.get(url).json()["turns"] == 2
+
+
+def test_failed_summary_still_drops_turns(api):
+    client, ollama, _ = api
+    created = client.post("/api/v1/chat/sessions", json={"max_tokens": 64, "summarize": True}).json()
+    url = f"/api/v1/chat/sessions/{created['session_id']}"
+    client.post(f"{url}/messages", json={"prompt": "question one " * 6})
+    ollama.fail_calls = {2}
+
+    second = client.post(f"{url}/messages", json={"prompt": "question two " * 6})
+    assert second.status_code == 200
+    assert second.json()["session"]["summary"] is None
+    assert second.json()["session"]["turns"] == 2
+    assert [message["role"] for message in ollama.calls[2]["messages"]] == ["user"]
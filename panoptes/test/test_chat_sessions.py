@@ -0,0 +1,82 @@
+import os
+import time
+
+import pytest
+
+from chat_sessions import ChatSession, ChatSessionStore, estimate_tokens
+
+@pytest.fixture
+def store(tmp_path):
+    return ChatSessionStore(tmp_path / "chat", max_in_memory=2, ttl=3600)
+
+def test_history_carries_system_summary_and_turns():
+    session = ChatSession("a" * 32, system="Be brief.")
+    session.add_turn("Hi", "Hello!", reply_tokens=2)
+    session.set_summary("We met.")
+    history = session.history()
+    assert history[0] == {"role": "system", "content": "Be brief.\n\nSummary of the conversation so far:\nWe met."}
+    assert history[1:] == [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello!"}]
+    assert session.messages[1]["tokens"] == 2 + 4
+
+def test_compact_drops_whole_turns_to_the_low_watermark():
+    session = ChatSession("a" * 32, max_tokens=200)
+    for i in range(6):
+        session.add_turn(f"question {i} " * 8, f"answer {i} " * 8)
+    assert session.compact(estimate_tokens("next")) != []
+    assert session.tokens() + estimate_tokens("next") <= 100
+    assert session.messages[0]["role"] == "user"
+    assert session.messages[-1]["content"].startswith("answer 5")
+    # Room left again, so the next turn keeps the same prefix
+    assert session.compact(estimate_tokens("next")) == []
+
+def test_lru_spills_and_reloads(store):
+    first = store.create(system="one")
+    first.add_turn("a", "b")
+    store.create()
+    store.create()
+
+    assert store.stats()["in_memory"] == 2
+    assert (store.directory / f"{first.session_id}.json").exists()
+    reloaded = store.get(first.session_id)
+    assert reloaded is not first
+    assert reloaded.system == "one" and reloaded.history()[1:] == first.history()[1:]
+
+def test_acquired_sessions_are_not_evicted(store):
+    busy = store.acquire(store.create().session_id)
+    store.create()
+    store.create()
+    assert store.get(busy.session_id) is busy
+
+    store.release(busy)
+    store.create()
+    store.create()
+    assert store.get(busy.session_id) is not busy
+
+def test_flush_delete_and_stale(store):
+    session = store.create()
+    assert store.flush() == 1 and store.flush() == 0
+    assert ChatSessionStore(store.directory).get(session.session_id).session_id == session.session_id
+
+    assert store.delete(session.session_id)
+    assert not store.delete(session.session_id)
+    assert store.get("../etc/passwd") is None
+
+    old = store.create()
+    old.last_used = time.time() - 7200
+    spilled = store.create()
+    store.flush()
+    past = time.time() - 7200
+    os.utime(store.directory / f"{spilled.session_id}.json", (past, past))
+    store._sessions.pop(spilled.session_id)
+    store.create()
+    assert store.get(old.session_id) is None
+    assert store.get(spilled.session_id) is None
+
+def test_session_stays_within_budget_after_the_reply():
+    session = ChatSession("a" * 32, max_tokens=64)
+    for i in range(5):
+        prompt = f"question {i} " * 4
+        session.compact(estimate_tokens(prompt))
+        # Ollama stops the reply at num_predict, i.e. reply_tokens
+        session.add_turn(prompt, "word " * 40, reply_tokens=session.reply_tokens)
+        assert session.tokens() <= 64
@@ -0,0 +1,28 @@
+import asyncio
+
+from frame_batcher import FrameBatcher
+
+def test_full_batches_and_timed_tail():
+    batches = []
+
+    async def analyze_batch(items):
+        batches.append(items)
+        return [item * 10 for item in items]
+
+    async def main():
+        batcher = FrameBatcher(analyze_batch, batch_size=3, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+
+    assert asyncio.run(main()) == [i * 10 for i in range(7)]
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_batch_errors_reach_every_caller():
+    async def analyze_batch(items):
+        raise RuntimeError("model down")
+
+    async def main():
+        batcher = FrameBatcher(analyze_batch, batch_size=2)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
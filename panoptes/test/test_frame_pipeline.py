@@ -0,0 +1,97 @@
+import asyncio
+import random
+
+import pytest
+
+from frame_pipeline import FramePipeline
+
+def run_pipeline(pipeline):
+    async def collect():
+        return [result async for result in pipeline.run()]
+    return asyncio.run(collect())
+
+class Tracker:
+    """
+    Fake model call that records how many calls were in flight at once.
+    """
+    def __init__(self):
+        self.in_flight = 0
+        self.peak = 0
+
+    async def analyze(self, seq, item):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        await asyncio.sleep(random.uniform(0, 0.01))
+        self.in_flight -= 1
+        return seq, item
+
+def test_ordered_results_with_bounded_concurrency():
+    tracker = Tracker()
+    frames = ((i, f"frame-{i}") for i in range(40))
+
+    results = run_pipeline(FramePipeline(frames, tracker.analyze, concurrency=4))
+
+    assert results == [(i, f"frame-{i}") for i in range(40)]
+    assert 1 < tracker.peak <= 4
+
+def test_unordered_results_are_complete():
+    tracker = Tracker()
+    frames = ((i, i) for i in range(40))
+
+    results = run_pipeline(FramePipeline(frames, tracker.analyze, concurrency=8, ordered=False))
+
+    assert sorted(results) == [(i, i) for i in range(40)]
+
+def test_preprocess_can_drop_frames():
+    tracker = Tracker()
+    frames = ((i, i) for i in range(10))
+
+    def preprocess(seq, frame):
+        return None if seq % 2 else frame * 10
+
+    results = run_pipeline(FramePipeline(frames, tracker.analyze, preprocess=preprocess))
+
+    assert results == [(i, i * 10) for i in range(0, 10, 2)]
+
+def test_decoder_errors_propagate():
+    def frames():
+        yield 0, "ok"
+        raise RuntimeError("decode failed")
+
+    with pytest.raises(RuntimeError, match="decode failed"):
+        run_pipeline(FramePipeline(frames(), Tracker().analyze))
+
+class FakeFilter:
+    """
+    Treats frames as similar when they carry the same label.
+    """
+    def __init__(self):
+        self.reference = None
+
+    def is_similar(self, frame):
+        if frame == self.reference:
+            return True
+        self.reference = frame
+        return False
+
+def test_similar_frames_reuse_source_result():
+    tracker = Tracker()
+    labels = ["a", "a", "a", "b", "b", "a"]
+    frames = enumerate(labels)
+
+    pipeline = FramePipeline(
+        frames,
+        tracker.analyze,
+        frame_filter=FakeFilter(),
+        reuse=lambda seq, source_seq, result: ("reused", seq, source_seq, result)
+    )
+    results = run_pipeline(pipeline)
+
+    assert results == [
+        (0, "a"),
+        ("reused", 1, 0, (0, "a")),
+        ("reused", 2, 0, (0, "a")),
+        (3, "b"),
+        ("reused", 4, 3, (3, "b")),
+        (5, "a"),
+    ]
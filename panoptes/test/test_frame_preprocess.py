@@ -0,0 +1,38 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from frame_preprocess import FramePreprocessor
+
+def random_frame(height, width, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+def test_clahe_matches_split_merge_reference():
+    frame = random_frame(120, 160)
+    lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    l = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(l)
+    expected = cv2.cvtColor(cv2.merge((l, a, b)), cv2.COLOR_LAB2BGR)
+
+    result = FramePreprocessor(orient=False, max_side=None).apply(frame)
+
+    assert np.array_equal(result, expected)
+
+def test_orient_and_downscale_keep_aspect_ratio():
+    preprocessor = FramePreprocessor(max_side=100, clahe=False)
+
+    assert preprocessor.apply(random_frame(400, 200)).shape == (50, 100, 3)  # Portrait rotated
+    assert preprocessor.apply(random_frame(60, 80)).shape == (60, 80, 3)  # Never upscaled
+
+def test_batch_in_thread_pool_matches_sequential():
+    frames = [random_frame(240, 320, seed) for seed in range(8)]
+    preprocessor = FramePreprocessor(max_side=160, denoise=True)
+
+    sequential = [preprocessor.apply(frame).copy() for frame in frames]
+    with ThreadPoolExecutor(4) as executor:
+        batched = preprocessor.apply_batch(frames, executor)
+        encoded = preprocessor.encode_batch(frames, executor)
+
+    assert all(np.array_equal(a, b) for a, b in zip(sequential, batched))
+    assert all(cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR).shape == (120, 160, 3) for data in encoded)
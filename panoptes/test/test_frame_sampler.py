@@ -0,0 +1,51 @@
+import cv2
+import numpy as np
+import pytest
+
+from frame_filter import SceneChangeFilter
+from frame_sampler import FrameSampler
+
+def write_video(path, seconds, fps, size):
+    """
+    Writes a video whose frames encode their index in the pixel values.
+    """
+    width, height = size
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for i in range(seconds * fps):
+        writer.write(np.full((height, width, 3), i * 4 % 256, np.uint8))
+    writer.release()
+    return path
+
+@pytest.mark.parametrize("mode", ["grab", "seek"])
+def test_samples_one_frame_per_second(tmp_path, mode):
+    video_path = write_video(tmp_path / "clip.avi", seconds=5, fps=10, size=(64, 48))
+
+    samples = list(FrameSampler(video_path, mode=mode))
+
+    assert [second for second, _ in samples] == [0, 1, 2, 3, 4]
+    # Frame i was filled with i * 4, so second s should be close to s * 40
+    for second, frame in samples:
+        assert abs(int(frame.mean()) - second * 40) <= 4
+
+def test_sample_rate_and_portrait_rotation(tmp_path):
+    video_path = write_video(tmp_path / "portrait.avi", seconds=2, fps=10, size=(48, 64))
+
+    samples = list(FrameSampler(video_path, per_second=2))
+
+    assert [second for second, _ in samples] == [0, 0.5, 1, 1.5]
+    assert samples[0][1].shape[:2] == (48, 64)
+
+def test_rejects_unknown_mode(tmp_path):
+    with pytest.raises(ValueError):
+        FrameSampler(tmp_path / "clip.avi", mode="decode-all")
+
+def test_scene_change_filter():
+    scene_filter = SceneChangeFilter(threshold=0.03)
+    dark = np.zeros((48, 64, 3), np.uint8)
+    noisy_dark = dark + np.random.randint(0, 4, dark.shape, dtype=np.uint8)
+    bright = np.full((48, 64, 3), 200, np.uint8)
+
+    assert scene_filter.is_similar(dark) is False
+    assert scene_filter.is_similar(noisy_dark) is True
+    assert scene_filter.is_similar(bright) is False
+    assert scene_filter.is_similar(dark) is False
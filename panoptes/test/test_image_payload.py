@@ -0,0 +1,50 @@
+import cv2
+import numpy as np
+import pytest
+
+from image_payload import PayloadOptimizer
+
+def noisy_image(height, width):
+    return np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+def test_encode_shrinks_and_lowers_quality_to_fit_budget():
+    payload = PayloadOptimizer(max_side=320, max_bytes=15_000).encode(noisy_image(720, 1280))
+
+    assert len(payload.data) <= 15_000
+    assert (payload.width, payload.height) == (320, 180)
+    assert 40 <= payload.quality < 95
+    assert payload.original_bytes == 720 * 1280 * 3
+    assert cv2.imdecode(np.frombuffer(payload.data, np.uint8), cv2.IMREAD_COLOR).shape == (180, 320, 3)
+
+def test_encode_trades_resolution_when_quality_is_not_enough():
+    payload = PayloadOptimizer(max_side=320, max_bytes=4_000).encode(noisy_image(720, 1280))
+
+    assert len(payload.data) <= 4_000
+    assert payload.width < 320
+
+def test_encode_keeps_max_quality_when_within_budget():
+    payload = PayloadOptimizer(max_bytes=10_000_000).encode(noisy_image(100, 100))
+
+    assert payload.quality == 95
+    assert payload.to_dict()["original_bytes"] == 100 * 100 * 3
+
+def test_optimize_passes_small_images_through():
+    data = cv2.imencode(".jpg", noisy_image(64, 64))[1].tobytes()
+    optimizer = PayloadOptimizer(max_bytes=len(data))
+
+    assert optimizer.optimize(data).data is data
+    assert optimizer.optimize(b"not an image").image_format == "original"
+
+def test_optimize_reencodes_large_images_as_webp():
+    data = cv2.imencode(".png", noisy_image(600, 800))[1].tobytes()
+
+    payload = PayloadOptimizer(max_side=400, max_bytes=100_000, image_format="webp").optimize(data)
+
+    assert payload.image_format == "webp"
+    assert payload.data[8:12] == b"WEBP"
+    assert len(payload.data) <= 100_000
+    assert payload.original_bytes == len(data)
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        PayloadOptimizer(image_format="gif")
@@ -0,0 +1,50 @@
+import asyncio
+
+from job_queue import AnalysisJobQueue
+
+async def fake_job(count, fail_at=None, executor=None):
+    """
+    Stand-in for ChatAPI._run_video_job that yields 'count' results.
+    """
+    for second in range(count):
+        await asyncio.sleep(0.001)
+        yield {"status": "error" if second == fail_at else "success", "frame": {"second": second}}
+
+def test_jobs_run_in_background_and_can_be_followed():
+    async def scenario():
+        queue = AnalysisJobQueue(fake_job, workers=2)
+        first = queue.submit("first", 5)
+        second = queue.submit("second", 3, 1)
+
+        assert first.status == "queued"
+        # A job that is still active is not queued twice
+        assert queue.submit("first", 5) is first
+
+        followed = [result["frame"]["second"] async for result in first.follow()]
+        async for _ in second.follow():
+            pass
+        await queue.stop()
+        return first, second, followed
+
+    first, second, followed = asyncio.run(scenario())
+
+    assert followed == [0, 1, 2, 3, 4]
+    assert first.status == "complete"
+    assert second.status == "partial"
+    assert second.to_dict()["results"] == 3
+
+def test_only_recent_finished_jobs_are_kept():
+    async def scenario():
+        queue = AnalysisJobQueue(fake_job, workers=1, max_finished=2)
+        records = [queue.submit(f"job{i}", 2) for i in range(4)]
+        for record in records:
+            async for _ in record.follow():
+                pass
+        await asyncio.sleep(0)
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+
+    assert list(queue.jobs) == ["job2", "job3"]
+    assert queue.get("job0") is None
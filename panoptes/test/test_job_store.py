@@ -0,0 +1,33 @@
+from job_store import VideoJobStore
+
+def make_result(second):
+    return {"status": "success", "frame": {"second": second, "is_match": False}}
+
+def test_job_key_depends_on_content_object_and_interval():
+    key = VideoJobStore.job_key("hash", "cat", 1.0)
+
+    assert key == VideoJobStore.job_key("hash", " Cat ", 1.0)
+    assert key != VideoJobStore.job_key("other", "cat", 1.0)
+    assert key != VideoJobStore.job_key("hash", "dog", 1.0)
+    assert key != VideoJobStore.job_key("hash", "cat", 0.5)
+    with_settings = VideoJobStore.job_key("hash", "cat", 1.0, max_side=672, structured_output=True)
+    assert with_settings != key
+    assert with_settings == VideoJobStore.job_key("hash", "cat", 1.0, structured_output=True, max_side=672)
+    assert with_settings != VideoJobStore.job_key("hash", "cat", 1.0, max_side=320, structured_output=True)
+
+def test_results_survive_a_torn_write(tmp_path):
+    store = VideoJobStore(tmp_path)
+    job = store.get(VideoJobStore.job_key("hash", "cat", 1.0))
+    job.append(make_result(0))
+    job.append(make_result(1))
+    with open(job.results_path, "a") as f:
+        f.write('{"status": "succ')  # Process died mid-write
+
+    assert sorted(job.results()) == [0, 1]
+
+    job.append(make_result(2))
+    assert sorted(job.results()) == [0, 1, 2]
+    assert job.complete is False
+
+    job.mark_complete(video_hash="hash")
+    assert store.get(job.key).complete is True
@@ -0,0 +1,27 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+def test_import_writes_nothing(tmp_path):
+    env = {**os.environ, "PYTHONPATH": str(SRC_DIR)}
+    subprocess.run([sys.executable, "-c", "import main"], cwd=tmp_path, env=env, check=True)
+    assert list(tmp_path.iterdir()) == []
+
+def test_lifespan_builds_the_api(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import main
+    monkeypatch.setattr(main, "WARMUP", [])
+    monkeypatch.setattr(main, "OLLAMA_HOST", "http://127.0.0.1:9")
+
+    with TestClient(main.app) as client:
+        assert client.get("/api/v1/health/live").json() == {"status": "alive"}
+        assert {"uploads", "frames"} <= {route.name for route in main.app.routes}
+        assert main.app.state.api.warmup.models == []
+
+    for name in ("store", "uploads", "frames", "jobs", "thumbs", "upload_sessions", "chat_sessions"):
+        assert (tmp_path / name).is_dir()
@@ -0,0 +1,130 @@
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from media import MediaFileResponse, MediaFiles, ThumbnailCache
+
+def write_image(path, width=1280, height=720):
+    image = np.zeros((height, width, 3), np.uint8)
+    image[:, : width // 2] = 255
+    cv2.imwrite(str(path), image)
+    return path
+
+@pytest.fixture
+def media(tmp_path):
+    """
+    Pytest fixture for an app serving 'files' with a small thumbnail cache.
+    """
+    files = tmp_path / "files"
+    files.mkdir()
+    write_image(files / "big.jpg")
+    write_image(files / "small.jpg", width=200, height=100)
+    (files / "clip.avi").write_bytes(b"0123456789")
+    thumbnails = ThumbnailCache(tmp_path / "thumbs", widths=(160, 320))
+
+    app = FastAPI()
+    app.mount("/files", MediaFiles(directory=files, max_age=60, thumbnails=thumbnails), name="files")
+    return TestClient(app), thumbnails
+
+def test_cache_headers_etag_and_range(media):
+    client, _ = media
+    response = client.get("/files/clip.avi")
+    assert response.headers["cache-control"] == "public, max-age=60"
+    assert response.headers["accept-ranges"] == "bytes"
+
+    not_modified = client.get("/files/clip.avi", headers={"If-None-Match": response.headers["etag"]})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["cache-control"] == "public, max-age=60"
+
+    partial = client.get("/files/clip.avi", headers={"Range": "bytes=2-5"})
+    assert partial.status_code == 206
+    assert partial.content == b"2345"
+
+def test_thumbnail_is_resized_and_cached(media):
+    client, thumbnails = media
+    response = client.get("/files/big.jpg?w=300")
+    assert response.status_code == 200
+    image = cv2.imdecode(np.frombuffer(response.content, np.uint8), cv2.IMREAD_COLOR)
+    # Rounded up to the next allowed width, aspect ratio kept
+    assert image.shape[:2] == (180, 320)
+
+    assert client.get("/files/big.jpg?w=320").content == response.content
+    assert thumbnails.stats()["entries"] == 1
+
+def test_small_images_and_bad_requests(media):
+    client, thumbnails = media
+    original = client.get("/files/small.jpg").content
+    assert client.get("/files/small.jpg?w=320").content == original
+    assert thumbnails.stats()["entries"] == 0
+
+    assert client.get("/files/big.jpg?w=abc").status_code == 400
+    assert client.get("/files/clip.avi?w=160").status_code == 400
+    assert client.get("/files/missing.jpg?w=160").status_code == 404
+
+def test_evicts_least_recently_served(tmp_path):
+    sources = [write_image(tmp_path / f"{i}.jpg") for i in range(3)]
+    thumbnails = ThumbnailCache(tmp_path / "thumbs", widths=(160,))
+
+    async def thumbnail(path):
+        return await thumbnails.get(str(path), path.stat(), 160)
+
+    async def main():
+        first = await thumbnail(sources[0])
+        second = await thumbnail(sources[1])
+        thumbnails.max_bytes = thumbnails.total_bytes
+        await thumbnail(sources[0])  # Now more recent than the second
+        await thumbnail(sources[2])
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert (tmp_path / "thumbs" / first.split("/")[-1]).exists()
+    assert not (tmp_path / "thumbs" / second.split("/")[-1]).exists()
+    assert thumbnails.stats()["entries"] == 2
+
+    # The index is rebuilt from the files on disk
+    assert ThumbnailCache(tmp_path / "thumbs").stats()["entries"] == 2
+
+def test_small_sources_are_remembered_up_to_max_originals(tmp_path):
+    sources = [write_image(tmp_path / f"{i}.jpg", width=100, height=50) for i in range(3)]
+    thumbnails = ThumbnailCache(tmp_path / "thumbs", widths=(160,), max_originals=2)
+
+    async def main():
+        for path in (sources[0], sources[1], sources[0], sources[2]):
+            assert await thumbnails.get(str(path), path.stat(), 160) == str(path)
+
+    asyncio.run(main())
+    keys = [thumbnails.key(str(path), path.stat(), 160) for path in sources]
+    # The second was served least recently
+    assert list(thumbnails._originals) == [keys[0], keys[2]]
+    assert thumbnails.stats()["entries"] == 0
+
+def test_concurrent_requests_generate_once(tmp_path, monkeypatch):
+    source = write_image(tmp_path / "a.jpg")
+    thumbnails = ThumbnailCache(tmp_path / "thumbs")
+    calls = []
+    generate = thumbnails._generate
+    monkeypatch.setattr(thumbnails, "_generate", lambda *args: calls.append(args) or generate(*args))
+
+    async def main():
+        return await asyncio.gather(*(thumbnails.get(str(source), source.stat(), 320) for _ in range(5)))
+
+    assert len(set(asyncio.run(main()))) == 1
+    assert len(calls) == 1
+
+def test_pathsend_when_the_server_supports_it(tmp_path):
+    path = tmp_path / "a.bin"
+    path.write_bytes(b"abc")
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "headers": [], "extensions": {"http.response.pathsend": {}}}
+    response = MediaFileResponse(path, stat_result=path.stat())
+    asyncio.run(response(scope, None, send))
+    assert [m["type"] for m in messages] == ["http.response.start", "http.response.pathsend"]
+    assert messages[1]["path"] == str(path)
@@ -0,0 +1,57 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import (HTTP_REQUEST_SECONDS, STAGE_SECONDS, HTTPMetricsMiddleware, MetricsRegistry, recent_spans, span,
+                     timed_iter)
+
+def test_render_counter_and_histogram():
+    registry = MetricsRegistry()
+    requests = registry.counter("test_requests_total", "Requests.", ["path"])
+    latency = registry.histogram("test_latency_seconds", "Latency.", buckets=(0.1, 1))
+    requests.inc(path='/a"b')
+    requests.inc(2, path='/a"b')
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    assert registry.render() == (
+        "# HELP test_latency_seconds Latency.\n"
+        "# TYPE test_latency_seconds histogram\n"
+        'test_latency_seconds_bucket{le="0.1"} 1\n'
+        'test_latency_seconds_bucket{le="1"} 2\n'
+        'test_latency_seconds_bucket{le="+Inf"} 2\n'
+        "test_latency_seconds_sum 0.55\n"
+        "test_latency_seconds_count 2\n"
+        "# HELP test_requests_total Requests.\n"
+        "# TYPE test_requests_total counter\n"
+        'test_requests_total{path="/a\\"b"} 3\n'
+    )
+    assert registry.counter("test_requests_total", "Requests.", ["path"]) is requests
+    with pytest.raises(ValueError):
+        requests.inc(method="GET")
+
+def test_spans_and_timed_iter_record_stages():
+    before = STAGE_SECONDS.count(stage="test_decode")
+
+    with span("test_parse", second=3):
+        pass
+    assert list(timed_iter(iter([1, 2, 3]), "test_decode")) == [1, 2, 3]
+
+    assert STAGE_SECONDS.count(stage="test_decode") == before + 3
+    assert recent_spans(1, stage="test_parse")[0]["second"] == 3
+
+def test_http_middleware_labels_route_template():
+    app = FastAPI()
+    app.add_middleware(HTTPMetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    def read_item(item_id: int):
+        return {"id": item_id}
+
+    client = TestClient(app)
+    client.get("/items/1")
+    client.get("/items/2")
+    client.get("/missing")
+
+    assert HTTP_REQUEST_SECONDS.count(method="GET", endpoint="/items/{item_id}", status="200") == 2
+    assert HTTP_REQUEST_SECONDS.count(method="GET", endpoint="unmatched", status="404") == 1
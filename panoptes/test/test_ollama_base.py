@@ -0,0 +1,193 @@
+import asyncio
+import base64
+import json
+
+import httpx
+
+from ollama_base import ANALYSIS_ERROR, OllamaBase, analysis_prompt, parse_batch_analysis, parse_structured_batch
+
+def make_base(handler, **kwargs):
+    """
+    Builds an OllamaBase whose pooled client talks to an in-process handler.
+    """
+    return OllamaBase(
+        ollama_host="http://ollama.test",
+        api_key="TEST_API_KEY",
+        transport=httpx.MockTransport(handler),
+        backoff=0,
+        **kwargs
+    )
+
+def test_chat_retries_then_succeeds():
+    calls = []
+
+    def handler(request):
+        calls.append(json.loads(request.content))
+        if len(calls) < 3:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"message": {"content": "hi"}})
+
+    base = make_base(handler, retries=3)
+    response = asyncio.run(base._call_ollama_chat("Hello", images=[b"IMG"]))
+
+    assert response == {"message": {"content": "hi"}}
+    assert len(calls) == 3
+    assert calls[0]["model"] == "llama3.2"
+    assert calls[0]["messages"][0]["images"] == [base64.b64encode(b"IMG").decode("utf-8")]
+
+def test_analyze_image_parses_structured_answer(tmp_path):
+    image_path = tmp_path / "frame.jpg"
+    image_path.write_bytes(b"FAKE_IMAGE_DATA")
+
+    def handler(request):
+        payload = json.loads(request.content)
+        assert payload["messages"][0]["images"] == [base64.b64encode(b"FAKE_IMAGE_DATA").decode("utf-8")]
+        content = "Answer: YES\nDescription: A cat on a sofa\nConfidence: 8"
+        return httpx.Response(200, json={"message": {"content": content}})
+
+    base = make_base(handler)
+    result = asyncio.run(base.analyze_image(str(image_path), "cat"))
+
+    assert result == (True, "A cat on a sofa", 8)
+
+def test_parse_batch_analysis_splits_blocks():
+    text = (
+        "**Image 1:**\nAnswer: YES\nDescription: A cat\nConfidence: 9\n\n"
+        "Image 3:\nAnswer: NO\nDescription: A chair\nConfidence: 6"
+    )
+
+    assert parse_batch_analysis(text, 3) == [
+        ("YES", "A cat", 9),
+        (None, None, 10),
+        ("NO", "A chair", 6)
+    ]
+
+def test_analyze_images_batch_reasks_missing_blocks():
+    requests = []
+
+    def handler(request):
+        images = json.loads(request.content)["messages"][0]["images"]
+        requests.append(len(images))
+        if len(images) > 1:
+            content = "Image 1:\nAnswer: YES\nDescription: A cat\nConfidence: 8"
+        else:
+            content = "Answer: NO\nDescription: A dog\nConfidence: 7"
+        return httpx.Response(200, json={"message": {"content": content}})
+
+    base = make_base(handler)
+    results = asyncio.run(base.analyze_images_batch([b"ONE", b"TWO"], "cat"))
+
+    assert results == [(True, "A cat", 8), (False, "A dog", 7)]
+    assert requests == [2, 1]
+
+class ChunkStream(httpx.AsyncByteStream):
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield (json.dumps(chunk) + "\n").encode("utf-8")
+
+    async def aclose(self):
+        self.closed = True
+
+def test_chat_stream_yields_chunks_and_closes_upstream_early():
+    streams = []
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        stream = ChunkStream([{"message": {"content": word}, "done": False} for word in "a b c".split()])
+        streams.append(stream)
+        return httpx.Response(200, stream=stream)
+
+    base = make_base(handler)
+
+    async def collect(limit=None):
+        chunks = base._call_ollama_chat_stream("Hello")
+        received = []
+        async for chunk in chunks:
+            received.append(chunk["message"]["content"])
+            if len(received) == limit:
+                break
+        await chunks.aclose()
+        return received
+
+    assert asyncio.run(collect()) == ["a", "b", "c"]
+    assert asyncio.run(collect(limit=1)) == ["a"]
+    assert streams[1].closed
+
+def test_structured_analysis_reasks_until_valid():
+    replies = [
+        '{"answer": "maybe", "description": "?", "confidence": 5}',
+        'Sorry, I cannot help with that.',
+        '{"answer": "yes", "description": "A cat", "confidence": 8}'
+    ]
+    formats = []
+
+    def handler(request):
+        formats.append(json.loads(request.content)["format"])
+        return httpx.Response(200, json={"message": {"content": replies[len(formats) - 1]}})
+
+    base = make_base(handler, parse_retries=2)
+    result = asyncio.run(base.analyze_image(b"IMG", "cat", structured=True))
+
+    assert result == (True, "A cat", 8)
+    assert len(formats) == 3
+    assert formats[0]["required"] == ["answer", "description", "confidence"]
+
+def test_structured_analysis_gives_up_after_retries():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"message": {"content": '{"answer": "YES", "confidence": 11}'}})
+
+    base = make_base(handler, parse_retries=1)
+    assert asyncio.run(base.analyze_image(b"IMG", "cat", structured=True)) == (False, ANALYSIS_ERROR, 0)
+    assert len(calls) == 2
+
+def test_parse_structured_batch_validates_each_entry():
+    text = '```json\n{"images": [{"answer": "NO", "description": "A chair", "confidence": 6}, {"answer": "YES"}]}\n```'
+
+    assert parse_structured_batch(text, 3) == [("NO", "A chair", 6), (None, None, 0), (None, None, 0)]
+
+def test_keep_alive_is_sent_with_model_calls():
+    payloads = []
+
+    def handler(request):
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, json={"message": {"content": "hi"}})
+
+    asyncio.run(make_base(handler, keep_alive="-1")._call_ollama_chat("Hello"))
+    asyncio.run(make_base(handler, keep_alive="30m")._call_image_analysis("Describe", image_bytes=b"IMG"))
+    asyncio.run(make_base(handler, keep_alive=None)._call_ollama_chat("Hello"))
+
+    # A numeric string is sent as seconds, a duration as it is
+    assert [payload.get("keep_alive") for payload in payloads] == [-1, "30m", None]
+
+def test_chat_history_and_session_keep_alive():
+    payloads = []
+
+    def handler(request):
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, json={"message": {"content": "hi"}})
+
+    history = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+    base = make_base(handler, keep_alive="30m")
+    asyncio.run(base._call_ollama_chat("Again", history=history, keep_alive=600, num_predict=16))
+
+    assert payloads[0]["messages"] == history + [{"role": "user", "content": "Again"}]
+    assert payloads[0]["keep_alive"] == 600
+    assert payloads[0]["options"] == {"num_predict": 16}
+
+
+def test_analysis_prompt_variants_share_the_questions():
+    questions = "1. Is there a cat in the image?"
+    single, batch = analysis_prompt("cat"), analysis_prompt("cat", 3)
+    structured, structured_batch = analysis_prompt("cat", structured=True), analysis_prompt("cat", 3, True)
+    assert all(questions in prompt for prompt in (single, batch, structured, structured_batch))
+    assert "Answer: [YES/NO]" in single and "Image 2:" in batch
+    assert "JSON" in structured and '"images" array' in structured_batch
+    assert "You are given 3 images" in batch and "You are given 3 images" in structured_batch
+    assert "JSON" not in single and "images" not in structured
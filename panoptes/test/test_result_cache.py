@@ -0,0 +1,41 @@
+import pytest
+
+from result_cache import ResultCache
+
+@pytest.fixture
+def cache(tmp_path):
+    """
+    Pytest fixture to create a small ResultCache that prunes on every write.
+    """
+    result_cache = ResultCache(str(tmp_path / "result_cache.db"), max_entries=3, max_bytes=10_000, ttl=60)
+    result_cache.prune_interval = 1
+    yield result_cache
+    result_cache.close()
+
+def test_hit_and_miss_counters(cache):
+    assert cache.get("hash", "Describe", "llava:latest") is None
+    cache.put("hash", "Describe", "llava:latest", [True, "A cat", 9])
+
+    assert cache.get("hash", "Describe", "llava:latest") == [True, "A cat", 9]
+    # Prompt and model are part of the key
+    assert cache.get("hash", "Count the cats", "llava:latest") is None
+    assert cache.get("hash", "Describe", "llama3.2-vision") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 1)
+
+def test_evicts_least_recently_used(cache):
+    for name in ("a", "b", "c"):
+        cache.put(name, "p", "m", name)
+    cache.get("a", "p", "m")  # 'a' is now more recent than 'b'
+    cache.put("d", "p", "m", "d")
+
+    assert cache.get("b", "p", "m") is None
+    assert [cache.get(name, "p", "m") for name in ("a", "c", "d")] == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+
+def test_expired_entries_are_misses(cache):
+    cache.put("hash", "p", "m", "old")
+    cache.ttl = -1
+
+    assert cache.get("hash", "p", "m") is None
@@ -0,0 +1,114 @@
+import os
+import time
+
+import pytest
+
+from job_store import VideoJobStore
+from storage import StorageManager, remove_temp_files, shard_path
+from upload_store import UploadStore
+
+@pytest.fixture
+def storage(tmp_path):
+    """
+    Pytest fixture for a StorageManager over empty directories, with no
+    minimum age so fresh files can be evicted.
+    """
+    upload_store = UploadStore(str(tmp_path / "upload_index.db"))
+    manager = StorageManager(
+        upload_store, tmp_path / "store", tmp_path / "uploads", tmp_path / "frames", tmp_path / "jobs",
+        quotas={"store": 100, "uploads": 100, "frames": 100}, ttl=3600, min_age=0
+    )
+    for root in [*manager.roots.values(), manager.jobs_dir]:
+        root.mkdir()
+    yield manager
+    upload_store.close()
+
+def write(path, size, age=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+def store_file(storage, file_hash, size, age):
+    stored_filename = shard_path(f"{file_hash}.jpg")
+    write(storage.roots["store"] / stored_filename, size)
+    storage.upload_store.add({"hash": file_hash, "stored_filename": stored_filename, "created_at": time.time() - age})
+    return storage.roots["store"] / stored_filename
+
+def test_shard_path():
+    assert shard_path("3fa2c1.jpg") == "3f/a2/3fa2c1.jpg"
+    assert shard_path("3fa2c1.jpg", levels=1) == "3f/3fa2c1.jpg"
+
+def test_store_eviction_follows_the_index(storage):
+    oldest = store_file(storage, "aa11", 40, age=30)
+    touched = store_file(storage, "bb22", 40, age=20)
+    newest = store_file(storage, "cc33", 40, age=10)
+    storage.upload_store.touch("bb22")
+
+    stats = storage.sweep()["store"]
+    # Over the 100 byte quota: trimmed to 90 by evicting the least recently used
+    assert stats["evicted"] == {"ttl": 0, "quota": 1}
+    assert not oldest.exists() and touched.exists() and newest.exists()
+    assert storage.upload_store.get("aa11") is None
+    # The now empty shard directories are gone too
+    assert not oldest.parent.exists()
+
+def test_orphans_and_missing_files(storage):
+    orphan = write(storage.roots["store"] / "orphan.jpg", 10)
+    missing = store_file(storage, "dd44", 10, age=0)
+    missing.unlink()
+
+    storage.sweep()
+    assert not orphan.exists()
+    assert storage.upload_store.get("dd44") is None
+
+def test_ttl_and_frame_directories(storage):
+    storage.ttl = 60
+    old_video = write(storage.roots["uploads"] / "old.avi", 10, age=120)
+    new_video = write(storage.roots["uploads"] / "new.avi", 10)
+    old_job = storage.roots["frames"] / shard_path("abcd1234")
+    write(old_job / "frame_0.jpg", 30, age=120)
+    write(old_job / "frame_1.jpg", 30, age=120)
+    new_job = storage.roots["frames"] / "legacykey"
+    write(new_job / "frame_0.jpg", 30)
+
+    stats = storage.sweep()
+    assert not old_video.exists() and new_video.exists()
+    assert not old_job.exists() and new_job.exists()
+    assert stats["frames"]["evicted"]["ttl"] == 1
+    assert stats["frames"]["bytes"] == 30
+
+def test_jobs_are_evicted_with_their_frames(storage):
+    jobs = VideoJobStore(storage.jobs_dir)
+    old_key, new_key, bare_key = "ab" * 16, "cd" * 16, "ef" * 16
+    for key in (old_key, new_key, bare_key):
+        jobs.get(key).append({"frame": {"second": 0}})
+    write(storage.roots["frames"] / shard_path(old_key) / "frame_0.jpg", 30, age=7200)
+    write(storage.roots["frames"] / shard_path(new_key) / "frame_0.jpg", 30)
+    # A job that saved no previews still ages out
+    old_job, bare_job = jobs.get(old_key), jobs.get(bare_key)
+    for path in (old_job.results_path, old_job.dir, bare_job.results_path, bare_job.dir):
+        os.utime(path, (time.time() - 7200,) * 2)
+
+    stats = storage.sweep()
+    assert not (storage.roots["frames"] / shard_path(old_key)).exists()
+    assert not old_job.dir.exists() and not bare_job.dir.exists()
+    assert (storage.jobs_dir / new_key).is_dir()
+    assert stats["frames"]["evicted"]["ttl"] == 2
+    # An evicted job starts over rather than writing into a missing directory
+    assert jobs.get(old_key) is not old_job and jobs.get(old_key).results() == {}
+
+def test_recently_used_files_are_kept(storage):
+    storage.min_age = 60
+    video = write(storage.roots["uploads"] / "big.avi", 500)
+    assert storage.sweep()["uploads"]["evicted"] == {"ttl": 0, "quota": 0}
+    assert video.exists()
+
+def test_remove_temp_files(tmp_path):
+    old = write(tmp_path / "temp_old.jpg", 1, age=120)
+    new = write(tmp_path / "temp_new.jpg", 1)
+    kept = write(tmp_path / "stored.jpg", 1, age=120)
+
+    assert remove_temp_files([tmp_path, tmp_path / "missing"], older_than=60) == 1
+    assert not old.exists() and new.exists() and kept.exists()
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from upload_sessions import GrowingFileSampler, UploadSessionStore
+
+def write_video(path, seconds, fps=10, size=(64, 48)):
+    width, height = size
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for i in range(seconds * fps):
+        writer.write(np.full((height, width, 3), i * 4 % 256, np.uint8))
+    writer.release()
+    return path.read_bytes()
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadSessionStore(tmp_path / "sessions", ttl=3600)
+
+def append(session, data):
+    with session.open_for_append() as f:
+        session.append(f, data)
+
+def test_offset_resume_and_finish(store, tmp_path):
+    session = store.create("clip.avi", size=10)
+    append(session, b"01234")
+    session.save()
+
+    # A restart keeps the data received so far
+    resumed = UploadSessionStore(store.directory).get(session.upload_id)
+    assert resumed.offset == 5
+    assert resumed.to_dict()["filename"] == "clip.avi"
+    append(resumed, b"56789")
+    assert resumed.hexdigest() == hashlib.blake2b(b"0123456789").hexdigest()
+
+    video_path = tmp_path / "clip.avi"
+    os.replace(resumed.part_path, video_path)
+    resumed.finish(video_path, "abcd")
+    assert resumed.complete and resumed.path == video_path
+    assert UploadSessionStore(store.directory).get(session.upload_id).video_hash == "abcd"
+
+def test_unknown_and_malformed_ids(store):
+    assert store.get("0" * 32) is None
+    assert store.get("../etc/passwd") is None
+
+def test_remove_stale(store):
+    old = store.create("old.avi")
+    append(old, b"x")
+    past = time.time() - 7200
+    for path in (old.part_path, old.meta_path):
+        os.utime(path, (past, past))
+    new = store.create("new.avi")
+
+    assert store.get(old.upload_id) is None
+    assert not old.part_path.exists()
+    assert store.get(new.upload_id) is new
+
+def test_samples_while_the_upload_arrives(store, tmp_path):
+    data = write_video(tmp_path / "source.avi", seconds=6)
+    session = store.create("clip.avi", size=len(data))
+    sampler = GrowingFileSampler(session, min_bytes=len(data) // 4, every_seconds=1.0)
+    sampler.poll_interval = 0.05
+    seen_at = []
+
+    def consume():
+        for second, frame in sampler:
+            seen_at.append((second, session.offset))
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    with session.open_for_append() as f:
+        for start in range(0, len(data), len(data) // 8):
+            session.append(f, data[start:start + len(data) // 8])
+            time.sleep(0.1)
+    video_path = tmp_path / "clip.avi"
+    os.replace(session.part_path, video_path)
+    session.finish(video_path, "abcd")
+    consumer.join(timeout=10)
+
+    # Every second exactly once, and the first before the upload finished
+    assert [second for second, _ in seen_at] == [0, 1, 2, 3, 4, 5]
+    assert seen_at[0][1] < len(data)
+
+def test_close_and_stall(store):
+    session = store.create("clip.avi")
+    sampler = GrowingFileSampler(session, min_bytes=100, stall_timeout=10)
+    sampler.poll_interval = 0.01
+    sampler.close()
+    assert list(sampler) == []
+
+    stalled = GrowingFileSampler(session, min_bytes=100, stall_timeout=0.05)
+    stalled.poll_interval = 0.01
+    with pytest.raises(TimeoutError):
+        list(stalled)
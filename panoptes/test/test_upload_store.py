@@ -0,0 +1,79 @@
+import json
+import threading
+
+import pytest
+
+from upload_store import UploadStore
+
+@pytest.fixture
+def store(tmp_path):
+    """
+    Pytest fixture to create an UploadStore backed by a temporary database.
+    """
+    upload_store = UploadStore(str(tmp_path / "upload_index.db"))
+    yield upload_store
+    upload_store.close()
+
+def make_entry(file_hash, stored_filename="stored.jpg"):
+    return {
+        "original_filename": "cat.jpg",
+        "file_type": "image/jpeg",
+        "hash": file_hash,
+        "stored_filename": stored_filename,
+    }
+
+def test_add_and_get(store):
+    entry, created = store.add(make_entry("abc"))
+
+    assert created is True
+    assert entry == make_entry("abc")
+    assert store.get("abc") == make_entry("abc")
+    assert store.get("missing") is None
+
+def test_add_duplicate_returns_existing(store):
+    store.add(make_entry("abc", "first.jpg"))
+    entry, created = store.add(make_entry("abc", "second.jpg"))
+
+    assert created is False
+    assert entry["stored_filename"] == "first.jpg"
+    assert store.count() == 1
+
+def test_concurrent_adds_index_once(store):
+    """
+    Concurrent uploads of the same content must produce exactly one winner.
+    """
+    results = []
+
+    def worker(i):
+        results.append(store.add(make_entry("same", f"{i}.jpg")))
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    winners = [entry for entry, created in results if created]
+    assert len(winners) == 1
+    assert all(entry == winners[0] for entry, _ in results)
+
+def test_migrate_json_log(store, tmp_path):
+    log_file = tmp_path / "upload_log.json"
+    log_file.write_text(json.dumps([make_entry("a", "a.jpg"), make_entry("b", "b.jpg")]))
+
+    assert store.migrate_json_log(str(log_file)) == 2
+    assert store.get("b")["stored_filename"] == "b.jpg"
+    assert not log_file.exists()
+    assert (tmp_path / "upload_log.json.migrated").exists()
+
+    # A second run is a no-op once the legacy log has been moved aside
+    assert store.migrate_json_log(str(log_file)) == 0
+
+def test_usage_orders_by_last_use(store):
+    store.add({**make_entry("old"), "created_at": 1.0})
+    store.add({**make_entry("new"), "created_at": 2.0})
+    store.touch("old")
+
+    assert [row[0] for row in store.usage()] == ["new", "old"]
+    # accessed_at is internal, like created_at
+    assert store.get("old") == make_entry("old")
@@ -0,0 +1,27 @@
+import hashlib
+
+from util import HashingWriter, LazyModule, compute_file_hash
+
+def test_hashing_writer_matches_reread(tmp_path):
+    """
+    Digests computed while writing must match hashing the file afterwards.
+    """
+    file_path = tmp_path / "upload.bin"
+    chunks = [b"a" * 1024, b"b" * 4096, b"", b"tail"]
+
+    with HashingWriter(str(file_path)) as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+
+    content = b"".join(chunks)
+    assert file_path.read_bytes() == content
+    assert writer.size == len(content)
+    assert writer.hexdigest("md5") == compute_file_hash(str(file_path))
+    assert writer.hexdigest("blake2b") == hashlib.blake2b(content).hexdigest()
+
+def test_lazy_module_imports_on_first_use():
+    lazy_json = LazyModule("json")
+    assert "dumps" not in vars(lazy_json)
+    assert lazy_json.dumps({"a": 1}) == '{"a": 1}'
+    # Cached on the stand-in after the first lookup
+    assert "dumps" in vars(lazy_json)
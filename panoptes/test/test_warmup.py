@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+import httpx
+
+from backend_pool import BackendPool
+from warmup import ModelWarmup
+
+def make_warmup(handler, hosts="http://a.test", **kwargs):
+    backends = BackendPool(hosts, transport=httpx.MockTransport(handler))
+    return ModelWarmup(backends, modules=("json",), retry_interval=0, refresh_interval=0, **kwargs)
+
+async def run_until_ready(warmup, timeout=5.0):
+    warmup.start()
+    try:
+        for _ in range(int(timeout / 0.01)):
+            if warmup.ready:
+                break
+            await asyncio.sleep(0.01)
+    finally:
+        await warmup.stop()
+
+def test_loads_every_model_with_keep_alive():
+    calls = []
+
+    def handler(request):
+        calls.append((request.url.host, request.url.path, json.loads(request.content)))
+        return httpx.Response(200, json={"done": True, "done_reason": "load"})
+
+    warmup = make_warmup(handler, hosts="http://a.test,http://b.test", models=["llava:latest", "llama3.2"],
+                         keep_alive="-1")
+    assert not warmup.ready
+    asyncio.run(run_until_ready(warmup))
+
+    status = warmup.status()
+    assert status["ready"] and status["modules_loaded"]
+    assert status["models"]["llava:latest"]["loaded_on"] == ["http://a.test", "http://b.test"]
+    assert len(calls) == 4
+    assert all(path == "/api/generate" and payload["keep_alive"] == -1 for _, path, payload in calls)
+
+def test_retries_until_the_model_loads():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        return httpx.Response(500 if len(attempts) < 3 else 200, json={})
+
+    warmup = make_warmup(handler, models=["llava:latest"])
+    asyncio.run(run_until_ready(warmup))
+
+    assert warmup.ready
+    assert len(attempts) == 3
+    assert warmup.status()["models"]["llava:latest"]["error"] is None
+
+def test_ready_without_models():
+    warmup = make_warmup(lambda request: httpx.Response(500), models=[])
+    asyncio.run(run_until_ready(warmup))
+    assert warmup.ready